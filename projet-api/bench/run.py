@@ -0,0 +1,186 @@
+"""
+Benchmark des endpoints de lecture, app FastAPI réelle appelée en mémoire (ASGI,
+pas de réseau ni d'uvicorn) sur une base remplie par bench.seed :
+
+    python -m bench.run --requests 300 --concurrency 10
+    python -m bench.run --save-baseline            # enregistre la référence
+    python -m bench.run --tolerance 0.2            # compare à la référence, code 1 si régression
+
+Pour chaque endpoint : p50 / p95 / p99 (ms) et nb moyen de requêtes SQL par
+appel (lu dans le header Server-Timing posé par main.py).
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from pathlib import Path
+
+import httpx
+
+import database
+import models
+import password
+
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+# nom -> fonction (rng, user_id, max_user_id) -> chemin
+SCENARIOS = {
+    "get_feed": lambda rng, uid, n: "/posts/feed?limit=20",
+    "get_discovery_feed": lambda rng, uid, n: "/feed/discovery",
+    "get_stories_feed": lambda rng, uid, n: "/stories/feed",
+    "get_my_conversations": lambda rng, uid, n: "/messages/conversations",
+    "get_my_notifications": lambda rng, uid, n: "/notifications",
+    "get_my_badges": lambda rng, uid, n: "/me/badges",
+    "get_user_by_id": lambda rng, uid, n: f"/users/{rng.randint(1, n)}",
+    "search_users": lambda rng, uid, n: f"/search/users?query=bench{rng.randint(1, 99)}",
+    "get_posts_by_user": lambda rng, uid, n: f"/posts/user/{rng.randint(1, n)}",
+    "get_posts_on_map": lambda rng, uid, n: (
+        "/map/posts?min_lat=35&max_lat=60&min_lng=-10&max_lng=30&scope=all&zoom=5"
+    ),
+}
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Rang le plus proche (pas d'interpolation)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples: list[tuple[float, int, int]]) -> dict:
+    """samples : [(durée en s, status, nb requêtes SQL), ...]"""
+    durations = sorted(d * 1000 for d, _, _ in samples)
+    ok = [s for s in samples if s[1] < 400]
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "p50_ms": round(percentile(durations, 50), 2),
+        "p95_ms": round(percentile(durations, 95), 2),
+        "p99_ms": round(percentile(durations, 99), 2),
+        "queries_per_request": round(sum(q for _, _, q in ok) / len(ok), 1) if ok else 0.0,
+    }
+
+
+async def run_scenario(client, name: str, tokens: dict, requests: int, concurrency: int, warmup: int, seed: int) -> dict:
+    rng = random.Random(f"{seed}:{name}")
+    user_ids = list(tokens)
+    max_user_id = max(user_ids)
+    plan = []  # tiré à l'avance : même seed => mêmes appels
+    for _ in range(warmup + requests):
+        uid = rng.choice(user_ids)
+        plan.append((uid, SCENARIOS[name](rng, uid, max_user_id)))
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int, uid: int, path: str):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get(path, headers={"Authorization": f"Bearer {tokens[uid]}"})
+            elapsed = time.perf_counter() - start
+        if index < warmup:
+            return
+        match = QUERIES_RE.search(response.headers.get("server-timing", ""))
+        samples.append((elapsed, response.status_code, int(match.group(1)) if match else 0))
+
+    # Warmup d'abord (caches, pools), puis les requêtes mesurées
+    await asyncio.gather(*(one(i, uid, path) for i, (uid, path) in enumerate(plan[:warmup])))
+    await asyncio.gather(*(one(warmup + i, uid, path) for i, (uid, path) in enumerate(plan[warmup:])))
+    return summarize(samples)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Régressions : p95 / p99 au-delà de la tolérance, ou plus de requêtes SQL qu'avant."""
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if current[key] > reference[key] * (1 + tolerance):
+                regressions.append(f"{name} {key} : {reference[key]} -> {current[key]}")
+        if current["queries_per_request"] > reference["queries_per_request"]:
+            regressions.append(
+                f"{name} requêtes SQL : {reference['queries_per_request']} -> {current['queries_per_request']}"
+            )
+        if current["errors"] > reference["errors"]:
+            regressions.append(f"{name} erreurs : {reference['errors']} -> {current['errors']}")
+    return regressions
+
+
+def print_report(results: dict, baseline: dict):
+    print(f"{'endpoint':<24} {'n':>5} {'err':>4} {'p50':>9} {'p95':>9} {'p99':>9} {'sql/req':>8}  {'p95 réf':>9}")
+    for name, r in results.items():
+        reference = baseline.get(name, {}).get("p95_ms")
+        print(
+            f"{name:<24} {r['requests']:>5} {r['errors']:>4} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+            f"{r['p99_ms']:>9.1f} {r['queries_per_request']:>8.1f}  {reference if reference is not None else '-':>9}"
+        )
+
+
+def bench_tokens(users: int, seed: int) -> dict:
+    """Jetons pour un échantillon d'utilisateurs générés par bench.seed."""
+    db = database.SessionLocal()
+    try:
+        rows = db.query(models.User.user_id, models.User.username).filter(
+            models.User.email.like("bench%@spotshare.test")
+        ).all()
+    finally:
+        db.close()
+    if not rows:
+        raise SystemExit("Aucun utilisateur de bench : lancer d'abord python -m bench.seed")
+
+    sample = random.Random(seed).sample(rows, min(users, len(rows)))
+    return {
+        user_id: password.create_access_token({"sub": str(user_id), "username": username})
+        for user_id, username in sample
+    }
+
+
+async def run(args) -> int:
+    import main as app_module  # après la config (DATABASE_URL...) : importe tous les routers
+
+    names = args.only or list(SCENARIOS)
+    tokens = bench_tokens(args.users, args.seed)
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+
+    # Une erreur 500 compte comme une erreur du bench, elle ne l'interrompt pas
+    transport = httpx.ASGITransport(app=app_module.app, raise_app_exceptions=False)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name in names:
+            results[name] = await run_scenario(
+                client, name, tokens, args.requests, args.concurrency, args.warmup, args.seed
+            )
+
+    print_report(results, baseline)
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+        print(f"✔️ Référence enregistrée dans {args.baseline}")
+        return 0
+
+    if not baseline:
+        print("ℹ️ Pas de référence : relancer avec --save-baseline pour en créer une")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"⚠️ Régression {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark in-process des endpoints de lecture")
+    parser.add_argument("--requests", type=int, default=200, help="requêtes mesurées par endpoint")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--users", type=int, default=200, help="nb d'utilisateurs simulés")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="*", choices=list(SCENARIOS), help="sous-ensemble d'endpoints")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="marge sur p95/p99 (0.2 = +20%%)")
+    raise SystemExit(asyncio.run(run(parser.parse_args())))
@@ -0,0 +1,268 @@
+"""
+Génère un réseau social synthétique pour les benchmarks (base dédiée !) :
+
+    python -m bench.seed --users 5000 --seed 42 --reset
+
+Graphe en loi de puissance : quelques comptes très suivis, beaucoup de petits
+comptes. Même --seed => mêmes données, donc des benchmarks comparables.
+Les tables dérivées (post_stats, user_stats, timelines, map_feed, conversations) sont reconstruites à la fin.
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import text
+
+import database
+import models
+import password
+
+BENCH_PASSWORD = "bench-password"
+CHUNK_SIZE = 1000
+
+# Tables vidées par --reset (enfants d'abord)
+GENERATED_TABLES = [
+    "timelines", "map_feed", "post_stats", "user_stats", "notification_actors", "notifications", "comment_likes", "mentions",
+    "saved_posts", "post_shares", "user_interactions", "conversations", "private_messages",
+    "group_messages", "group_members", "group_chats", "story_views", "stories",
+    "likes", "comments", "media", "posts", "trip_places", "trips_hist", "trips",
+    "friends_hist", "friends", "followers", "upload_jobs", "user_preferences", "users",
+]
+
+
+def _insert(db, model, rows: list[dict]):
+    for i in range(0, len(rows), CHUNK_SIZE):
+        db.execute(model.__table__.insert(), rows[i:i + CHUNK_SIZE])
+
+
+def _weights(rng: random.Random, n: int, alpha: float) -> list[float]:
+    """Popularité de chaque utilisateur (Pareto : queue lourde)."""
+    return [rng.paretovariate(alpha) for _ in range(n)]
+
+
+def _pick_distinct(rng: random.Random, population: list[int], weights: list[float], k: int, exclude: int) -> set[int]:
+    picked = set(rng.choices(population, weights=weights, k=k))
+    picked.discard(exclude)
+    return picked
+
+
+def reset(db):
+    mysql = database.engine.dialect.name == "mysql"
+    if mysql:
+        db.execute(text("SET FOREIGN_KEY_CHECKS = 0"))  # comments.parent_comment_id pointe sur la même table
+    for table in GENERATED_TABLES:
+        db.execute(text(f"DELETE FROM {table}"))
+    if mysql:
+        db.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
+    db.commit()
+
+
+def generate(
+    db,
+    users: int = 1000,
+    seed: int = 42,
+    avg_following: int = 30,
+    avg_friends: int = 10,
+    avg_posts: int = 8,
+    avg_likes: int = 15,
+    avg_comments: int = 3,
+    story_ratio: float = 0.2,
+    avg_contacts: int = 4,
+    messages_per_contact: int = 10,
+    alpha: float = 1.5,
+) -> dict:
+    """Insère le jeu de données et renvoie le nb de lignes par table."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    counts = {}
+
+    user_ids = list(range(1, users + 1))
+    popularity = _weights(rng, users, alpha)
+    activity = _weights(rng, users, alpha + 0.5)
+    mean_activity = sum(activity) / users
+
+    # ---- Utilisateurs ----
+    password_hash = password.hash_password(BENCH_PASSWORD)  # un seul bcrypt pour tout le monde
+    _insert(db, models.User, [{
+        "user_id": uid,
+        "username": f"bench{uid}",
+        "email": f"bench{uid}@spotshare.test",
+        "password_hash": password_hash,
+        "gender": rng.choice(["Homme", "Femme", "Autre"]),
+        "birth_date": date(1970, 1, 1) + timedelta(days=rng.randrange(15000)),
+        "is_private_flag": "Y" if rng.random() < 0.1 else "N",
+        "profile_picture": f"https://picsum.photos/seed/u{uid}/200",
+    } for uid in user_ids])
+    _insert(db, models.UserPreferences, [{"user_id": uid} for uid in user_ids])
+    counts["users"] = users
+
+    # ---- Abonnements (on suit surtout les comptes populaires) ----
+    followers = []
+    for uid in user_ids:
+        k = max(1, int(rng.expovariate(1 / avg_following)))
+        for target in _pick_distinct(rng, user_ids, popularity, k, uid):
+            followers.append({"user_id": target, "follower_user_id": uid, "status": "ACCEPTED"})
+    _insert(db, models.Follower, followers)
+    counts["followers"] = len(followers)
+
+    # ---- Amitiés (symétriques : une ligne par paire) ----
+    pairs = set()
+    for uid in user_ids:
+        k = max(0, int(rng.expovariate(1 / avg_friends) / 2))
+        for other in _pick_distinct(rng, user_ids, popularity, k, uid):
+            pairs.add((min(uid, other), max(uid, other)))
+    _insert(db, models.Friend, [
+        {"user_id": a, "user_id_friend": b, "status": "ACCEPTED"} for a, b in sorted(pairs)
+    ])
+    counts["friends"] = len(pairs)
+
+    # ---- Posts + médias ----
+    posts, media = [], []
+    for uid, weight in zip(user_ids, activity):
+        for _ in range(int(rng.expovariate(mean_activity / (avg_posts * weight)))):
+            post_id = len(posts) + 1
+            posts.append({
+                "post_id": post_id,
+                "user_id": uid,
+                "post_title": f"Spot {post_id}",
+                "post_description": "Lorem ipsum dolor sit amet " * rng.randint(1, 5),
+                "publication_date": now - timedelta(minutes=rng.randrange(60 * 24 * 180)),
+                "post_type": "MEMORY" if rng.random() < 0.1 else "POST",
+                "privacy": rng.choices(["PUBLIC", "FRIENDS", "PRIVATE"], weights=[80, 15, 5])[0],
+                "latitude": round(rng.uniform(-60, 70), 6),
+                "longitude": round(rng.uniform(-180, 180), 6),
+            })
+            for rank in range(1, rng.randint(1, 3) + 1):
+                media.append({
+                    "post_id": post_id,
+                    "media_url": f"https://picsum.photos/seed/p{post_id}-{rank}/1080",
+                    "media_type": "VIDEO" if rng.random() < 0.1 else "IMAGE",
+                    "carrousel_rank": rank,
+                    "status": "READY",
+                })
+    _insert(db, models.Post, posts)
+    _insert(db, models.Media, media)
+    counts["posts"], counts["media"] = len(posts), len(media)
+
+    # ---- Likes / commentaires (les posts des comptes populaires en reçoivent plus) ----
+    likes, comments = set(), []
+    mean_popularity = sum(popularity) / users
+    for post in posts:
+        author_weight = popularity[post["user_id"] - 1] / mean_popularity
+        for liker in rng.sample(user_ids, min(users, int(rng.expovariate(1 / (avg_likes * author_weight))))):
+            likes.add((post["post_id"], liker))
+        thread = []
+        for _ in range(int(rng.expovariate(1 / (avg_comments * author_weight)))):
+            comment_id = len(comments) + 1
+            comments.append({
+                "comment_id": comment_id,
+                "post_id": post["post_id"],
+                "user_id": rng.choice(user_ids),
+                "parent_comment_id": rng.choice(thread) if thread and rng.random() < 0.3 else None,
+                "content": "Trop beau ce spot !",
+                "creation_date": post["publication_date"] + timedelta(minutes=rng.randrange(1, 600)),
+            })
+            thread.append(comment_id)
+    _insert(db, models.Like, [{"post_id": p, "user_id": u} for p, u in sorted(likes)])
+    _insert(db, models.Comment, comments)
+    counts["likes"], counts["comments"] = len(likes), len(comments)
+
+    # ---- Stories actives ----
+    stories = []
+    for uid in user_ids:
+        if rng.random() < story_ratio:
+            for _ in range(rng.randint(1, 4)):
+                created = now - timedelta(minutes=rng.randrange(60 * 23))
+                stories.append({
+                    "user_id": uid,
+                    "media_url": f"https://picsum.photos/seed/s{uid}-{len(stories)}/1080",
+                    "media_type": "IMAGE",
+                    "created_at": created,
+                    "expires_at": created + timedelta(hours=24),
+                    "view_count": 0,
+                })
+    _insert(db, models.Story, stories)
+    counts["stories"] = len(stories)
+
+    # ---- Messages privés ----
+    messages = []
+    for uid in user_ids:
+        for contact in _pick_distinct(rng, user_ids, popularity, rng.randint(0, avg_contacts * 2), uid):
+            sent = now - timedelta(days=rng.randrange(60))
+            for _ in range(rng.randint(1, messages_per_contact * 2)):
+                sent += timedelta(minutes=rng.randrange(1, 240))
+                sender, receiver = (uid, contact) if rng.random() < 0.5 else (contact, uid)
+                messages.append({
+                    "sender_id": sender,
+                    "receiver_id": receiver,
+                    "content": "Salut, c'est où ?",
+                    "sent_at": sent,
+                    "is_read_flag": "Y" if rng.random() < 0.8 else "N",
+                })
+    _insert(db, models.PrivateMessage, messages)
+    counts["private_messages"] = len(messages)
+
+    db.commit()
+    return counts
+
+
+def rebuild_derived(db):
+    """Compteurs, timelines et carte à partir des tables sources (SQL MySQL)."""
+    from routers.map import refresh_map_feed
+    from routers.messages import reconcile_conversations
+    from routers.stats import reconcile_post_stats, reconcile_user_stats
+    from routers.timeline import rebuild_timelines
+
+    reconcile_post_stats(db)
+    reconcile_user_stats(db)  # avant les timelines : seuil "célébrité"
+    rebuild_timelines(db)
+    refresh_map_feed(db)
+    reconcile_conversations(db)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Jeu de données synthétique pour les benchmarks")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--avg-following", type=int, default=30)
+    parser.add_argument("--avg-friends", type=int, default=10)
+    parser.add_argument("--avg-posts", type=int, default=8)
+    parser.add_argument("--avg-likes", type=int, default=15)
+    parser.add_argument("--avg-comments", type=int, default=3)
+    parser.add_argument("--story-ratio", type=float, default=0.2)
+    parser.add_argument("--avg-contacts", type=int, default=4)
+    parser.add_argument("--alpha", type=float, default=1.5, help="exposant de Pareto (plus petit = plus inégal)")
+    parser.add_argument("--reset", action="store_true", help="vide d'abord les tables générées")
+    args = parser.parse_args()
+
+    db = database.SessionLocal()
+    try:
+        if args.reset:
+            reset(db)
+        elif db.query(models.User).count():
+            raise SystemExit("La base contient déjà des utilisateurs : relancer avec --reset (base de bench uniquement)")
+
+        started = time.monotonic()
+        counts = generate(
+            db,
+            users=args.users,
+            seed=args.seed,
+            avg_following=args.avg_following,
+            avg_friends=args.avg_friends,
+            avg_posts=args.avg_posts,
+            avg_likes=args.avg_likes,
+            avg_comments=args.avg_comments,
+            story_ratio=args.story_ratio,
+            avg_contacts=args.avg_contacts,
+            alpha=args.alpha,
+        )
+        for table, n in counts.items():
+            print(f"{table:<18} {n:>10}")
+
+        if database.engine.dialect.name == "mysql":
+            rebuild_derived(db)
+        else:
+            print("⏭️ Tables dérivées non reconstruites (SQL spécifique MySQL)")
+        print(f"✔️ Jeu de données généré en {time.monotonic() - started:.1f}s")
+    finally:
+        db.close()
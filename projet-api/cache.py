@@ -0,0 +1,224 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+
+# ---- Configuration ----
+# ex : redis://cache:6379/0. Sans CACHE_URL, cache en mémoire du process :
+# à réserver à un seul replica (l'invalidation ne serait vue que localement).
+CACHE_URL = os.getenv("CACHE_URL")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_SOCKET_TIMEOUT = float(os.getenv("CACHE_SOCKET_TIMEOUT", "0.2"))  # s : Redis lent = cache absent
+DEFAULT_TTL = int(os.getenv("CACHE_DEFAULT_TTL", "60"))
+
+
+# ---- Backends ----
+class MemoryCache:
+    """
+    Cache en mémoire du process : TTL + éviction LRU, index tag -> clés.
+    """
+    blocking = False  # appelable directement depuis la boucle asyncio
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}             # tag -> set(keys)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value, _tags = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: int, tags: list[str]):
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+
+    def invalidate_tags(self, tags: list[str]):
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, set()):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def _remove(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class RedisCache:
+    """
+    Cache partagé entre les replicas de l'API (valeurs stockées en JSON).
+    N'importe quel objet avec les mêmes méthodes (ex : un faux Redis local
+    dans les tests) peut le remplacer via set_backend().
+    Les erreurs (Redis injoignable, timeout) remontent : c'est l'API du module
+    (get_or_set, invalidate, safe_get...) qui les traite comme un cache absent.
+    """
+    blocking = True  # appels réseau : hors de la boucle asyncio (voir aget / aset)
+
+    def __init__(self, url: str, prefix: str = "spotshare:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_URL défini mais le paquet 'redis' n'est pas installé")
+        self.client = redis.Redis.from_url(
+            url,
+            socket_timeout=CACHE_SOCKET_TIMEOUT,
+            socket_connect_timeout=CACHE_SOCKET_TIMEOUT,
+        )
+        self.prefix = prefix
+
+    def get(self, key: str):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value, ttl: int, tags: list[str]):
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, json.dumps(value), ex=ttl)
+        for tag in tags:
+            pipe.sadd(self.prefix + "tag:" + tag, key)
+            pipe.expire(self.prefix + "tag:" + tag, ttl)
+        pipe.execute()
+
+    def invalidate_tags(self, tags: list[str]):
+        for tag in tags:
+            tag_key = self.prefix + "tag:" + tag
+            keys = self.client.smembers(tag_key)
+            pipe = self.client.pipeline()
+            for key in keys:
+                pipe.delete(self.prefix + key.decode("utf-8"))
+            pipe.delete(tag_key)
+            pipe.execute()
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+
+backend = RedisCache(CACHE_URL) if CACHE_URL else MemoryCache()
+stats = {"hits": 0, "misses": 0, "invalidations": 0, "errors": 0}
+_stats_lock = threading.Lock()
+_last_error_log = 0.0
+ERROR_LOG_INTERVAL = 10  # s : une ligne de log par période pendant une panne, pas une par requête
+
+
+def set_backend(new_backend):
+    global backend
+    backend = new_backend
+
+
+def _count(name: str, n: int = 1):
+    with _stats_lock:
+        stats[name] += n
+
+
+def _backend_error(operation: str, error: Exception):
+    """Panne du backend : comptée, journalisée au plus toutes les ERROR_LOG_INTERVAL s."""
+    global _last_error_log
+    now = time.monotonic()
+    with _stats_lock:
+        stats["errors"] += 1
+        if now - _last_error_log < ERROR_LOG_INTERVAL:
+            return
+        _last_error_log = now
+    print(f"⚠️ Cache indisponible ({operation}), on continue sans : {error}")
+
+
+# ---- Accès tolérants aux pannes (un cache absent ne doit jamais faire échouer la requête) ----
+def safe_get(cache_backend, key: str, default=None):
+    """backend.get, ou `default` si le backend est en panne."""
+    try:
+        return cache_backend.get(key)
+    except Exception as e:
+        _backend_error("get", e)
+        return default
+
+
+def safe_set(cache_backend, key: str, value, ttl: int, tags: list[str]):
+    try:
+        cache_backend.set(key, value, ttl, tags)
+    except Exception as e:
+        _backend_error("set", e)
+
+
+def safe_invalidate(cache_backend, tags: list[str]):
+    try:
+        cache_backend.invalidate_tags(tags)
+    except Exception as e:
+        _backend_error("invalidate", e)
+
+
+async def aget(cache_backend, key: str, default=None):
+    """safe_get depuis un endpoint async : un backend réseau passe par le threadpool."""
+    if not getattr(cache_backend, "blocking", True):
+        return safe_get(cache_backend, key, default)
+    return await run_in_threadpool(safe_get, cache_backend, key, default)
+
+
+async def aset(cache_backend, key: str, value, ttl: int, tags: list[str]):
+    if not getattr(cache_backend, "blocking", True):
+        return safe_set(cache_backend, key, value, ttl, tags)
+    await run_in_threadpool(safe_set, cache_backend, key, value, ttl, tags)
+
+
+# ---- API utilisée par les routers ----
+def get_or_set(key: str, loader, ttl: int = DEFAULT_TTL, tags: list[str] | None = None):
+    """
+    Renvoie la valeur en cache, sinon appelle loader() et la met en cache.
+    La valeur est convertie en JSON-compatible (dict / list) avant stockage :
+    jamais d'objet ORM lié à une session dans le cache.
+    """
+    value = safe_get(backend, key)
+    if value is not None:
+        _count("hits")
+        return value
+
+    _count("misses")
+    value = jsonable_encoder(loader())
+    safe_set(backend, key, value, ttl, tags or [key])
+    return value
+
+
+def invalidate(*tags: str):
+    """
+    À appeler après le commit d'une écriture. Backend en panne : l'écriture
+    est faite, les entrées périment d'elles-mêmes au bout de leur TTL.
+    """
+    _count("invalidations", len(tags))
+    safe_invalidate(backend, list(tags))
+
+
+def get_stats() -> dict:
+    with _stats_lock:
+        snapshot = dict(stats)
+    total = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_ratio"] = round(snapshot["hits"] / total, 3) if total else 0.0
+    snapshot["backend"] = type(backend).__name__
+    return snapshot
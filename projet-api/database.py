@@ -1,12 +1,111 @@
+import itertools
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import threading
+import time
+from contextvars import ContextVar
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DataError, IntegrityError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+import cache
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL missing")
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+
+# ---- Pool de connexions (par process, et par engine : sync + async) ----
+# Budget MySQL : replicas x 2 engines x (POOL_SIZE + MAX_OVERFLOW) < max_connections
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))    # attente max d'une connexion libre (s)
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))    # < wait_timeout de MySQL
+# Pre-ping = un aller-retour en plus à chaque checkout. Avec un recycle plus court
+# que wait_timeout, on peut le couper (DB_POOL_PRE_PING=0).
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+pool_stats = {}  # nom du pool -> compteurs
+_pool_stats_lock = threading.Lock()
+
+# État de la requête en cours, posé par le middleware de main.py :
+# {"pool_wait": attente cumulée sur le pool (s), "user_id": utilisateur connecté}
+# (un dict mutable : les dépendances sync tournent dans une copie du contexte)
+request_state = ContextVar("request_state", default=None)
+
+
+def set_request_user(user_id: int):
+    """Dépendances sync (threadpool) : le marqueur "primaire" peut être lu ici en bloquant."""
+    state = request_state.get()
+    if state is not None:
+        state["user_id"] = user_id
+        if replicas.replicas:
+            state["primary_sticky"] = _is_primary_sticky(user_id)
+
+
+async def aset_request_user(user_id: int):
+    """Dépendances async : le marqueur est lu hors de la boucle, avant que la session de lecture choisisse sa base."""
+    state = request_state.get()
+    if state is not None:
+        state["user_id"] = user_id
+        if replicas.replicas:
+            sticky = await cache.aget(cache.backend, _sticky_key(user_id), default=1)
+            state["primary_sticky"] = sticky is not None
+
+
+def _record_checkout(name: str, waited: float, timed_out: bool = False):
+    with _pool_stats_lock:
+        stats = pool_stats.setdefault(name, {
+            "checkouts": 0, "timeouts": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0,
+        })
+        stats["checkouts"] += 1
+        stats["timeouts"] += int(timed_out)
+        stats["wait_seconds_total"] += waited
+        stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+
+    state = request_state.get()
+    if state is not None:
+        state["pool_wait"] += waited
+
+
+class _TimedCheckout:
+    """Mesure le temps passé à attendre une connexion libre (à mettre avant la classe de pool)."""
+    metrics_name = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            _record_checkout(self.metrics_name, time.perf_counter() - start, timed_out=True)
+            raise
+        _record_checkout(self.metrics_name, time.perf_counter() - start)
+        return conn
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    metrics_name = "sync"
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    metrics_name = "async"
+
+
+def _pool_options(poolclass, url: str = DATABASE_URL) -> dict:
+    if make_url(url).get_backend_name() == "sqlite" and ":memory:" in str(url):
+        return {"pool_pre_ping": POOL_PRE_PING}  # pool spécial SQLite en mémoire
+    return {
+        "poolclass": poolclass,
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": POOL_PRE_PING,
+    }
+
+
+engine = create_engine(DATABASE_URL, **_pool_options(TimedQueuePool))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -16,3 +115,219 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def write_isolating(write, rows: list):
+    """
+    Écriture par lots des flushers (interactions, notifications).
+    write(chunk) ouvre sa propre transaction. Si une ligne viole une contrainte
+    (IntegrityError / DataError : FK vers une ligne supprimée, texte trop long...),
+    le lot est coupé en deux jusqu'à isoler les lignes fautives, au lieu de
+    bloquer tout le lot à chaque flush.
+    Renvoie (rejetées, non_écrites, erreur) : sur une autre erreur (base
+    injoignable...), on s'arrête et non_écrites contient tout ce qui n'a pas
+    été validé, à remettre en buffer par l'appelant.
+    """
+    rejected = []
+    stack = [rows]
+    while stack:
+        chunk = stack.pop()
+        try:
+            write(chunk)
+        except (IntegrityError, DataError):
+            if len(chunk) == 1:
+                rejected.extend(chunk)
+            else:
+                mid = len(chunk) // 2
+                stack += [chunk[mid:], chunk[:mid]]
+        except Exception as e:
+            return rejected, chunk + [row for pending in reversed(stack) for row in pending], e
+    return rejected, [], None
+
+
+# ---- Async (routes de lecture très sollicitées : feeds, stories, messagerie...) ----
+# Même base, driver async : mysql+pymysql -> mysql+aiomysql, sqlite -> sqlite+aiosqlite.
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+
+def _async_url(url: str):
+    parsed = make_url(url)
+    return parsed.set(drivername=ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername))
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_pool_options(TimedAsyncQueuePool))
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# ---- Replicas en lecture ----
+# DATABASE_REPLICA_URLS=mysql+pymysql://...@db-replica-1/spotshare,mysql+pymysql://...@db-replica-2/spotshare
+REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "5"))
+# Après une écriture, les lectures de l'utilisateur restent sur le primaire
+# le temps que la réplication rattrape (lire ses propres écritures).
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+
+
+class ReplicaSet:
+    """Replicas en round-robin, avec un thread qui vérifie leur santé."""
+
+    def __init__(self, urls: list[str]):
+        self.replicas = []
+        for i, url in enumerate(urls):
+            name = f"replica{i + 1}"
+            sync_pool = type(f"{name}SyncPool", (TimedQueuePool,), {"metrics_name": name})
+            async_pool = type(f"{name}AsyncPool", (TimedAsyncQueuePool,), {"metrics_name": f"{name}-async"})
+            self.replicas.append({
+                "name": name,
+                "url": make_url(url).render_as_string(hide_password=True),
+                "engine": create_engine(url, **_pool_options(sync_pool, url)),
+                "async_engine": create_async_engine(_async_url(url), **_pool_options(async_pool, url)),
+                "healthy": True,
+            })
+        self._counter = itertools.count()
+        self._started = False
+
+    def pick(self, kind: str = "sync"):
+        """Engine (sync) du prochain replica sain, ou None s'il n'y en a aucun."""
+        healthy = [r for r in self.replicas if r["healthy"]]
+        if not healthy:
+            return None
+        replica = healthy[next(self._counter) % len(healthy)]
+        return replica["engine"] if kind == "sync" else replica["async_engine"].sync_engine
+
+    def check_health(self):
+        for replica in self.replicas:
+            try:
+                with replica["engine"].connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                if not replica["healthy"]:
+                    print(f"✔️ Replica {replica['url']} de nouveau disponible")
+                replica["healthy"] = True
+            except Exception as e:
+                if replica["healthy"]:
+                    print(f"⚠️ Replica {replica['url']} injoignable, lectures sur le primaire : {e}")
+                replica["healthy"] = False
+
+    def start_health_checks(self):
+        if self._started or not self.replicas:
+            return
+        self._started = True
+
+        def loop():
+            while True:
+                self.check_health()
+                time.sleep(REPLICA_HEALTH_INTERVAL)
+
+        threading.Thread(target=loop, name="replica-health", daemon=True).start()
+
+
+replicas = ReplicaSet(REPLICA_URLS)
+
+
+def _sticky_key(user_id: int) -> str:
+    return f"primary-sticky:{user_id}"
+
+
+def mark_primary_sticky(user_id: int):
+    # Dans le cache partagé : vaut pour tous les replicas de l'API si CACHE_URL est défini.
+    # Cache en panne : rien à marquer, les lectures iront de toute façon au primaire.
+    cache.safe_set(cache.backend, _sticky_key(user_id), 1, REPLICA_STICKY_SECONDS, [])
+
+
+def _is_primary_sticky(user_id: int | None) -> bool:
+    # Cache en panne (default=1) : on ne sait pas, donc primaire
+    return user_id is not None and cache.safe_get(cache.backend, _sticky_key(user_id), default=1) is not None
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _stick_writer_to_primary(session):
+    state = request_state.get()
+    if state is not None and state.get("user_id") is not None:
+        state["primary_sticky"] = True  # lectures suivantes de la même requête
+        if replicas.replicas:
+            mark_primary_sticky(state["user_id"])
+
+
+class RoutingSession(Session):
+    """
+    Session de lecture : choisit un replica sain au premier accès à la base
+    (donc après l'authentification), le primaire sinon. Ne jamais y écrire.
+    """
+    engine_kind = "sync"
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        bind = self.info.get("bind")
+        if bind is None:
+            bind = self.info["bind"] = self._route()
+        return bind
+
+    def _route(self):
+        primary = engine if self.engine_kind == "sync" else async_engine.sync_engine
+        if not replicas.replicas:
+            return primary
+        state = request_state.get() or {}
+        sticky = state.get("primary_sticky")
+        if sticky is None:
+            if self.engine_kind == "async":
+                return primary  # pas résolu par aset_request_user : pas de lookup bloquant sur la boucle
+            sticky = _is_primary_sticky(state.get("user_id"))
+        if sticky:
+            return primary
+        return replicas.pick(self.engine_kind) or primary
+
+
+class AsyncRoutingSession(RoutingSession):
+    engine_kind = "async"
+
+
+ReadSessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+AsyncReadSessionLocal = async_sessionmaker(sync_session_class=AsyncRoutingSession, autoflush=False, expire_on_commit=False)
+
+
+def get_read_db():
+    """Comme get_db, pour les endpoints en lecture seule (routés vers les replicas)."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+def get_pool_stats() -> dict:
+    """Etat des pools (in-use, overflow...) + compteurs d'attente au checkout."""
+    snapshot = {}
+    engines = [("sync", engine), ("async", async_engine.sync_engine)]
+    for replica in replicas.replicas:
+        engines.append((replica["name"], replica["engine"]))
+        engines.append((f"{replica['name']}-async", replica["async_engine"].sync_engine))
+    for name, eng in engines:
+        pool = eng.pool
+        with _pool_stats_lock:
+            stats = dict(pool_stats.get(name, {}))
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "max_overflow": MAX_OVERFLOW,
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "idle": pool.checkedin(),
+            })
+        snapshot[name] = stats
+    return snapshot
@@ -6,9 +6,24 @@ DB_PASSWORD="$(cat /run/secrets/mysql_password)"
 export DATABASE_URL="mysql+pymysql://spotshare:${DB_PASSWORD}@db:3306/spotshare"
 echo "DATABASE_URL configurée : $DATABASE_URL"
 
+# Replicas en lecture (optionnel) : DB_REPLICA_HOSTS=db-replica-1,db-replica-2
+if [ -n "$DB_REPLICA_HOSTS" ]; then
+  DATABASE_REPLICA_URLS=""
+  for host in $(echo "$DB_REPLICA_HOSTS" | tr ',' ' '); do
+    DATABASE_REPLICA_URLS="${DATABASE_REPLICA_URLS:+$DATABASE_REPLICA_URLS,}mysql+pymysql://spotshare:${DB_PASSWORD}@${host}:3306/spotshare"
+  done
+  export DATABASE_REPLICA_URLS
+  echo "Replicas en lecture : $DB_REPLICA_HOSTS"
+fi
+
 until nc -z db 3306; do
   echo "En attente de la base de données MySQL..."
   sleep 2
 done
 
+# Migrations du schéma (verrou MySQL : une seule replica les applique, les autres attendent)
+if [ "${RUN_MIGRATIONS:-1}" = "1" ]; then
+  python migrate.py
+fi
+
 exec uvicorn main:app --host 0.0.0.0 --port 8000
@@ -0,0 +1,95 @@
+import math
+
+# ---- Configuration ----
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+MAX_PRECISION = 12      # taille de la colonne map_feed.geohash
+MAX_COVER_CELLS = 32    # nb max de préfixes (= range scans) pour couvrir une bbox
+
+
+# ---- Geohash ----
+def encode(lat: float, lng: float, precision: int = MAX_PRECISION) -> str:
+    """
+    Même encodage que ST_GeoHash(lng, lat, precision) côté MySQL.
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    bits, bit_count, even = 0, 0, True
+    out = []
+
+    while len(out) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            out.append(BASE32[bits])
+            bits, bit_count = 0, 0
+
+    return "".join(out)
+
+
+def cell_size(precision: int) -> tuple[float, float]:
+    """(hauteur en latitude, largeur en longitude) d'une cellule."""
+    total_bits = 5 * precision
+    lng_bits = math.ceil(total_bits / 2)
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def _clamp_lat(lat: float) -> float:
+    return max(-90.0, min(90.0, lat))
+
+
+def _clamp_lng(lng: float) -> float:
+    return max(-180.0, min(180.0, lng))
+
+
+def cover(min_lat: float, max_lat: float, min_lng: float, max_lng: float, precision: int) -> set[str]:
+    """Ensemble des cellules de `precision` qui recouvrent la bbox."""
+    min_lat, max_lat = _clamp_lat(min_lat), _clamp_lat(max_lat)
+    min_lng, max_lng = _clamp_lng(min_lng), _clamp_lng(max_lng)
+    height, width = cell_size(precision)
+
+    cells = set()
+    lat = min_lat
+    while True:
+        lng = min_lng
+        while True:
+            cells.add(encode(lat, lng, precision))
+            if lng >= max_lng:
+                break
+            lng = min(lng + width, max_lng)
+        if lat >= max_lat:
+            break
+        lat = min(lat + height, max_lat)
+    return cells
+
+
+def cover_bbox(min_lat: float, max_lat: float, min_lng: float, max_lng: float) -> set[str]:
+    """
+    Couvre la bbox avec la précision la plus fine possible sans dépasser
+    MAX_COVER_CELLS préfixes (chaque préfixe = un range scan sur l'index).
+    """
+    best = set()
+    for precision in range(1, MAX_PRECISION + 1):
+        height, width = cell_size(precision)
+        estimate = (math.ceil((max_lat - min_lat) / height) + 1) * (math.ceil((max_lng - min_lng) / width) + 1)
+        if estimate > MAX_COVER_CELLS:
+            break
+        best = cover(min_lat, max_lat, min_lng, max_lng, precision)
+    return best or cover(min_lat, max_lat, min_lng, max_lng, 1)
+
+
+def precision_for_zoom(zoom: int) -> int:
+    """
+    Taille des clusters selon le zoom de la carte (zoom web mercator 0-20) :
+    on vise une dizaine de clusters sur la largeur d'un écran.
+    """
+    return max(1, min(MAX_PRECISION, zoom // 2))
@@ -5,3 +5,105 @@ ON SCHEDULE EVERY 1 DAY
 DO
   DELETE FROM stories
   WHERE expires_at < CURRENT_TIMESTAMP;
+
+-- ===============================
+-- post_stats : recalcul nocturne des compteurs (corrige la dérive)
+-- ===============================
+DROP EVENT IF EXISTS ev_reconcile_post_stats;
+
+CREATE EVENT ev_reconcile_post_stats
+ON SCHEDULE EVERY 1 DAY
+DO
+  INSERT INTO post_stats (post_id, likes_count, comments_count, shares_count, saves_count, views_count, last_modification_date)
+  SELECT
+      p.post_id,
+      (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.post_id),
+      (SELECT COUNT(*) FROM comments c WHERE c.post_id = p.post_id),
+      (SELECT COUNT(*) FROM post_shares s WHERE s.post_id = p.post_id),
+      (SELECT COUNT(*) FROM saved_posts sp WHERE sp.post_id = p.post_id),
+      (SELECT COUNT(*) FROM user_interactions ui WHERE ui.post_id = p.post_id AND ui.interaction_type = 'VIEW'),
+      CURRENT_TIMESTAMP
+  FROM posts p
+  ON DUPLICATE KEY UPDATE
+      likes_count = VALUES(likes_count),
+      comments_count = VALUES(comments_count),
+      shares_count = VALUES(shares_count),
+      saves_count = VALUES(saves_count),
+      views_count = VALUES(views_count),
+      last_modification_date = CURRENT_TIMESTAMP;
+
+-- ===============================
+-- user_stats : recalcul nocturne des compteurs de profil
+-- ===============================
+DROP EVENT IF EXISTS ev_reconcile_user_stats;
+
+CREATE EVENT ev_reconcile_user_stats
+ON SCHEDULE EVERY 1 DAY
+DO
+  INSERT INTO user_stats (user_id, followers_count, following_count, posts_count, trips_count, friends_count,
+                          unread_messages_count, unread_notifications_count, pending_follow_requests_count, pending_friend_requests_count,
+                          last_modification_date)
+  SELECT
+      u.user_id,
+      (SELECT COUNT(*) FROM followers f WHERE f.user_id = u.user_id AND f.status = 'ACCEPTED'),
+      (SELECT COUNT(*) FROM followers f WHERE f.follower_user_id = u.user_id AND f.status = 'ACCEPTED'),
+      (SELECT COUNT(*) FROM posts p WHERE p.user_id = u.user_id),
+      (SELECT COUNT(*) FROM trips t WHERE t.user_id = u.user_id),
+      (SELECT COUNT(DISTINCT CASE WHEN fr.user_id = u.user_id THEN fr.user_id_friend ELSE fr.user_id END)
+       FROM friends fr
+       WHERE fr.status = 'ACCEPTED' AND (fr.user_id = u.user_id OR fr.user_id_friend = u.user_id)),
+      (SELECT COUNT(*) FROM private_messages pm WHERE pm.receiver_id = u.user_id AND pm.is_read_flag = 'N'),
+      (SELECT COUNT(*) FROM notifications n WHERE n.user_id = u.user_id AND n.is_read_flag = 'N'),
+      (SELECT COUNT(*) FROM followers f WHERE f.user_id = u.user_id AND f.status = 'PENDING'),
+      (SELECT COUNT(*) FROM friends fr WHERE fr.user_id_friend = u.user_id AND fr.status = 'PENDING'),
+      CURRENT_TIMESTAMP
+  FROM users u
+  ON DUPLICATE KEY UPDATE
+      followers_count = VALUES(followers_count),
+      following_count = VALUES(following_count),
+      posts_count = VALUES(posts_count),
+      trips_count = VALUES(trips_count),
+      friends_count = VALUES(friends_count),
+      unread_messages_count = VALUES(unread_messages_count),
+      unread_notifications_count = VALUES(unread_notifications_count),
+      pending_follow_requests_count = VALUES(pending_follow_requests_count),
+      pending_friend_requests_count = VALUES(pending_friend_requests_count),
+      last_modification_date = CURRENT_TIMESTAMP;
+
+-- ===============================
+-- conversations : recalcul nocturne du résumé des messages privés
+-- (première exécution à la création de l'event : remplit la table)
+-- ===============================
+DROP EVENT IF EXISTS ev_reconcile_conversations;
+
+CREATE EVENT ev_reconcile_conversations
+ON SCHEDULE EVERY 1 DAY
+DO
+  INSERT INTO conversations (min_user_id, max_user_id, last_message_id, last_message_at, min_user_unread_count, max_user_unread_count, creation_date, last_modification_date)
+  SELECT
+      agg.min_user_id,
+      agg.max_user_id,
+      agg.last_message_id,
+      pm.sent_at,
+      agg.min_unread,
+      agg.max_unread,
+      CURRENT_TIMESTAMP,
+      CURRENT_TIMESTAMP
+  FROM (
+      SELECT
+          min_user_id,
+          max_user_id,
+          MAX(private_message_id) AS last_message_id,
+          SUM(is_read_flag = 'N' AND receiver_id = min_user_id) AS min_unread,
+          SUM(is_read_flag = 'N' AND receiver_id = max_user_id) AS max_unread
+      FROM private_messages
+      WHERE sender_id <> receiver_id
+      GROUP BY min_user_id, max_user_id
+  ) agg
+  JOIN private_messages pm ON pm.private_message_id = agg.last_message_id
+  ON DUPLICATE KEY UPDATE
+      last_message_id = VALUES(last_message_id),
+      last_message_at = VALUES(last_message_at),
+      min_user_unread_count = VALUES(min_user_unread_count),
+      max_user_unread_count = VALUES(max_user_unread_count),
+      last_modification_date = CURRENT_TIMESTAMP;
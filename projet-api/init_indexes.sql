@@ -192,6 +192,57 @@ PREPARE stmt FROM @sql;
 EXECUTE stmt;
 DEALLOCATE PREPARE stmt;
 
+-- media.status : colonne ajoutée après coup (create_all ne fait pas d'ALTER)
+SET @col_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE()
+      AND table_name = 'media'
+      AND column_name = 'status'
+);
+SET @sql := IF(
+    @col_exists = 0,
+    'ALTER TABLE media ADD COLUMN status VARCHAR(20) NOT NULL DEFAULT ''READY''',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- idx_upload_jobs_status : reprise des uploads au démarrage
+SET @idx_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE()
+      AND table_name = 'upload_jobs'
+      AND index_name = 'idx_upload_jobs_status'
+);
+SET @sql := IF(
+    @idx_exists = 0,
+    'CREATE INDEX idx_upload_jobs_status ON upload_jobs(status)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- idx_asset_deletions_due : outbox des fichiers à supprimer, lignes à traiter
+SET @idx_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE()
+      AND table_name = 'asset_deletions'
+      AND index_name = 'idx_asset_deletions_due'
+);
+SET @sql := IF(
+    @idx_exists = 0,
+    'CREATE INDEX idx_asset_deletions_due ON asset_deletions(status, next_attempt_at)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
 
 -- ===============================
 -- INDEXES STORIES
@@ -258,6 +309,23 @@ PREPARE stmt FROM @sql;
 EXECUTE stmt;
 DEALLOCATE PREPARE stmt;
 
+-- idx_comments_thread : fil de commentaires paginé (premier niveau / réponses)
+SET @idx_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE()
+      AND table_name = 'comments'
+      AND index_name = 'idx_comments_thread'
+);
+SET @sql := IF(
+    @idx_exists = 0,
+    'CREATE INDEX idx_comments_thread ON comments(post_id, parent_comment_id, creation_date, comment_id)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
 
 -- ===============================
 -- INDEXES MENTIONS
@@ -386,6 +454,58 @@ PREPARE stmt FROM @sql;
 EXECUTE stmt;
 DEALLOCATE PREPARE stmt;
 
+-- min_user_id : clé canonique de la conversation (colonne générée, remplie pour les lignes existantes)
+SET @col_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE()
+      AND table_name = 'private_messages'
+      AND column_name = 'min_user_id'
+);
+SET @sql := IF(
+    @col_exists = 0,
+    'ALTER TABLE private_messages ADD COLUMN min_user_id INT AS (CASE WHEN sender_id < receiver_id THEN sender_id ELSE receiver_id END) STORED',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- max_user_id : clé canonique de la conversation (colonne générée, remplie pour les lignes existantes)
+SET @col_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE()
+      AND table_name = 'private_messages'
+      AND column_name = 'max_user_id'
+);
+SET @sql := IF(
+    @col_exists = 0,
+    'ALTER TABLE private_messages ADD COLUMN max_user_id INT AS (CASE WHEN sender_id < receiver_id THEN receiver_id ELSE sender_id END) STORED',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- idx_pm_pair : historique d'une conversation, un seul parcours ordonné dans les deux sens
+-- (couvrant pour la pagination before / since : les lignes complètes sont lues après le LIMIT)
+SET @idx_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE()
+      AND table_name = 'private_messages'
+      AND index_name = 'idx_pm_pair'
+);
+SET @sql := IF(
+    @idx_exists = 0,
+    'CREATE INDEX idx_pm_pair ON private_messages(min_user_id, max_user_id, private_message_id)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
 -- idx_pm_unread : messages non lus pour un user
 SET @idx_exists := (
     SELECT COUNT(*)
@@ -404,6 +524,45 @@ EXECUTE stmt;
 DEALLOCATE PREPARE stmt;
 
 
+-- ===============================
+-- INDEXES CONVERSATIONS
+-- ===============================
+
+-- idx_conversations_min_inbox : boîte de réception, côté min_user_id (plus récent d'abord)
+SET @idx_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE()
+      AND table_name = 'conversations'
+      AND index_name = 'idx_conversations_min_inbox'
+);
+SET @sql := IF(
+    @idx_exists = 0,
+    'CREATE INDEX idx_conversations_min_inbox ON conversations(min_user_id, min_user_archived_flag, last_message_id)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- idx_conversations_max_inbox : boîte de réception, côté max_user_id
+SET @idx_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE()
+      AND table_name = 'conversations'
+      AND index_name = 'idx_conversations_max_inbox'
+);
+SET @sql := IF(
+    @idx_exists = 0,
+    'CREATE INDEX idx_conversations_max_inbox ON conversations(max_user_id, max_user_archived_flag, last_message_id)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+
 -- ===============================
 -- INDEXES GROUP MEMBERS
 -- ===============================
@@ -503,6 +662,74 @@ PREPARE stmt FROM @sql;
 EXECUTE stmt;
 DEALLOCATE PREPARE stmt;
 
+-- group_key : clé de regroupement (type + objet + tranche de temps)
+SET @col_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE()
+      AND table_name = 'notifications'
+      AND column_name = 'group_key'
+);
+SET @sql := IF(
+    @col_exists = 0,
+    'ALTER TABLE notifications ADD COLUMN group_key VARCHAR(120) NULL',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- actor_count : nb d'acteurs regroupés dans la notification
+SET @col_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE()
+      AND table_name = 'notifications'
+      AND column_name = 'actor_count'
+);
+SET @sql := IF(
+    @col_exists = 0,
+    'ALTER TABLE notifications ADD COLUMN actor_count INT NOT NULL DEFAULT 1',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- base_text : texte du dernier acteur, base du rendu "(et N autres)" du groupe
+SET @col_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE()
+      AND table_name = 'notifications'
+      AND column_name = 'base_text'
+);
+SET @sql := IF(
+    @col_exists = 0,
+    'ALTER TABLE notifications ADD COLUMN base_text TEXT NULL',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- idx_notifications_group : cible du ON DUPLICATE KEY UPDATE du flusher (NULL = jamais en conflit)
+SET @idx_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE()
+      AND table_name = 'notifications'
+      AND index_name = 'idx_notifications_group'
+);
+SET @sql := IF(
+    @idx_exists = 0,
+    'CREATE UNIQUE INDEX idx_notifications_group ON notifications(user_id, group_key)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
 
 -- ===============================
 -- INDEXES MAP_FEED
@@ -558,3 +785,195 @@ SET @sql := IF(
 PREPARE stmt FROM @sql;
 EXECUTE stmt;
 DEALLOCATE PREPARE stmt;
+
+-- map_feed.geohash : colonne ajoutée après coup (create_all ne fait pas d'ALTER)
+SET @col_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE()
+      AND table_name = 'map_feed'
+      AND column_name = 'geohash'
+);
+SET @sql := IF(
+    @col_exists = 0,
+    'ALTER TABLE map_feed ADD COLUMN geohash VARCHAR(12) NULL',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Coordonnées hors plage (saisies avant validation) : geohash laissé à NULL,
+-- ST_GeoHash lèverait une erreur et bloquerait la migration
+UPDATE map_feed
+SET geohash = CASE WHEN latitude BETWEEN -90 AND 90 AND longitude BETWEEN -180 AND 180
+                   THEN ST_GeoHash(longitude, latitude, 12) END
+WHERE geohash IS NULL;
+
+-- idx_map_feed_geohash : zone (préfixes geohash) + clustering sans lecture de la table
+SET @idx_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE()
+      AND table_name = 'map_feed'
+      AND index_name = 'idx_map_feed_geohash'
+);
+SET @sql := IF(
+    @idx_exists = 0,
+    'CREATE INDEX idx_map_feed_geohash ON map_feed(geohash, user_id, latitude, longitude, publication_date)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+
+-- ===============================
+-- INDEXES TIMELINES
+-- ===============================
+
+-- idx_timelines_feed : lecture du feed par user + type + date
+SET @idx_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE()
+      AND table_name = 'timelines'
+      AND index_name = 'idx_timelines_feed'
+);
+SET @sql := IF(
+    @idx_exists = 0,
+    'CREATE INDEX idx_timelines_feed ON timelines(user_id, post_type, publication_date, post_id)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- idx_timelines_post : retrait d’un post de toutes les timelines
+SET @idx_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE()
+      AND table_name = 'timelines'
+      AND index_name = 'idx_timelines_post'
+);
+SET @sql := IF(
+    @idx_exists = 0,
+    'CREATE INDEX idx_timelines_post ON timelines(post_id)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- idx_timelines_author : resynchro lecteur / auteur (follow, amis)
+SET @idx_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE()
+      AND table_name = 'timelines'
+      AND index_name = 'idx_timelines_author'
+);
+SET @sql := IF(
+    @idx_exists = 0,
+    'CREATE INDEX idx_timelines_author ON timelines(user_id, author_id)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+
+-- ===============================
+-- INDEXES FOLLOWERS
+-- ===============================
+
+-- idx_followers_follower : relations vues depuis l'abonné (mes abonnements, statut dans la recherche)
+SET @idx_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE()
+      AND table_name = 'followers'
+      AND index_name = 'idx_followers_follower'
+);
+SET @sql := IF(
+    @idx_exists = 0,
+    'CREATE INDEX idx_followers_follower ON followers(follower_user_id, status, user_id)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+
+-- ===============================
+-- COLONNES USER_STATS (badges de /me/badges)
+-- ===============================
+
+-- unread_messages_count : messages privés non lus (rempli par ev_reconcile_user_stats)
+SET @col_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE()
+      AND table_name = 'user_stats'
+      AND column_name = 'unread_messages_count'
+);
+SET @sql := IF(
+    @col_exists = 0,
+    'ALTER TABLE user_stats ADD COLUMN unread_messages_count INT NOT NULL DEFAULT 0',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- unread_notifications_count : notifications non lues (rempli par ev_reconcile_user_stats)
+SET @col_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE()
+      AND table_name = 'user_stats'
+      AND column_name = 'unread_notifications_count'
+);
+SET @sql := IF(
+    @col_exists = 0,
+    'ALTER TABLE user_stats ADD COLUMN unread_notifications_count INT NOT NULL DEFAULT 0',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- pending_follow_requests_count : demandes d'abonnement reçues en attente (rempli par ev_reconcile_user_stats)
+SET @col_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE()
+      AND table_name = 'user_stats'
+      AND column_name = 'pending_follow_requests_count'
+);
+SET @sql := IF(
+    @col_exists = 0,
+    'ALTER TABLE user_stats ADD COLUMN pending_follow_requests_count INT NOT NULL DEFAULT 0',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- pending_friend_requests_count : demandes d'ami reçues en attente (rempli par ev_reconcile_user_stats)
+SET @col_exists := (
+    SELECT COUNT(*)
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE()
+      AND table_name = 'user_stats'
+      AND column_name = 'pending_friend_requests_count'
+);
+SET @sql := IF(
+    @col_exists = 0,
+    'ALTER TABLE user_stats ADD COLUMN pending_friend_requests_count INT NOT NULL DEFAULT 0',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -1,72 +1,75 @@
-from fastapi import FastAPI
-from sqlalchemy import text
-from pathlib import Path
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
+from fastapi.staticfiles import StaticFiles
 
-import models
 import database
-from routers import auth, users, posts, friends, followers, trips, comments, stories, messages, interactions, notifications, map as map_router
+import metrics
+import profiler
+import realtime
+import storage
+from routers import auth, users, posts, friends, followers, trips, comments, stories, messages, interactions, notifications, stats, timeline, uploads, assets, map as map_router
 
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Uploads interrompus par un redémarrage
+    uploads.resume_pending_uploads()
+    # ... et jobs dont le fichier spoolé a disparu avec l'ancien conteneur
+    uploads.start_upload_sweeper()
 
-# Création des tables
-models.Base.metadata.create_all(bind=database.engine)
+    # Suppression des fichiers du stockage (outbox asset_deletions)
+    assets.start_asset_sweeper()
 
+    # Santé des replicas en lecture (DATABASE_REPLICA_URLS)
+    database.replicas.start_health_checks()
 
-def run_sql_file(path: Path):
-    """
-    Exécute un fichier SQL instruction par instruction (séparées par des ';'),
-    compatible avec MySQL (qui n'aime pas les multi-statements en un seul execute()).
-    """
-    if not path.exists():
-        print(f"⚠️ Fichier SQL introuvable : {path}")
-        return
-
-    sql_content = path.read_text(encoding="utf-8")
-
-    # On coupe sur les ';' et on exécute chaque statement séparément
-    statements = [s.strip() for s in sql_content.split(";") if s.strip()]
-
-    with database.engine.begin() as conn:  # begin() = ouvre une transaction et commit automatique à la fin
-        for stmt in statements:
-            try:
-                print(f"▶️ Exécution SQL : {stmt[:80]}{'...' if len(stmt) > 80 else ''}")
-                conn.execute(text(stmt))
-            except Exception as e:
-                # On log l'erreur mais on ne casse pas tout si un index existe déjà, etc.
-                print("⚠️ Erreur lors de l'exécution de :")
-                print(stmt)
-                print("Erreur :", e)
-
-
-# 1) Indexes
-INIT_INDEXES_PATH = Path(__file__).parent / "init_indexes.sql"
-run_sql_file(INIT_INDEXES_PATH)
+    # Écriture groupée des interactions (POST /interactions/batch)
+    interactions.start_interaction_flusher()
 
-# 2) Données de base (pays, etc.) → seulement si pas encore remplies
-INIT_DATA_PATH = Path(__file__).parent / "init_data.sql"
+    # Écriture groupée (et regroupement) des notifications
+    notifications.start_notification_flusher()
 
-with database.engine.connect() as conn:
-    result = conn.execute(text("SELECT COUNT(*) FROM countries"))
-    count = result.scalar()
+    # Hub pub/sub des WebSocket de messagerie (REALTIME_URL : Redis entre replicas)
+    realtime.start_realtime()
+    yield
+    interactions.flush_interactions()
+    notifications.flush_notifications()
 
-if count == 0:
-    print("➡️ Aucune donnée pays trouvée, exécution de init_data.sql")
-    run_sql_file(INIT_DATA_PATH)
-else:
-    print(f"✔️ {count} pays déjà présents, on ne relance pas init_data.sql")
 
-# 3) Triggers
-INIT_TRIGGERS_PATH = Path(__file__).parent / "init_triggers.sql"
-run_sql_file(INIT_TRIGGERS_PATH)
-
-
-# 4) Events
-INIT_EVENTS_PATH = Path(__file__).parent / "init_events.sql"
-run_sql_file(INIT_EVENTS_PATH)
+app = FastAPI(lifespan=lifespan)
 
 
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    """
+    Latence / nb de requêtes SQL par route (Prometheus, /metrics)
+    + temps BDD de la requête -> header Server-Timing.
+    """
+    state = {"pool_wait": 0.0, "user_id": None, "queries": 0, "query_time": 0.0}
+    token = database.request_state.set(state)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        database.request_state.reset(token)
+        metrics.observe_request(request, status, time.perf_counter() - start, state)
+    response.headers["Server-Timing"] = (
+        f"db-pool;dur={state['pool_wait'] * 1000:.1f}, "
+        f"db;dur={state['query_time'] * 1000:.1f};desc=\"{state['queries']} queries\""
+    )
+    return response
+
+
+# Profilage SQL par requête (N+1, requêtes lentes) : staging uniquement
+if profiler.SQL_PROFILE:
+    profiler.install(app)
+
+# Le schéma (tables, index, triggers, events) est appliqué par `python migrate.py`
+# avant le démarrage des workers (voir entrypoint.sh) : rien à exécuter ici.
 
 
 app.include_router(auth.router)
@@ -81,6 +84,15 @@ app.include_router(messages.router)
 app.include_router(interactions.router)
 app.include_router(notifications.router)
 app.include_router(map_router.router)
+app.include_router(stats.router)
+app.include_router(timeline.router)
+app.include_router(uploads.router)
+app.include_router(assets.router)
+
+# Stockage local (dev / tests) : les fichiers sont servis par l'API elle-même
+if isinstance(storage.backend, storage.LocalStorage):
+    storage.backend.root.mkdir(parents=True, exist_ok=True)
+    app.mount(storage.LOCAL_STORAGE_URL, StaticFiles(directory=storage.backend.root), name="media")
 
 
 @app.get("/")
@@ -88,6 +100,15 @@ def root():
     return {"message": "API en ligne 🚀 - test ci-cd"}
 
 
+# Scrapé par Prometheus (réseau interne uniquement, bloqué par Caddy)
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+
 if __name__ == "__main__":
     import uvicorn
+    import migrate
+    migrate.migrate()
     uvicorn.run("main:app", host="0.0.0.0", port=8001)
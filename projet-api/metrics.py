@@ -0,0 +1,144 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import database
+
+# ---- Métriques ----
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    "spotshare_http_request_duration_seconds",
+    "Durée des requêtes HTTP par route",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_DB_QUERIES = Histogram(
+    "spotshare_http_request_db_queries",
+    "Nombre de requêtes SQL par requête HTTP",
+    ["method", "route"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+REQUEST_DB_TIME = Histogram(
+    "spotshare_http_request_db_seconds",
+    "Temps SQL cumulé par requête HTTP",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_LATENCY = Histogram(
+    "spotshare_db_query_duration_seconds",
+    "Durée des requêtes SQL par type d'instruction",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+STORAGE_LATENCY = Histogram(
+    "spotshare_storage_call_duration_seconds",
+    "Durée des appels au stockage de fichiers (Cloudinary, local)",
+    ["backend", "operation"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+STORAGE_ERRORS = Counter(
+    "spotshare_storage_call_errors_total",
+    "Appels au stockage de fichiers en erreur",
+    ["backend", "operation"],
+)
+
+_SQL_OPERATIONS = {"select", "insert", "update", "delete", "replace"}
+
+
+# ---- Requêtes HTTP ----
+def route_label(request) -> str:
+    """Template de la route (/posts/{post_id}) : jamais le chemin brut, pour borner les séries."""
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def observe_request(request, status: int, duration: float, state: dict):
+    route = route_label(request)
+    REQUEST_LATENCY.labels(request.method, route, str(status)).observe(duration)
+    REQUEST_DB_QUERIES.labels(request.method, route).observe(state["queries"])
+    REQUEST_DB_TIME.labels(request.method, route).observe(state["query_time"])
+
+
+# ---- Requêtes SQL (tous les engines : primaire, replicas, async) ----
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+    DB_QUERY_LATENCY.labels(operation if operation in _SQL_OPERATIONS else "other").observe(elapsed)
+
+    state = database.request_state.get()
+    if state is not None:
+        state["queries"] += 1
+        state["query_time"] += elapsed
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # Le after_cursor_execute n'est pas appelé : on dépile le départ
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+# ---- Stockage de fichiers ----
+@contextmanager
+def storage_call(backend: str, operation: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STORAGE_ERRORS.labels(backend, operation).inc()
+        raise
+    finally:
+        STORAGE_LATENCY.labels(backend, operation).observe(time.perf_counter() - start)
+
+
+# ---- Pools de connexions (lus au moment du scrape) ----
+class PoolCollector:
+    def collect(self):
+        gauges = {
+            name: GaugeMetricFamily(f"spotshare_db_pool_{name}", help_text, labels=["pool"])
+            for name, help_text in [
+                ("size", "Taille du pool"),
+                ("checked_out", "Connexions empruntées"),
+                ("idle", "Connexions libres dans le pool"),
+                ("overflow", "Connexions ouvertes au-delà de la taille du pool"),
+            ]
+        }
+        counters = {
+            name: CounterMetricFamily(f"spotshare_db_pool_{name}", help_text, labels=["pool"])
+            for name, help_text in [
+                ("checkouts", "Connexions obtenues"),
+                ("timeouts", "Attentes de connexion abandonnées (timeout)"),
+                ("wait_seconds", "Temps cumulé d'attente d'une connexion"),
+            ]
+        }
+
+        for pool, stats in database.get_pool_stats().items():
+            for name, metric in gauges.items():
+                if name in stats:
+                    metric.add_metric([pool], stats[name])
+            for name, metric in counters.items():
+                key = "wait_seconds_total" if name == "wait_seconds" else name
+                if key in stats:
+                    metric.add_metric([pool], stats[key])
+
+        yield from gauges.values()
+        yield from counters.values()
+
+
+REGISTRY.register(PoolCollector())
+
+
+def render() -> tuple[bytes, str]:
+    """Corps et content-type de la réponse /metrics."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
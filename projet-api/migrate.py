@@ -0,0 +1,270 @@
+"""
+Migrations du schéma, à lancer AVANT de démarrer l'API :
+
+    python migrate.py            # applique ce qui manque
+    python migrate.py --status   # affiche l'état sans rien toucher
+
+Chaque étape est versionnée dans la table schema_migrations avec l'empreinte
+(sha256) de son contenu : une étape déjà appliquée et inchangée est sautée
+sans exécuter une seule instruction. Modifier un fichier .sql suffit à le
+rejouer au prochain lancement (les fichiers restent idempotents).
+
+Un verrou consultatif MySQL (GET_LOCK) empêche deux replicas de migrer en
+même temps : le second attend puis trouve tout déjà appliqué.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+from sqlalchemy import text
+
+import database
+import models
+
+BASE_DIR = Path(__file__).parent
+
+# ---- Configuration ----
+MIGRATION_LOCK_NAME = os.getenv("MIGRATION_LOCK_NAME", "spotshare_migrations")
+MIGRATION_LOCK_TIMEOUT = int(os.getenv("MIGRATION_LOCK_TIMEOUT", "300"))  # secondes
+MIGRATION_VERBOSE = os.getenv("MIGRATION_VERBOSE", "0") == "1"           # affiche chaque instruction
+
+
+# ---- Exécution des fichiers SQL ----
+def split_sql(sql_content: str) -> list[str]:
+    """Instructions séparées par des ';' (MySQL n'aime pas les multi-statements en un seul execute())."""
+    return [s.strip() for s in sql_content.split(";") if s.strip()]
+
+
+def run_sql_file(path: Path) -> int:
+    """Exécute un fichier SQL instruction par instruction. Renvoie le nb d'erreurs."""
+    errors = 0
+    with database.engine.begin() as conn:
+        for stmt in split_sql(path.read_text(encoding="utf-8")):
+            if MIGRATION_VERBOSE:
+                print(f"▶️ Exécution SQL : {stmt[:80]}{'...' if len(stmt) > 80 else ''}")
+            try:
+                conn.execute(text(stmt))
+            except Exception as e:
+                errors += 1
+                print("⚠️ Erreur lors de l'exécution de :")
+                print(stmt)
+                print("Erreur :", e)
+    return errors
+
+
+# ---- Étapes ----
+class Step:
+    """
+    Une étape de migration. checksum() identifie son contenu,
+    apply() renvoie le nb d'erreurs (0 = étape enregistrée comme appliquée).
+    """
+
+    def __init__(self, version: int, name: str):
+        self.version = version
+        self.name = name
+
+    def checksum(self) -> str:
+        raise NotImplementedError
+
+    def apply(self) -> int:
+        raise NotImplementedError
+
+
+class CreateTablesStep(Step):
+    """create_all : crée les tables manquantes (ne modifie jamais une table existante)."""
+
+    def checksum(self) -> str:
+        digest = hashlib.sha256()
+        for table in models.Base.metadata.sorted_tables:
+            digest.update(table.name.encode())
+            for column in table.columns:
+                digest.update(f"{column.name}:{column.type}".encode())
+        return digest.hexdigest()
+
+    def apply(self) -> int:
+        models.Base.metadata.create_all(bind=database.engine)
+        return 0
+
+
+class SqlFileStep(Step):
+    def __init__(self, version: int, name: str, filename: str):
+        super().__init__(version, name)
+        self.path = BASE_DIR / filename
+
+    def checksum(self) -> str:
+        return hashlib.sha256(self.path.read_bytes()).hexdigest()
+
+    def apply(self) -> int:
+        if database.engine.dialect.name != "mysql":
+            print(f"⏭️ {self.path.name} ignoré (SQL spécifique MySQL)")
+            return 0
+        return run_sql_file(self.path)
+
+
+class SeedDataStep(SqlFileStep):
+    """Données de base (pays, etc.) : jamais rejouées si la table est déjà remplie."""
+
+    def apply(self) -> int:
+        with database.engine.connect() as conn:
+            count = conn.execute(text("SELECT COUNT(*) FROM countries")).scalar()
+        if count:
+            print(f"✔️ {count} pays déjà présents, on ne relance pas {self.path.name}")
+            return 0
+        return super().apply()
+
+
+class TimelinesBackfillStep(Step):
+    """
+    Remplit timelines pour les données existantes (le fan-out à l'écriture ne
+    couvre que les posts / relations créés depuis). Jouée une seule fois.
+    """
+
+    def checksum(self) -> str:
+        return hashlib.sha256(f"{self.name}:v1".encode()).hexdigest()
+
+    def apply(self) -> int:
+        if database.engine.dialect.name != "mysql":
+            print(f"⏭️ {self.name} ignorée (SQL spécifique MySQL)")
+            return 0
+        from routers.timeline import rebuild_timelines
+
+        db = database.SessionLocal()
+        try:
+            rows = rebuild_timelines(db)
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Erreur reconstruction des timelines : {e}")
+            return 1
+        finally:
+            db.close()
+        print(f"✔️ {rows} lignes de timeline écrites")
+        return 0
+
+
+# Ordre d'application. Ne jamais renuméroter : ajouter les nouvelles étapes à la fin.
+STEPS = [
+    CreateTablesStep(1, "create_tables"),
+    SqlFileStep(2, "indexes", "init_indexes.sql"),
+    SeedDataStep(3, "seed_data", "init_data.sql"),
+    SqlFileStep(4, "triggers", "init_triggers.sql"),
+    SqlFileStep(5, "events", "init_events.sql"),
+    TimelinesBackfillStep(6, "timelines_backfill"),
+]
+
+
+# ---- Table de versions ----
+def _ensure_version_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT NOT NULL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            checksum CHAR(64) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+
+def applied_checksums(conn) -> dict[int, str]:
+    """{version: checksum} des étapes appliquées, en une seule requête."""
+    rows = conn.execute(text("SELECT version, checksum FROM schema_migrations")).all()
+    return {version: checksum for version, checksum in rows}
+
+
+def _record(step: Step, checksum: str):
+    with database.engine.begin() as conn:
+        conn.execute(text("DELETE FROM schema_migrations WHERE version = :v"), {"v": step.version})
+        conn.execute(
+            text("INSERT INTO schema_migrations (version, name, checksum) VALUES (:v, :n, :c)"),
+            {"v": step.version, "n": step.name, "c": checksum},
+        )
+
+
+def pending_steps(applied: dict[int, str]) -> list[tuple[Step, str]]:
+    pending = []
+    for step in STEPS:
+        checksum = step.checksum()
+        if applied.get(step.version) != checksum:
+            pending.append((step, checksum))
+    return pending
+
+
+# ---- Verrou consultatif ----
+def _acquire_lock(conn) -> bool:
+    if conn.dialect.name != "mysql":
+        return True  # sqlite (dev / tests) : un seul process
+    got = conn.execute(
+        text("SELECT GET_LOCK(:name, :timeout)"),
+        {"name": MIGRATION_LOCK_NAME, "timeout": MIGRATION_LOCK_TIMEOUT},
+    ).scalar()
+    return got == 1
+
+
+def _release_lock(conn):
+    if conn.dialect.name == "mysql":
+        conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK_NAME})
+
+
+# ---- Point d'entrée ----
+def migrate() -> int:
+    """Applique les étapes manquantes. Renvoie le nb d'étapes en échec."""
+    started = time.monotonic()
+
+    # Connexion dédiée au verrou : GET_LOCK est lié à la session MySQL
+    with database.engine.connect() as lock_conn:
+        if not _acquire_lock(lock_conn):
+            raise RuntimeError(f"Verrou de migration '{MIGRATION_LOCK_NAME}' non obtenu après {MIGRATION_LOCK_TIMEOUT}s")
+        try:
+            with database.engine.begin() as conn:
+                _ensure_version_table(conn)
+                applied = applied_checksums(conn)
+
+            pending = pending_steps(applied)
+            if not pending:
+                print(f"✔️ Schéma à jour (version {STEPS[-1].version})")
+                return 0
+
+            failed = 0
+            for step, checksum in pending:
+                step_started = time.monotonic()
+                errors = step.apply()
+                if errors:
+                    # Non enregistrée : elle sera retentée au prochain lancement
+                    failed += 1
+                    print(f"⚠️ Migration {step.version:03d} {step.name} : {errors} erreur(s)")
+                    continue
+                _record(step, checksum)
+                print(f"➡️ Migration {step.version:03d} {step.name} appliquée ({time.monotonic() - step_started:.1f}s)")
+
+            print(f"✔️ Migrations terminées en {time.monotonic() - started:.1f}s")
+            return failed
+        finally:
+            _release_lock(lock_conn)
+
+
+def status():
+    with database.engine.begin() as conn:
+        _ensure_version_table(conn)
+        applied = applied_checksums(conn)
+
+    for step in STEPS:
+        checksum = step.checksum()
+        if step.version not in applied:
+            state = "en attente"
+        elif applied[step.version] != checksum:
+            state = "modifiée"
+        else:
+            state = "appliquée"
+        print(f"{step.version:03d} {step.name:<15} {state}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrations du schéma SpotShare")
+    parser.add_argument("--status", action="store_true", help="affiche l'état sans rien appliquer")
+    args = parser.parse_args()
+
+    if args.status:
+        status()
+        sys.exit(0)
+    sys.exit(1 if migrate() else 0)
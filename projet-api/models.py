@@ -12,7 +12,7 @@ from database import Base
 
 # models.py
 
-from sqlalchemy import Column, Integer, String, Text, Date, DateTime, ForeignKey, CheckConstraint, CHAR
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, ForeignKey, CheckConstraint, CHAR, Computed
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from database import Base
@@ -326,8 +326,12 @@ class Media(Base):
     last_modification_date = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     last_modified_by = Column(Integer, ForeignKey("users.user_id"))
 
+    # NOUVEAU : PENDING tant que l'upload (routers/uploads.py) n'est pas terminé
+    status = Column(String(20), default="READY", nullable=False)
+
     __table_args__ = (
         CheckConstraint("media_type IN ('IMAGE', 'VIDEO')", name="chk_media_type"),
+        CheckConstraint("status IN ('PENDING', 'READY', 'FAILED')", name="chk_media_status"),
     )
 
     post = relationship("Post", back_populates="media")
@@ -496,6 +500,11 @@ class PrivateMessage(Base):
     sender_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
     receiver_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
 
+    # NOUVEAU : clé canonique de la conversation (même paire dans les deux sens),
+    # colonnes générées par la BDD, cf. idx_pm_pair
+    min_user_id = Column(Integer, Computed("CASE WHEN sender_id < receiver_id THEN sender_id ELSE receiver_id END", persisted=True))
+    max_user_id = Column(Integer, Computed("CASE WHEN sender_id < receiver_id THEN receiver_id ELSE sender_id END", persisted=True))
+
     content = Column(Text)
     media_url = Column(String(255))
 
@@ -588,6 +597,11 @@ class Notification(Base):
     related_id = Column(Integer)  # id du post / commentaire / user / message...
     related_table = Column(String(50))  # 'posts', 'comments', 'users', etc.
 
+    # NOUVEAU : regroupement LIKE / COMMENT / FOLLOW ("Alice a aimé votre post (et 37 autres)")
+    group_key = Column(String(120))  # NULL = notification seule ; unique par user_id (idx_notifications_group)
+    actor_count = Column(Integer, default=1, nullable=False)  # acteurs distincts (notification_actors)
+    base_text = Column(Text)  # texte du dernier acteur, sans "(et N autres)" : base du rendu du groupe
+
     creation_date = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     created_by = Column(Integer, ForeignKey("users.user_id"), nullable=True)
 
@@ -606,6 +620,14 @@ class Notification(Base):
 
 
 
+# NOUVEAU : acteurs déjà comptés dans une notification regroupée (un même acteur ne compte qu'une fois)
+class NotificationActor(Base):
+    __tablename__ = "notification_actors"
+
+    notification_id = Column(Integer, ForeignKey("notifications.notification_id", ondelete="CASCADE"), primary_key=True)
+    actor_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+
+
 class MapFeed(Base):
     __tablename__ = "map_feed"
 
@@ -628,6 +650,26 @@ class MapFeed(Base):
 
     likes_count = Column(Integer)
 
+    # NOUVEAU : geohash (ST_GeoHash) pour les recherches par zone et le clustering
+    geohash = Column(String(12))
+
+
+# NOUVEAU : Reconstruction complète de map_feed (cf. routers/map.py refresh_map_feed)
+class MapFeedRefresh(Base):
+    __tablename__ = "map_feed_refresh"
+
+    refresh_id = Column(Integer, primary_key=True)  # une seule ligne : 1
+    started_at = Column(DateTime)                   # NULL : pas de reconstruction en cours
+
+
+# Posts / utilisateurs modifiés pendant une reconstruction, rejoués après le RENAME
+class MapFeedPending(Base):
+    __tablename__ = "map_feed_pending"
+
+    pending_id = Column(Integer, primary_key=True, index=True)
+    post_id = Column(Integer)
+    user_id = Column(Integer)
+
 # NOUVEAU : Table pour liker les commentaires
 class CommentLike(Base):
     __tablename__ = "comment_likes"
@@ -635,4 +677,132 @@ class CommentLike(Base):
     comment_id = Column(Integer, ForeignKey("comments.comment_id", ondelete="CASCADE"), primary_key=True)
     user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
     
-    liked_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
\ No newline at end of file
+    liked_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+# NOUVEAU : Compteurs dénormalisés par post (évite les COUNT(*) dans les feeds)
+class PostStats(Base):
+    __tablename__ = "post_stats"
+
+    post_id = Column(Integer, ForeignKey("posts.post_id", ondelete="CASCADE"), primary_key=True)
+
+    likes_count = Column(Integer, default=0, nullable=False)
+    comments_count = Column(Integer, default=0, nullable=False)
+    shares_count = Column(Integer, default=0, nullable=False)
+    saves_count = Column(Integer, default=0, nullable=False)
+    views_count = Column(Integer, default=0, nullable=False)
+
+    last_modification_date = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+# NOUVEAU : Compteurs dénormalisés par utilisateur (profil en une seule ligne)
+class UserStats(Base):
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+
+    followers_count = Column(Integer, default=0, nullable=False)
+    following_count = Column(Integer, default=0, nullable=False)
+    posts_count = Column(Integer, default=0, nullable=False)
+    trips_count = Column(Integer, default=0, nullable=False)
+    friends_count = Column(Integer, default=0, nullable=False)
+
+    # Badges de l'app (privés : jamais renvoyés dans le profil public)
+    unread_messages_count = Column(Integer, default=0, nullable=False)
+    unread_notifications_count = Column(Integer, default=0, nullable=False)
+    pending_follow_requests_count = Column(Integer, default=0, nullable=False)
+    pending_friend_requests_count = Column(Integer, default=0, nullable=False)
+
+    last_modification_date = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+# NOUVEAU : Timeline matérialisée (fan-out à l'écriture pour /posts/feed)
+class Timeline(Base):
+    __tablename__ = "timelines"
+
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)  # lecteur
+    publication_date = Column(DateTime, primary_key=True)
+    post_id = Column(Integer, ForeignKey("posts.post_id", ondelete="CASCADE"), primary_key=True)
+
+    post_type = Column(String(20), default="POST", nullable=False)
+    author_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
+
+
+# NOUVEAU : Uploads en arrière-plan (fichier spoolé sur disque -> stockage)
+class UploadJob(Base):
+    __tablename__ = "upload_jobs"
+
+    job_id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
+
+    target_type = Column(String(20), nullable=False)  # MEDIA, STORY, TRIP_BANNER, AVATAR
+    target_id = Column(Integer)
+    payload = Column(JSON)  # ex : légende / position d'une story
+
+    folder = Column(String(255), nullable=False)
+    resource_type = Column(String(20), default="auto", nullable=False)
+    spool_path = Column(String(255), nullable=False)
+    original_filename = Column(String(255))
+
+    status = Column(String(20), default="PENDING", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    error_message = Column(Text)
+    result_url = Column(String(255))
+
+    creation_date = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    last_modification_date = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        CheckConstraint("target_type IN ('MEDIA', 'STORY', 'TRIP_BANNER', 'AVATAR')", name="chk_upload_target"),
+        CheckConstraint("status IN ('PENDING', 'UPLOADING', 'READY', 'FAILED')", name="chk_upload_status"),
+    )
+
+
+# NOUVEAU : Outbox des fichiers à supprimer du stockage (cf. routers/assets.py)
+class AssetDeletion(Base):
+    __tablename__ = "asset_deletions"
+
+    deletion_id = Column(Integer, primary_key=True, index=True)
+    cloud_id = Column(String(255), nullable=False)
+    resource_type = Column(String(20), default="image", nullable=False)
+
+    status = Column(String(20), default="PENDING", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    error_message = Column(Text)
+    next_attempt_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    creation_date = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    last_modification_date = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        CheckConstraint("status IN ('PENDING', 'FAILED')", name="chk_asset_deletion_status"),
+    )
+
+
+# NOUVEAU : Résumé des conversations privées (boîte de réception sans GROUP BY)
+class Conversation(Base):
+    __tablename__ = "conversations"
+
+    # Une ligne par paire d'utilisateurs : min_user_id < max_user_id
+    min_user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    max_user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+
+    last_message_id = Column(Integer, ForeignKey("private_messages.private_message_id", ondelete="SET NULL"))
+    last_message_at = Column(DateTime)
+
+    # État propre à chaque côté de la conversation
+    min_user_unread_count = Column(Integer, default=0, nullable=False)
+    max_user_unread_count = Column(Integer, default=0, nullable=False)
+    min_user_muted_flag = Column(CHAR(1), default="N", nullable=False)
+    max_user_muted_flag = Column(CHAR(1), default="N", nullable=False)
+    min_user_archived_flag = Column(CHAR(1), default="N", nullable=False)
+    max_user_archived_flag = Column(CHAR(1), default="N", nullable=False)
+
+    creation_date = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    last_modification_date = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        CheckConstraint("min_user_id < max_user_id", name="chk_conversation_pair"),
+        CheckConstraint("min_user_muted_flag IN ('Y', 'N') AND max_user_muted_flag IN ('Y', 'N')", name="chk_conversation_muted"),
+        CheckConstraint("min_user_archived_flag IN ('Y', 'N') AND max_user_archived_flag IN ('Y', 'N')", name="chk_conversation_archived"),
+    )
@@ -0,0 +1,73 @@
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException, Response
+
+# ---- Configuration ----
+DEFAULT_LIMIT = 30
+MAX_LIMIT = 100
+
+
+# ---- Curseur opaque ----
+def encode_cursor(values: list) -> str:
+    """
+    Transforme la clé de tri du dernier élément (ex : [publication_date, post_id])
+    en une chaîne opaque pour le client.
+    """
+    payload = [{"dt": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        return [datetime.fromisoformat(v["dt"]) if isinstance(v, dict) else v for v in payload]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(limit, MAX_LIMIT))
+
+
+# ---- Keyset ----
+def keyset_filter(cursor: str | None, columns: list[str], order: str = "DESC") -> tuple[str, dict]:
+    """
+    Construit le morceau de WHERE "après le curseur" pour un tri sur `columns`.
+    Ex : (date, id) DESC -> date < :c0 OR (date = :c0 AND id < :c1)
+    Renvoie ("", {}) pour la première page.
+    """
+    if not cursor:
+        return "", {}
+
+    values = decode_cursor(cursor)
+    if len(values) != len(columns):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+    op = "<" if order == "DESC" else ">"
+    params = {f"cursor_{i}": v for i, v in enumerate(values)}
+
+    branches = []
+    for i, col in enumerate(columns):
+        equals = [f"{columns[j]} = :cursor_{j}" for j in range(i)]
+        branches.append("(" + " AND ".join(equals + [f"{col} {op} :cursor_{i}"]) + ")")
+
+    return "AND (" + " OR ".join(branches) + ")", params
+
+
+def paginate(response: Response, rows: list, limit: int, keys: list[str]) -> list:
+    """
+    `rows` doit avoir été récupéré avec LIMIT limit + 1 : la ligne en trop
+    nous dit s'il reste une page. Le curseur suivant et la limite sont
+    renvoyés dans les headers X-Next-Cursor / X-Limit, le corps reste une liste.
+    """
+    page = list(rows[:limit])
+    response.headers["X-Limit"] = str(limit)
+
+    if len(rows) > limit and page:
+        last = page[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor([last[k] for k in keys])
+
+    return page
@@ -0,0 +1,183 @@
+"""
+Profilage SQL par requête (staging) : activé avec SQL_PROFILE=1.
+
+- compte les instructions SQL de chaque requête HTTP, regroupées par "forme"
+  (paramètres et littéraux remplacés par ?) ;
+- signale les N+1 probables : même forme exécutée SQL_PROFILE_NPLUS1 fois ou plus ;
+- log les instructions lentes avec leur plan (EXPLAIN, calculé hors requête) ;
+- agrège tout par route pour GET /admin/profiler.
+"""
+import os
+import queue
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import database
+import metrics
+
+# ---- Configuration ----
+SQL_PROFILE = os.getenv("SQL_PROFILE", "0") == "1"
+SLOW_QUERY_MS = float(os.getenv("SQL_PROFILE_SLOW_MS", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_PROFILE_NPLUS1", "5"))
+SLOW_QUERIES_KEPT = 20  # par route
+
+_current = ContextVar("sql_profile", default=None)
+_routes = {}  # "GET /users/{user_id}" -> agrégats
+_routes_lock = threading.Lock()
+
+_explain_queue = queue.Queue(maxsize=100)
+_explained = {}  # forme -> plan (une seule fois par forme)
+
+
+# ---- Forme d'une instruction ----
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%\(\w+\)s|%s|:\w+|\?")
+_PARAM_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+def statement_shape(statement: str) -> str:
+    """SELECT ... WHERE id = 12 / id = %s / id IN (1, 2, 3) -> même forme."""
+    shape = _STRING.sub("?", statement)
+    shape = _PARAM.sub("?", shape)
+    shape = _NUMBER.sub("?", shape)
+    shape = _PARAM_LIST.sub("?, ...", shape)
+    return " ".join(shape.split())
+
+
+# ---- Hooks SQLAlchemy ----
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is None or not conn.info.get("profile_start"):
+        return
+    elapsed = time.perf_counter() - conn.info["profile_start"].pop()
+
+    shape = statement_shape(statement)
+    profile["queries"] += 1
+    profile["query_time"] += elapsed
+    profile["shapes"][shape] += 1
+
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        profile["slow"].append((shape, elapsed))
+        if not executemany and shape not in _explained:
+            try:
+                _explain_queue.put_nowait((shape, statement, parameters))
+            except queue.Full:
+                pass
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("profile_start"):
+        conn.info["profile_start"].pop()
+
+
+# ---- EXPLAIN des requêtes lentes (thread de fond, jamais sur le chemin de la requête) ----
+def _explain_worker():
+    prefix = "EXPLAIN QUERY PLAN " if database.engine.dialect.name == "sqlite" else "EXPLAIN "
+    while True:
+        shape, statement, parameters = _explain_queue.get()
+        if shape in _explained:
+            continue
+        try:
+            with database.engine.connect() as conn:
+                rows = conn.exec_driver_sql(prefix + statement, parameters).mappings().all()
+            plan = [dict(row) for row in rows]
+        except Exception as e:
+            plan = [{"error": str(e)}]
+        _explained[shape] = plan
+        print(f"🐢 Requête SQL lente : {shape[:200]}")
+        for row in plan:
+            print(f"   {row}")
+
+
+# ---- Middleware ----
+async def profile_request(request, call_next):
+    profile = {"queries": 0, "query_time": 0.0, "shapes": Counter(), "slow": []}
+    token = _current.set(profile)
+    try:
+        response = await call_next(request)
+    finally:
+        _current.reset(token)
+
+    route = f"{request.method} {metrics.route_label(request)}"
+    suspects = {shape: n for shape, n in profile["shapes"].items() if n >= N_PLUS_ONE_THRESHOLD}
+    for shape, n in suspects.items():
+        print(f"⚠️ N+1 probable sur {route} : {n}x {shape[:200]}")
+    _record(route, profile, suspects)
+    return response
+
+
+def _record(route: str, profile: dict, suspects: dict):
+    with _routes_lock:
+        stats = _routes.setdefault(route, {
+            "requests": 0,
+            "queries_total": 0,
+            "queries_max": 0,
+            "sql_seconds_total": 0.0,
+            "n_plus_one": Counter(),   # forme -> nb de requêtes où elle a été répétée
+            "slow": deque(maxlen=SLOW_QUERIES_KEPT),
+        })
+        stats["requests"] += 1
+        stats["queries_total"] += profile["queries"]
+        stats["queries_max"] = max(stats["queries_max"], profile["queries"])
+        stats["sql_seconds_total"] += profile["query_time"]
+        for shape in suspects:
+            stats["n_plus_one"][shape] += 1
+        stats["slow"].extend(profile["slow"])
+
+
+# ---- Rapport ----
+def report(top: int = 10) -> dict:
+    """Les `top` routes qui exécutent le plus de SQL par requête."""
+    with _routes_lock:
+        rows = []
+        for route, stats in _routes.items():
+            rows.append({
+                "route": route,
+                "requests": stats["requests"],
+                "queries_avg": round(stats["queries_total"] / stats["requests"], 1),
+                "queries_max": stats["queries_max"],
+                "sql_ms_avg": round(stats["sql_seconds_total"] * 1000 / stats["requests"], 1),
+                "n_plus_one": [
+                    {"statement": shape, "requests": n}
+                    for shape, n in stats["n_plus_one"].most_common(5)
+                ],
+                "slow_queries": [
+                    {"statement": shape, "ms": round(elapsed * 1000, 1), "explain": _explained.get(shape)}
+                    for shape, elapsed in sorted(stats["slow"], key=lambda s: -s[1])[:5]
+                ],
+            })
+
+    rows.sort(key=lambda r: (-r["queries_avg"], -r["sql_ms_avg"]))
+    return {
+        "enabled": SQL_PROFILE,
+        "slow_query_ms": SLOW_QUERY_MS,
+        "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD,
+        "routes": rows[:top],
+    }
+
+
+def reset():
+    with _routes_lock:
+        _routes.clear()
+    _explained.clear()
+
+
+def install(app):
+    """Branche les hooks SQL et le middleware (appelé par main.py si SQL_PROFILE=1)."""
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    threading.Thread(target=_explain_worker, name="sql-explain", daemon=True).start()
+    app.middleware("http")(profile_request)
@@ -0,0 +1,192 @@
+"""
+Diffusion temps réel des messages (WebSocket /messages/ws) via un hub pub/sub.
+
+- chaque connexion s'abonne à son canal "user:{id}" et aux canaux "group:{id}"
+  des groupes dont l'utilisateur est membre ;
+- les routers publient APRÈS le commit (le message est déjà en base : une
+  publication perdue se rattrape en relisant l'historique en HTTP) ;
+- backend en mémoire par défaut (un seul replica), Redis pub/sub si
+  REALTIME_URL est défini pour relayer entre les replicas.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from fastapi.encoders import jsonable_encoder
+
+# ---- Configuration ----
+REALTIME_URL = os.getenv("REALTIME_URL")  # ex : redis://cache:6379/0 (sinon hub en mémoire)
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "256"))  # messages en attente par connexion
+
+
+def user_channel(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def group_channel(group_id: int) -> str:
+    return f"group:{group_id}"
+
+
+# ---- Connexions locales ----
+class Subscription:
+    """
+    Une connexion WebSocket : file asyncio remplie depuis n'importe quel thread
+    (les endpoints sync publient depuis le threadpool).
+    """
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=REALTIME_QUEUE_SIZE)
+        self.channels = set()
+        self.overflowed = False
+
+    def push(self, message):
+        """Dans la boucle de la connexion. File pleine : client trop lent, on le déconnecte."""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            hub.count("overflows")
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)  # sentinelle : fermer la connexion
+
+
+class Hub:
+    """Registre canal -> connexions de CE process."""
+
+    def __init__(self):
+        self._channels = {}  # canal -> set(Subscription)
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "delivered": 0, "overflows": 0, "publish_errors": 0}
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.stats[name] += n
+
+    def subscribe(self, sub: Subscription, channel: str):
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(sub)
+            sub.channels.add(channel)
+
+    def unsubscribe(self, sub: Subscription, channel: str | None = None):
+        """channel=None : tous les canaux de la connexion (déconnexion)."""
+        with self._lock:
+            for name in [channel] if channel else list(sub.channels):
+                subs = self._channels.get(name)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._channels[name]
+                sub.channels.discard(name)
+
+    def deliver(self, channel: str, message: dict):
+        """Appelé par le backend pour chaque message reçu, quel que soit le thread."""
+        with self._lock:
+            subs = list(self._channels.get(channel, ()))
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.push, message)
+            except RuntimeError:
+                pass  # boucle fermée (arrêt du worker)
+        if subs:
+            self.count("delivered", len(subs))
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            connections = {sub for subs in self._channels.values() for sub in subs}
+            return {**self.stats, "channels": len(self._channels), "connections": len(connections)}
+
+
+hub = Hub()
+
+
+# ---- Backends ----
+class MemoryPubSub:
+    """Un seul process : publish() livre directement aux connexions locales."""
+
+    def __init__(self):
+        self._deliver = None
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, channel: str, message: dict):
+        if self._deliver is not None:
+            self._deliver(channel, message)
+
+
+class RedisPubSub:
+    """
+    Relais entre les replicas de l'API : chaque replica publie sur Redis et
+    écoute tous les canaux (psubscribe), puis ne livre qu'à ses propres
+    connexions. N'importe quel objet avec les mêmes méthodes (ex : un faux
+    Redis local dans les tests) peut le remplacer via set_backend().
+    """
+
+    def __init__(self, url: str, prefix: str = "spotshare:rt:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("REALTIME_URL défini mais le paquet 'redis' n'est pas installé")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._thread = None
+
+    def start(self, deliver):
+        if self._thread is not None:
+            return
+
+        def listen():
+            while True:
+                try:
+                    pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.psubscribe(self.prefix + "*")
+                    for item in pubsub.listen():
+                        channel = item["channel"].decode("utf-8")[len(self.prefix):]
+                        deliver(channel, json.loads(item["data"]))
+                except Exception as e:
+                    print(f"⚠️ Pub/sub Redis interrompu, reconnexion : {e}")
+                    time.sleep(1)
+
+        self._thread = threading.Thread(target=listen, name="realtime-redis", daemon=True)
+        self._thread.start()
+
+    def publish(self, channel: str, message: dict):
+        self.client.publish(self.prefix + channel, json.dumps(message))
+
+
+backend = RedisPubSub(REALTIME_URL) if REALTIME_URL else MemoryPubSub()
+
+
+def set_backend(new_backend):
+    global backend
+    backend = new_backend
+    backend.start(hub.deliver)
+
+
+def start_realtime():
+    """Au démarrage (lifespan) : branche le backend sur le hub local."""
+    backend.start(hub.deliver)
+
+
+# ---- API utilisée par les routers ----
+def publish(channel: str, message: dict):
+    """
+    À appeler après le commit. N'échoue jamais : l'écriture est faite, les
+    clients rattrapent un message manqué en relisant l'historique.
+    """
+    hub.count("published")
+    try:
+        backend.publish(channel, jsonable_encoder(message))
+    except Exception as e:
+        hub.count("publish_errors")
+        print(f"⚠️ Publication temps réel impossible sur {channel} : {e}")
+
+
+def get_stats() -> dict:
+    return {**hub.get_stats(), "backend": type(backend).__name__}
@@ -0,0 +1,180 @@
+# routers/assets.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+import database
+import models
+import storage
+from .auth import get_current_user
+
+router = APIRouter(tags=["Assets"])
+
+
+# ---- Configuration ----
+ASSET_DELETE_WORKERS = int(os.getenv("ASSET_DELETE_WORKERS", "4"))          # appels parallèles au stockage
+ASSET_DELETE_MAX_ATTEMPTS = int(os.getenv("ASSET_DELETE_MAX_ATTEMPTS", "5"))
+ASSET_DELETE_RETRY_DELAY = int(os.getenv("ASSET_DELETE_RETRY_DELAY", "30"))  # secondes, doublé à chaque échec
+ASSET_SWEEP_INTERVAL = int(os.getenv("ASSET_SWEEP_INTERVAL", "60"))          # rattrapage (crash, replica tombé...)
+ASSET_DELETE_LEASE = int(os.getenv("ASSET_DELETE_LEASE", "300"))             # s : lignes réservées par un process
+
+_executor = ThreadPoolExecutor(max_workers=ASSET_DELETE_WORKERS, thread_name_prefix="asset-delete")
+_drain_lock = threading.Lock()
+
+
+# 🔧 Côté requête (pas de commit : la ligne part avec la transaction qui supprime le post)
+def enqueue_asset_deletion(db: Session, cloud_id: str, resource_type: str = "image"):
+    db.add(models.AssetDeletion(cloud_id=cloud_id, resource_type=resource_type, status="PENDING"))
+
+
+def kick_asset_deletions():
+    """À appeler après le commit : vide l'outbox en arrière-plan."""
+    # Thread à part : process_asset_deletions attend des lots soumis à _executor
+    threading.Thread(target=process_asset_deletions, daemon=True).start()
+
+
+# ---- Traitement de l'outbox ----
+def process_asset_deletions() -> int:
+    """
+    Supprime les fichiers en attente par lots (storage.DELETE_BATCH_SIZE ids),
+    au plus ASSET_DELETE_WORKERS lots en parallèle. Renvoie le nb de fichiers supprimés.
+    Si un traitement est déjà en cours dans ce process, on le laisse faire ;
+    entre replicas, les lignes sont réservées en base (_load_due_batches).
+    """
+    if not _drain_lock.acquire(blocking=False):
+        return 0
+
+    deleted = 0
+    try:
+        while True:
+            batches = _load_due_batches()
+            if not batches:
+                return deleted
+
+            futures = [
+                (ids, _executor.submit(storage.backend.delete_many, [cloud_id for _, cloud_id in ids], resource_type))
+                for resource_type, ids in batches
+            ]
+            for ids, future in futures:
+                try:
+                    future.result()
+                    _mark_done([deletion_id for deletion_id, _ in ids])
+                    deleted += len(ids)
+                except Exception as e:
+                    print(f"⚠️ Erreur suppression stockage ({len(ids)} fichiers) : {e}")
+                    _mark_failed([deletion_id for deletion_id, _ in ids], str(e))
+    finally:
+        _drain_lock.release()
+
+
+def _load_due_batches() -> list:
+    """
+    [(resource_type, [(deletion_id, cloud_id), ...]), ...] prêts à être traités.
+    Les lignes sont réservées avant l'appel au stockage : FOR UPDATE SKIP LOCKED
+    (un autre replica qui réserve en même temps passe aux suivantes), puis
+    next_attempt_at repoussé de ASSET_DELETE_LEASE s. Si le process meurt avant
+    _mark_done / _mark_failed, la ligne redevient due à la fin du bail.
+    """
+    db = database.SessionLocal()
+    try:
+        now = datetime.now(timezone.utc)
+        rows = (
+            db.query(models.AssetDeletion.deletion_id, models.AssetDeletion.cloud_id, models.AssetDeletion.resource_type)
+            .filter(
+                models.AssetDeletion.status == "PENDING",
+                models.AssetDeletion.next_attempt_at <= now,
+            )
+            .order_by(models.AssetDeletion.deletion_id)
+            .limit(storage.DELETE_BATCH_SIZE * ASSET_DELETE_WORKERS)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if rows:
+            db.query(models.AssetDeletion).filter(
+                models.AssetDeletion.deletion_id.in_([row.deletion_id for row in rows])
+            ).update(
+                {"next_attempt_at": now + timedelta(seconds=ASSET_DELETE_LEASE)},
+                synchronize_session=False,
+            )
+        db.commit()
+    finally:
+        db.close()
+
+    by_type = {}
+    for deletion_id, cloud_id, resource_type in rows:
+        by_type.setdefault(resource_type, []).append((deletion_id, cloud_id))
+
+    batches = []
+    for resource_type, ids in by_type.items():
+        for i in range(0, len(ids), storage.DELETE_BATCH_SIZE):
+            batches.append((resource_type, ids[i:i + storage.DELETE_BATCH_SIZE]))
+    return batches
+
+
+def _mark_done(deletion_ids: list[int]):
+    db = database.SessionLocal()
+    try:
+        db.query(models.AssetDeletion).filter(
+            models.AssetDeletion.deletion_id.in_(deletion_ids)
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _mark_failed(deletion_ids: list[int], error: str):
+    db = database.SessionLocal()
+    try:
+        now = datetime.now(timezone.utc)
+        rows = db.query(models.AssetDeletion).filter(models.AssetDeletion.deletion_id.in_(deletion_ids)).all()
+        for row in rows:
+            row.attempts += 1
+            row.error_message = error[:1000]
+            row.last_modification_date = now
+            if row.attempts >= ASSET_DELETE_MAX_ATTEMPTS:
+                row.status = "FAILED"  # gardé pour inspection / relance manuelle
+            else:
+                row.next_attempt_at = now + timedelta(seconds=ASSET_DELETE_RETRY_DELAY * 2 ** (row.attempts - 1))
+        db.commit()
+    finally:
+        db.close()
+
+
+def start_asset_sweeper():
+    """
+    Thread de fond qui repasse régulièrement sur l'outbox : retries, et
+    lignes laissées par un process qui a planté avant de les traiter.
+    """
+    def loop():
+        while True:
+            try:
+                process_asset_deletions()
+            except Exception as e:
+                print(f"⚠️ Erreur balayage asset_deletions : {e}")
+            time.sleep(ASSET_SWEEP_INTERVAL)
+
+    threading.Thread(target=loop, name="asset-sweeper", daemon=True).start()
+
+
+# ============================================================
+# ADMIN : VIDER L'OUTBOX / RELANCER LES ÉCHECS
+# ============================================================
+@router.post("/admin/assets/cleanup")
+def cleanup_assets(
+    retry_failed: bool = False,
+    db: Session = Depends(database.get_db),
+    _current_user: models.User = Depends(get_current_user),
+):
+    if retry_failed:
+        db.query(models.AssetDeletion).filter_by(status="FAILED").update(
+            {"status": "PENDING", "attempts": 0, "next_attempt_at": datetime.now(timezone.utc)},
+            synchronize_session=False,
+        )
+        db.commit()
+
+    deleted = process_asset_deletions()
+    remaining = db.query(models.AssetDeletion).count()
+    return {"deleted": deleted, "remaining": remaining}
@@ -1,13 +1,18 @@
 # routers/auth.py
+from datetime import date, datetime
 from fastapi import APIRouter, Depends, HTTPException, Form, UploadFile, File
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel, EmailStr
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
 from jose import JWTError, jwt
-from database import get_db
+from database import get_async_read_db, get_db
 import cloudinary
 import cloudinary.uploader
 import os
+import cache
 import database
 import models
 import password as auth  # ton fichier auth.py (hash_password, create_access_token, etc.)
@@ -33,6 +38,68 @@ class LoginRequest(BaseModel):
     password: str
 
 
+class Principal(BaseModel):
+    """
+    Utilisateur connecté tel que décrit par le token signé (sans passer par la BDD).
+    """
+    user_id: int
+    username: str | None = None
+
+
+# ---- Cache des utilisateurs authentifiés ----
+# Évite le SELECT sur users à chaque requête. Avec CACHE_URL, cache partagé
+# (Redis) : invalidate_principal() vaut aussitôt pour tous les replicas. Sans
+# CACHE_URL (un seul replica), cache du process.
+# PRINCIPAL_CACHE_TTL borne le délai de prise en compte d'un changement fait
+# sans invalidate_principal() (SQL direct, script...) ou pendant une panne de
+# Redis (invalidation perdue, lectures servies par la base) : 30 s par défaut.
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+_principal_cache = cache.backend if cache.CACHE_URL else cache.MemoryCache(
+    max_entries=int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+)
+
+# ADMIN_USER_IDS=1,42 : comptes autorisés sur les opérations d'administration lourdes
+ADMIN_USER_IDS = {int(u) for u in os.getenv("ADMIN_USER_IDS", "").split(",") if u.strip()}
+
+# AUTH_TRUST_CLAIMS=1 : les endpoints en lecture seule (get_current_principal)
+# font confiance au token signé et ne touchent pas du tout à la table users.
+TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_CLAIMS", "0") == "1"
+
+# Jamais de hash de mot de passe dans le cache (rechargé depuis la base si lu)
+_USER_COLUMNS = [attr.key for attr in inspect(models.User).column_attrs if attr.key != "password_hash"]
+_DATE_COLUMNS = {
+    col.key: col.type.python_type
+    for col in models.User.__table__.columns
+    if col.type.python_type in (date, datetime)
+}
+
+
+def _to_cache(user) -> dict:
+    """Colonnes de l'utilisateur en JSON (le backend partagé stocke du JSON)."""
+    return jsonable_encoder({col: getattr(user, col) for col in _USER_COLUMNS})
+
+
+def _from_cache(values: dict) -> dict:
+    """Inverse de _to_cache : dates ISO -> date / datetime."""
+    values = dict(values)
+    for col, kind in _DATE_COLUMNS.items():
+        if isinstance(values.get(col), str):
+            values[col] = kind.fromisoformat(values[col])
+    return values
+
+
+def invalidate_principal(user_id: int):
+    """À appeler quand la ligne users change (profil, avatar, désactivation...)."""
+    cache.safe_invalidate(_principal_cache, [f"principal:{user_id}"])
+
+
+def _decode_token(token: str) -> dict:
+    try:
+        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+        int(payload.get("sub"))
+    except (JWTError, TypeError, ValueError):
+        raise HTTPException(status_code=401, detail="Token invalide")
+    return payload
 
 
 def get_current_user(
@@ -42,19 +109,61 @@ def get_current_user(
     """
     Dépendance à réutiliser partout pour récupérer l'utilisateur connecté.
     """
-    try:
-        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-        user_id = int(payload.get("sub"))
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Token invalide "+token)
+    user_id = int(_decode_token(token)["sub"])
+    database.set_request_user(user_id)
+    key = f"principal:{user_id}"
+
+    values = cache.safe_get(_principal_cache, key)
+    if values is not None:
+        # On rattache une copie à la session de la requête, sans SELECT
+        user = models.User(**_from_cache(values))
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
 
     user = db.query(models.User).filter(models.User.user_id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
 
+    cache.safe_set(_principal_cache, key, _to_cache(user), PRINCIPAL_CACHE_TTL, [key])
     return user
 
 
+def get_admin_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+    """Comme get_current_user, réservé aux comptes de ADMIN_USER_IDS."""
+    if current_user.user_id not in ADMIN_USER_IDS:
+        raise HTTPException(status_code=403, detail="Réservé aux administrateurs")
+    return current_user
+
+
+async def get_current_principal(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_read_db),
+) -> Principal:
+    """
+    Variante pour les endpoints en lecture seule qui n'ont besoin que de l'id
+    (et du pseudo). Avec AUTH_TRUST_CLAIMS=1, aucune requête SQL.
+    Async : ne bloque pas de thread, même sur un cache miss.
+    """
+    payload = _decode_token(token)
+    user_id = int(payload["sub"])
+    await database.aset_request_user(user_id)
+    if TRUST_TOKEN_CLAIMS:
+        return Principal(user_id=user_id, username=payload.get("username"))
+
+    key = f"principal:{user_id}"
+    # Redis (CACHE_URL) : appel bloquant, passé au threadpool par cache.aget / aset
+    values = await cache.aget(_principal_cache, key)
+    if values is None:
+        res = await db.execute(select(models.User).where(models.User.user_id == user_id))
+        user = res.scalar_one_or_none()
+        if not user:
+            raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
+        values = _to_cache(user)
+        await cache.aset(_principal_cache, key, values, PRINCIPAL_CACHE_TTL, [key])
+
+    return Principal(user_id=values["user_id"], username=values["username"])
+
+
 @router.post("/register")
 def register(
     email: str = Form(...),
@@ -88,24 +197,20 @@ def register(
         user.bio = bio
         db.commit()
         
+    avatar_job_id = None
     if imgFile is not None:
-        try:
-            print("Upload image vers Cloudinary:", imgFile.filename)
-            upload_result = cloudinary.uploader.upload(
-                imgFile.file,
-                folder=f"user_{user.user_id}/profile/",
-                unique_filename=True,
-                overwrite=True
-            )
-            user.profile_picture = upload_result["secure_url"]
-            db.commit()
-            print("✅ Upload OK")
-        except Exception as e:
-            import traceback
-            traceback.print_exc()  # <- affiche l'erreur complète
-            raise HTTPException(status_code=500, detail=f"Erreur upload Cloudinary : {e}")
+        # Import local : routers.uploads dépend déjà de ce module
+        from .uploads import spool_upload, submit_upload
+
+        job = spool_upload(
+            db, imgFile, user.user_id, "AVATAR",
+            folder=f"user_{user.user_id}/profile/", target_id=user.user_id, resource_type="image",
+        )
+        db.commit()
+        submit_upload(job.job_id)
+        avatar_job_id = job.job_id
     
-    return {"message": "Utilisateur créé avec succès", "id": user.user_id}
+    return {"message": "Utilisateur créé avec succès", "id": user.user_id, "avatar_job_id": avatar_job_id}
 
 
 @router.post("/login")
@@ -118,7 +223,7 @@ def login(req: LoginRequest, db: Session = Depends(get_db)):
     if not auth.verify_password(req.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Mot de passe incorrect")
 
-    token = auth.create_access_token({"sub": str(user.user_id)})
+    token = auth.create_access_token({"sub": str(user.user_id), "username": user.username})
 
     return {
         "access_token": token,
@@ -1,55 +1,116 @@
 # routers/comments.py
 
-from fastapi import APIRouter, Depends, HTTPException, Form
+from fastapi import APIRouter, Depends, HTTPException, Form, Response
 from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, text
 from datetime import datetime, timezone
 from .notifications import create_notification
+from .stats import bump_post_stat
 
 import database
 import models
-from .auth import get_current_user
+import pagination
+from .auth import Principal, get_current_principal, get_current_user
 
 router = APIRouter(tags=["Comments"])
 
 
+# 🔧 Likes + réponses d'une liste de commentaires : 2 requêtes groupées,
+# quel que soit le nombre de commentaires
+def _attach_comment_stats(db: Session, comments: list, me: int) -> list:
+    ids = [c["comment_id"] for c in comments]
+    if not ids:
+        return comments
+
+    likes_sql = text("""
+        SELECT comment_id,
+               COUNT(*) AS likes_count,
+               MAX(user_id = :me) AS is_liked
+        FROM comment_likes
+        WHERE comment_id IN :ids
+        GROUP BY comment_id
+    """).bindparams(bindparam("ids", expanding=True))
+    likes = {r["comment_id"]: r for r in db.execute(likes_sql, {"me": me, "ids": ids}).mappings()}
+
+    replies_sql = text("""
+        SELECT parent_comment_id, COUNT(*) AS replies_count
+        FROM comments
+        WHERE parent_comment_id IN :ids
+        GROUP BY parent_comment_id
+    """).bindparams(bindparam("ids", expanding=True))
+    replies = {r["parent_comment_id"]: r["replies_count"] for r in db.execute(replies_sql, {"ids": ids}).mappings()}
+
+    results = []
+    for c in comments:
+        like = likes.get(c["comment_id"])
+        results.append({
+            **c,
+            "likes_count": like["likes_count"] if like else 0,
+            "is_liked": bool(like["is_liked"]) if like else False,
+            "replies_count": replies.get(c["comment_id"], 0),
+        })
+    return results
+
+
 @router.get("/posts/{post_id}/comments")
 def list_comments(
+    response: Response,
     post_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user), 
+    threaded: bool = False,
+    parent_comment_id: int | None = None,
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    db: Session = Depends(database.get_read_db),
+    current_user: Principal = Depends(get_current_principal), 
 ):
-    # On fait une jointure entre Comment et User pour récupérer pseudo + avatar
-    results = (
-        db.query(models.Comment, models.User)
-        .join(models.User, models.Comment.user_id == models.User.user_id)
-        .filter(models.Comment.post_id == post_id)
-        .order_by(models.Comment.creation_date.asc())
-        .all()
-    )
+    """
+    - par défaut : tous les commentaires du post à plat (ancien comportement)
+    - threaded=true : commentaires de premier niveau, page par page
+    - parent_comment_id=X : réponses au commentaire X, page par page
+    """
+    paged = threaded or parent_comment_id is not None
+
+    if not paged:
+        thread_filter, after, after_params, limit_sql = "", "", {}, ""
+    else:
+        limit = pagination.clamp_limit(limit)
+        if parent_comment_id is None:
+            thread_filter = "AND c.parent_comment_id IS NULL"
+        else:
+            thread_filter = "AND c.parent_comment_id = :parent"
+        after, after_params = pagination.keyset_filter(cursor, ["c.creation_date", "c.comment_id"], order="ASC")
+        limit_sql = "LIMIT :limit"
 
-    comments_list = []
-    for comment, user in results:
-        likes_count = db.query(models.CommentLike).filter(models.CommentLike.comment_id == comment.comment_id).count()
-        
-        is_liked = db.query(models.CommentLike).filter(
-            models.CommentLike.comment_id == comment.comment_id,
-            models.CommentLike.user_id == current_user.user_id
-        ).first() is not None
-
-        comments_list.append({
-            "comment_id": comment.comment_id,
-            "post_id": comment.post_id,
-            "user_id": comment.user_id,
-            "content": comment.content,
-            "created_at": comment.creation_date,
-            "username": user.username,
-            "profile_picture": user.profile_picture,
-            "parent_comment_id": comment.parent_comment_id, # AJOUT CRUCIAL
-            "likes_count": likes_count,
-            "is_liked": is_liked
-        })
-    
-    return comments_list
+    # On fait une jointure entre Comment et User pour récupérer pseudo + avatar
+    sql = text(f"""
+        SELECT
+            c.comment_id,
+            c.post_id,
+            c.user_id,
+            c.content,
+            c.creation_date AS created_at,
+            u.username,
+            u.profile_picture,
+            c.parent_comment_id
+        FROM comments c
+        JOIN users u ON u.user_id = c.user_id
+        WHERE c.post_id = :pid
+        {thread_filter}
+        {after}
+        ORDER BY c.creation_date ASC, c.comment_id ASC
+        {limit_sql}
+    """)
+    rows = db.execute(sql, {
+        "pid": post_id,
+        "parent": parent_comment_id,
+        "limit": limit + 1,
+        **after_params,
+    }).mappings().all()
+
+    if paged:
+        rows = pagination.paginate(response, rows, limit, ["created_at", "comment_id"])
+
+    return _attach_comment_stats(db, [dict(r) for r in rows], current_user.user_id)
 
 
 @router.post("/posts/{post_id}/comments")
@@ -80,6 +141,7 @@ def create_comment(
         last_modified_by=current_user.user_id,
     )
     db.add(comment)
+    bump_post_stat(db, post_id, "comments_count", 1)
     db.commit()
     db.refresh(comment)
     
@@ -122,6 +184,7 @@ def delete_comment(
         raise HTTPException(403, "Tu ne peux supprimer que tes commentaires")
 
     db.delete(comment)
+    bump_post_stat(db, comment.post_id, "comments_count", -1)
     db.commit()
 
     return {"message": "Commentaire supprimé"}
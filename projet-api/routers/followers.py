@@ -1,17 +1,60 @@
 # routers/followers.py
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 from datetime import datetime, timezone
 
+import cache
 import database
 import models
+import pagination
 from .auth import get_current_user
 from .notifications import create_notification
+from .stats import bump_user_stat
+from .timeline import sync_author_in_timeline
 
 router = APIRouter(tags=["Followers"])
 
+# ============================================================
+# HELPER : RELATIONS AVEC UNE LISTE D'UTILISATEURS
+# ============================================================
+def get_follow_relations(db: Session, me: int, user_ids: list[int]) -> dict:
+    """
+    Statut de suivi (ACCEPTED) entre `me` et chaque utilisateur de la liste,
+    dans les deux sens, en une seule requête.
+    Renvoie {user_id: {"is_following": bool, "follows_me": bool}}.
+    """
+    relations = {uid: {"is_following": False, "follows_me": False} for uid in user_ids}
+    if not relations:
+        return relations
+
+    sql = text("""
+        SELECT user_id AS other_id, 1 AS is_following
+        FROM followers
+        WHERE follower_user_id = :me AND status = 'ACCEPTED' AND user_id IN :ids
+
+        UNION ALL
+
+        SELECT follower_user_id AS other_id, 0 AS is_following
+        FROM followers
+        WHERE user_id = :me AND status = 'ACCEPTED' AND follower_user_id IN :ids
+    """).bindparams(bindparam("ids", expanding=True))
+
+    rows = db.execute(sql, {"me": me, "ids": list(relations)}).mappings().all()
+    for row in rows:
+        key = "is_following" if row["is_following"] else "follows_me"
+        relations[row["other_id"]][key] = True
+
+    return relations
+
+
+def _bump_follow_counts(db: Session, user_id: int, follower_id: int, delta: int):
+    """Un abonnement ACCEPTED apparaît (+1) ou disparaît (-1)."""
+    bump_user_stat(db, user_id, "followers_count", delta)
+    bump_user_stat(db, follower_id, "following_count", delta)
+
+
 # ============================================================
 # HELPER : GÉRER L'AMITIÉ AUTOMATIQUE
 # ============================================================
@@ -122,7 +165,15 @@ def follow_user(
         rel.last_modified_by = current_user.user_id
         rel.last_modification_date = datetime.now(timezone.utc)
 
+    if status == "ACCEPTED":
+        db.flush()
+        sync_author_in_timeline(db, current_user.user_id, user_id)
+        _bump_follow_counts(db, user_id, current_user.user_id, 1)
+    else:
+        bump_user_stat(db, user_id, "pending_follow_requests_count", 1)
+
     db.commit()
+    cache.invalidate(f"user:{user_id}", f"user:{current_user.user_id}")
     # 🔔 notif au user suivi
     if user_id != current_user.user_id:
         txt = "a demandé à vous suivre" if status == "PENDING" else "a commencé à vous suivre"
@@ -134,6 +185,7 @@ def follow_user(
             related_id=current_user.user_id,
             related_table="users",
             creator_id=current_user.user_id,
+            coalesce=status == "ACCEPTED",  # une demande en attente n'est pas fusionnée avec les nouveaux abonnés
         )
     
     if status == "PENDING":
@@ -198,8 +250,13 @@ def accept_follower_request(
     f.status = "ACCEPTED"
     f.last_modified_by = current_user.user_id
     f.last_modification_date = datetime.now(timezone.utc)
+    db.flush()
+    sync_author_in_timeline(db, follower_id, current_user.user_id)
+    _bump_follow_counts(db, current_user.user_id, follower_id, 1)
+    bump_user_stat(db, current_user.user_id, "pending_follow_requests_count", -1)
 
     db.commit()
+    cache.invalidate(f"user:{current_user.user_id}", f"user:{follower_id}")
     return {"message": "Abonné accepté"}
 
 
@@ -224,6 +281,7 @@ def reject_follower_request(
     f.status = "REJECTED"
     f.last_modified_by = current_user.user_id
     f.last_modification_date = datetime.now(timezone.utc)
+    bump_user_stat(db, current_user.user_id, "pending_follow_requests_count", -1)
 
     db.commit()
     return {"message": "Demande rejetée"}
@@ -234,20 +292,29 @@ def reject_follower_request(
 # ============================================================
 @router.get("/followers")
 def list_followers(
+    response: Response,
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user),
 ):
     """
-    Les gens qui ME suivent (status = ACCEPTED).
+    Les gens qui ME suivent (status = ACCEPTED), triés par id (curseur = user_id).
     """
-    sql = text("""
+    limit = pagination.clamp_limit(limit)
+    after, after_params = pagination.keyset_filter(cursor, ["f.follower_user_id"], order="ASC")
+
+    sql = text(f"""
         SELECT u.user_id, u.username, u.profile_picture
         FROM followers f
         JOIN users u ON u.user_id = f.follower_user_id
-        WHERE f.user_id = :uid AND f.status = 'ACCEPTED';
+        WHERE f.user_id = :uid AND f.status = 'ACCEPTED'
+        {after}
+        ORDER BY f.follower_user_id ASC
+        LIMIT :limit;
     """)
-    res = db.execute(sql, {"uid": current_user.user_id}).mappings().all()
-    return list(res)
+    res = db.execute(sql, {"uid": current_user.user_id, "limit": limit + 1, **after_params}).mappings().all()
+    return pagination.paginate(response, res, limit, ["user_id"])
 
 
 # ============================================================
@@ -255,20 +322,29 @@ def list_followers(
 # ============================================================
 @router.get("/following")
 def list_following(
+    response: Response,
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user),
 ):
     """
-    Les gens que JE suis (status = ACCEPTED).
+    Les gens que JE suis (status = ACCEPTED), triés par id (curseur = user_id).
     """
-    sql = text("""
+    limit = pagination.clamp_limit(limit)
+    after, after_params = pagination.keyset_filter(cursor, ["f.user_id"], order="ASC")
+
+    sql = text(f"""
         SELECT u.user_id, u.username, u.profile_picture
         FROM followers f
         JOIN users u ON u.user_id = f.user_id
-        WHERE f.follower_user_id = :uid AND f.status = 'ACCEPTED';
+        WHERE f.follower_user_id = :uid AND f.status = 'ACCEPTED'
+        {after}
+        ORDER BY f.user_id ASC
+        LIMIT :limit;
     """)
-    res = db.execute(sql, {"uid": current_user.user_id}).mappings().all()
-    return list(res)
+    res = db.execute(sql, {"uid": current_user.user_id, "limit": limit + 1, **after_params}).mappings().all()
+    return pagination.paginate(response, res, limit, ["user_id"])
 
 
 # ============================================================
@@ -291,7 +367,15 @@ def unfollow_user(
     if not f:
         raise HTTPException(status_code=404, detail="Tu ne suis pas cet utilisateur")
 
+    if f.status == "ACCEPTED":
+        _bump_follow_counts(db, user_id, current_user.user_id, -1)
+    elif f.status == "PENDING":
+        # Demande annulée avant réponse
+        bump_user_stat(db, user_id, "pending_follow_requests_count", -1)
     db.delete(f)
+    db.flush()
+    sync_author_in_timeline(db, current_user.user_id, user_id)
     db.commit()
+    cache.invalidate(f"user:{user_id}", f"user:{current_user.user_id}")
 
     return {"message": "Désabonnement effectué"}
@@ -5,9 +5,12 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from datetime import datetime
 from database import get_db
+import cache
 import models
 from .auth import get_current_user
 from .notifications import create_notification
+from .stats import bump_user_stat
+from .timeline import sync_author_in_timeline
 
 router = APIRouter(tags=["Friends"])
 
@@ -97,6 +100,7 @@ def send_friend_request(
         created_by=current_user.user_id,
     )
     db.add(fr)
+    bump_user_stat(db, target_user_id, "pending_friend_requests_count", 1)
     db.commit()
 
     # Historique
@@ -182,8 +186,17 @@ def accept_friend_request(
         changed_by=current_user.user_id
     )
     db.add(hist)
+    db.flush()
+
+    # Chacun voit maintenant les posts FRIENDS de l'autre
+    sync_author_in_timeline(db, current_user.user_id, friend_id)
+    sync_author_in_timeline(db, friend_id, current_user.user_id)
+    bump_user_stat(db, current_user.user_id, "friends_count", 1)
+    bump_user_stat(db, friend_id, "friends_count", 1)
+    bump_user_stat(db, current_user.user_id, "pending_friend_requests_count", -1)
 
     db.commit()
+    cache.invalidate(f"user:{current_user.user_id}", f"user:{friend_id}")
     # 🔔 notif à celui qui a envoyé la demande
     create_notification(
         db=db,
@@ -226,6 +239,7 @@ def reject_friend_request(
         changed_by=current_user.user_id
     )
     db.add(hist)
+    bump_user_stat(db, current_user.user_id, "pending_friend_requests_count", -1)
 
     db.commit()
     return {"message": "Demande rejetée"}
@@ -276,7 +290,17 @@ def delete_friend(
     if not fr:
         raise HTTPException(404, "Cette personne n'est pas ton ami")
 
+    if fr.status == "ACCEPTED":
+        bump_user_stat(db, current_user.user_id, "friends_count", -1)
+        bump_user_stat(db, friend_id, "friends_count", -1)
+    elif fr.status == "PENDING":
+        bump_user_stat(db, fr.user_id_friend, "pending_friend_requests_count", -1)
     db.delete(fr)
+    db.flush()
+
+    sync_author_in_timeline(db, current_user.user_id, friend_id)
+    sync_author_in_timeline(db, friend_id, current_user.user_id)
     db.commit()
+    cache.invalidate(f"user:{current_user.user_id}", f"user:{friend_id}")
 
     return {"message": "Ami retiré"}
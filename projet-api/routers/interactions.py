@@ -1,19 +1,161 @@
 # routers/interactions.py
 
+import os
+import threading
+import time
 from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from datetime import datetime, timezone
-from sqlalchemy import text, desc
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import bindparam, text, desc
 
+import cache
 import database
 import models
-from .auth import get_current_user
+from .auth import Principal, get_current_principal, get_current_user
+from .stats import bump_post_stat, bump_post_stats_many
 
 router = APIRouter(tags=["Interactions"])
 
 
 VALID_INTERACTIONS = ["VIEW", "LIKE", "SHARE", "SAVE", "COMMENT", "SKIP"]
 
+# ---- Buffer d'écriture (POST /interactions/batch) ----
+INTERACTION_BATCH_MAX = int(os.getenv("INTERACTION_BATCH_MAX", "500"))          # événements par requête
+INTERACTION_FLUSH_SIZE = int(os.getenv("INTERACTION_FLUSH_SIZE", "1000"))       # flush dès N lignes...
+INTERACTION_FLUSH_INTERVAL = float(os.getenv("INTERACTION_FLUSH_INTERVAL", "2"))  # ... ou toutes les N s
+INTERACTION_BUFFER_MAX = int(os.getenv("INTERACTION_BUFFER_MAX", "50000"))      # au-delà : MySQL ne suit plus
+INTERACTION_OVERFLOW_POLICY = os.getenv("INTERACTION_OVERFLOW_POLICY", "drop")   # drop | reject (503)
+INTERACTION_MAX_AGE = timedelta(hours=24)  # horodatage client plus vieux : ramené à maintenant
+
+_buffer = []
+_buffer_lock = threading.Lock()
+_flush_wanted = threading.Event()
+_flush_lock = threading.Lock()
+buffer_stats = {
+    "accepted": 0, "dropped": 0, "rejected": 0, "flushed": 0,
+    "orphaned": 0,     # post supprimé entre la mise en buffer et le flush
+    "dead_rows": 0,    # refusées par la base même seules : abandonnées
+    "flush_errors": 0, "last_flush_seconds": 0.0,
+}
+
+
+class InteractionEvent(BaseModel):
+    post_id: int
+    interaction_type: str
+    duration_seconds: int | None = None
+    occurred_at: datetime | None = None  # heure de l'événement côté app
+
+
+# 🔧 Côté requête
+def buffer_interactions(rows: list[dict]) -> int:
+    """
+    Ajoute les lignes au buffer. Renvoie le nb de lignes écartées faute de place
+    (politique "drop") ; lève une 503 avec la politique "reject".
+    """
+    with _buffer_lock:
+        room = INTERACTION_BUFFER_MAX - len(_buffer)
+        if len(rows) > room and INTERACTION_OVERFLOW_POLICY == "reject":
+            buffer_stats["rejected"] += len(rows)
+            raise HTTPException(503, "Trop d'interactions en attente, réessaie plus tard", headers={"Retry-After": "5"})
+        kept = rows[:max(room, 0)]
+        _buffer.extend(kept)
+        buffer_stats["accepted"] += len(kept)
+        buffer_stats["dropped"] += len(rows) - len(kept)
+        size = len(_buffer)
+
+    if size >= INTERACTION_FLUSH_SIZE:
+        _flush_wanted.set()
+    return len(rows) - len(kept)
+
+
+# ---- Flush ----
+def _write_interactions(rows: list[dict]):
+    """
+    Une transaction : re-filtre les posts encore présents (un post supprimé
+    depuis la mise en buffer ferait échouer la FK ; FOR SHARE bloque sa
+    suppression jusqu'au commit), puis un INSERT multi-lignes pour
+    user_interactions + un pour les vues de post_stats.
+    """
+    db = database.SessionLocal()
+    try:
+        lock = " FOR SHARE" if db.get_bind().dialect.name == "mysql" else ""
+        sql = text(f"SELECT post_id FROM posts WHERE post_id IN :ids{lock}").bindparams(bindparam("ids", expanding=True))
+        existing = set(db.execute(sql, {"ids": list({row["post_id"] for row in rows})}).scalars().all())
+        kept = [row for row in rows if row["post_id"] in existing]
+
+        views = {}
+        for row in kept:
+            if row["interaction_type"] == "VIEW":
+                views[row["post_id"]] = views.get(row["post_id"], 0) + 1
+
+        if kept:
+            db.execute(models.UserInteraction.__table__.insert(), kept)
+            bump_post_stats_many(db, "views_count", views)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    if len(kept) < len(rows):
+        with _buffer_lock:
+            buffer_stats["orphaned"] += len(rows) - len(kept)
+
+
+def flush_interactions() -> int:
+    """
+    Écrit le contenu du buffer (voir _write_interactions). Une ligne refusée
+    par la base est isolée puis abandonnée (database.write_isolating) ; si la
+    base est injoignable, les lignes non écrites sont remises en fin de buffer
+    (dans la limite de INTERACTION_BUFFER_MAX).
+    """
+    with _flush_lock:
+        with _buffer_lock:
+            rows = _buffer[:]
+            _buffer.clear()
+        if not rows:
+            return 0
+
+        start = time.perf_counter()
+        dead, unwritten, error = database.write_isolating(_write_interactions, rows)
+        if dead:
+            print(f"⚠️ {len(dead)} interaction(s) refusée(s) par la base, abandonnée(s)")
+        if error is not None:
+            print(f"⚠️ Erreur écriture interactions ({len(unwritten)} lignes) : {error}")
+
+        with _buffer_lock:
+            if unwritten:
+                requeued = unwritten[:max(INTERACTION_BUFFER_MAX - len(_buffer), 0)]
+                _buffer.extend(requeued)
+                buffer_stats["dropped"] += len(unwritten) - len(requeued)
+                buffer_stats["flush_errors"] += 1
+            buffer_stats["dead_rows"] += len(dead)
+            written = len(rows) - len(dead) - len(unwritten)
+            buffer_stats["flushed"] += written
+            buffer_stats["last_flush_seconds"] = round(time.perf_counter() - start, 3)
+        return written
+
+
+def start_interaction_flusher():
+    """Thread de fond : flush toutes les INTERACTION_FLUSH_INTERVAL s, ou dès que le buffer est plein."""
+    def loop():
+        while True:
+            _flush_wanted.wait(INTERACTION_FLUSH_INTERVAL)
+            _flush_wanted.clear()
+            try:
+                flush_interactions()
+            except Exception as e:
+                print(f"⚠️ Erreur flush interactions : {e}")
+
+    threading.Thread(target=loop, name="interaction-flusher", daemon=True).start()
+
+
+def get_buffer_stats() -> dict:
+    with _buffer_lock:
+        return {**buffer_stats, "buffered": len(_buffer), "policy": INTERACTION_OVERFLOW_POLICY}
+
 
 # ============================================================
 # 1. LOGGER UNE INTERACTION
@@ -41,11 +183,66 @@ def log_interaction(
         interaction_date=datetime.now(timezone.utc),
     )
     db.add(interaction)
+    if interaction_type == "VIEW":
+        bump_post_stat(db, post_id, "views_count", 1)
     db.commit()
 
     return {"message": "Interaction enregistrée"}
 
 
+# ============================================================
+# 1 bis. LOGGER UN LOT D'INTERACTIONS (scroll de l'app)
+# ============================================================
+@router.post("/interactions/batch", status_code=202)
+def log_interactions_batch(
+    events: list[InteractionEvent],
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_current_principal),
+):
+    """
+    Jusqu'à INTERACTION_BATCH_MAX événements. Les événements invalides (type
+    inconnu, post inexistant) sont ignorés ; les autres sont écrits en différé
+    par le flusher (quelques secondes au plus).
+    """
+    if len(events) > INTERACTION_BATCH_MAX:
+        raise HTTPException(413, f"{INTERACTION_BATCH_MAX} interactions maximum par lot")
+
+    valid = [e for e in events if e.interaction_type in VALID_INTERACTIONS]
+
+    # Existence des posts : une seule requête pour tout le lot, sur le primaire
+    # (un réplica en retard ferait ignorer les vues d'un post tout juste publié)
+    post_ids = list({e.post_id for e in valid})
+    existing = set()
+    if post_ids:
+        sql = text("SELECT post_id FROM posts WHERE post_id IN :ids").bindparams(bindparam("ids", expanding=True))
+        existing = set(db.execute(sql, {"ids": post_ids}).scalars().all())
+
+    now = datetime.now(timezone.utc)
+    rows = []
+    for e in valid:
+        if e.post_id not in existing:
+            continue
+        occurred_at = e.occurred_at
+        if occurred_at is not None and occurred_at.tzinfo is None:
+            occurred_at = occurred_at.replace(tzinfo=timezone.utc)
+        if occurred_at is None or occurred_at > now or now - occurred_at > INTERACTION_MAX_AGE:
+            occurred_at = now
+        rows.append({
+            "user_id": current_user.user_id,
+            "post_id": e.post_id,
+            "interaction_type": e.interaction_type,
+            "duration_seconds": e.duration_seconds,
+            "interaction_date": occurred_at,
+        })
+
+    dropped = buffer_interactions(rows)
+    return {
+        "accepted": len(rows) - dropped,
+        "ignored": len(events) - len(rows),
+        "dropped": dropped,
+    }
+
+
 # ============================================================
 # 2. VOIR MES DERNIÈRES INTERACTIONS
 # ============================================================
@@ -88,5 +285,19 @@ def post_interactions_stats(
         WHERE post_id = :pid
         GROUP BY interaction_type;
     """)
-    res = db.execute(sql, {"pid": post_id}).mappings().all()
-    return list(res)
+    # Pas d'invalidation ici (une écriture par scroll) : simple TTL court
+    return cache.get_or_set(
+        f"post:{post_id}:interactions",
+        lambda: db.execute(sql, {"pid": post_id}).mappings().all(),
+        ttl=30,
+    )
+
+
+# ============================================================
+# 4. ADMIN : ÉTAT DU BUFFER D'INTERACTIONS
+# ============================================================
+@router.get("/admin/interactions/buffer")
+def interaction_buffer_stats(
+    _current_user: models.User = Depends(get_current_user),
+):
+    return get_buffer_stats()
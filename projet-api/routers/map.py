@@ -1,8 +1,9 @@
 # routers/map.py
-from sqlalchemy import text
-from fastapi import APIRouter, Depends
+from sqlalchemy import text, bindparam
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, get_read_db
+import geo
 import models
 from .auth import get_current_user
 
@@ -10,61 +11,190 @@ router = APIRouter(tags=["Map"])
 
 
 
-def refresh_map_feed(db: Session):
-    # On vide la table
-    db.execute(text("TRUNCATE TABLE map_feed"))
+# Colonnes + SELECT communs à la reconstruction complète et aux mises à jour
+# incrémentales. {table} = table cible, {where} = filtre en plus (post, user...).
+MAP_FEED_INSERT = """
+    INSERT INTO {table} (
+        post_id,
+        user_id,
+        username,
+        profile_picture,
+        latitude,
+        longitude,
+        post_title,
+        post_description,
+        publication_date,
+        preview_image,
+        place_name,
+        city_name,
+        country_code,
+        likes_count,
+        geohash
+    )
+    SELECT 
+        p.post_id,
+        p.user_id,
+        u.username,
+        u.profile_picture,
+        p.latitude,
+        p.longitude,
+        p.post_title,
+        p.post_description,
+        p.publication_date,
+        m.thumbnail_url AS preview_image,
+        pl.place_name,
+        c.city_name,
+        co.country_code,
+        COALESCE(ps.likes_count, 0) AS likes_count,
+        CASE WHEN p.latitude BETWEEN -90 AND 90 AND p.longitude BETWEEN -180 AND 180
+             THEN ST_GeoHash(p.longitude, p.latitude, 12) END AS geohash
+    FROM posts p
+    INNER JOIN users u ON p.user_id = u.user_id
+    LEFT JOIN post_stats ps ON ps.post_id = p.post_id
+    LEFT JOIN user_preferences up ON u.user_id = up.user_id
+    LEFT JOIN media m ON p.post_id = m.post_id 
+        AND m.media_id = (SELECT MIN(media_id) FROM media WHERE post_id = p.post_id AND status = 'READY')
+    LEFT JOIN places pl ON p.place_id = pl.place_id
+    LEFT JOIN cities c ON pl.city_id = c.city_id
+    LEFT JOIN countries co ON c.country_id = co.country_id
+    WHERE p.latitude IS NOT NULL 
+      AND p.longitude IS NOT NULL
+      AND p.privacy = 'PUBLIC'
+      AND (up.show_on_map IS NULL OR up.show_on_map = 1)
+      AND u.is_active_flag = 'Y'
+      {where}
+"""
 
-    # On la remplit à partir des autres tables
-    sql = text("""
-        INSERT INTO map_feed (
-            post_id,
-            user_id,
-            username,
-            profile_picture,
-            latitude,
-            longitude,
-            post_title,
-            post_description,
-            publication_date,
-            preview_image,
-            place_name,
-            city_name,
-            country_code,
-            likes_count
+
+# 🔧 Mises à jour incrémentales (pas de commit : l'appelant commit avec sa transaction)
+def _note_map_feed_change(db: Session, post_id: int | None = None, user_id: int | None = None):
+    """
+    Verrou partagé sur map_feed_refresh jusqu'au commit de l'appelant : une
+    reconstruction attend la fin des écritures en cours avant de démarrer.
+    Pendant une reconstruction, la clé est journalisée dans map_feed_pending
+    pour être rejouée dans la nouvelle table après le RENAME.
+    """
+    started_at = db.execute(
+        text("SELECT started_at FROM map_feed_refresh WHERE refresh_id = 1 FOR SHARE")
+    ).scalar()
+    if started_at is not None:
+        db.execute(
+            text("INSERT INTO map_feed_pending (post_id, user_id) VALUES (:pid, :uid)"),
+            {"pid": post_id, "uid": user_id},
         )
-        SELECT 
-            p.post_id,
-            p.user_id,
-            u.username,
-            u.profile_picture,
-            p.latitude,
-            p.longitude,
-            p.post_title,
-            p.post_description,
-            p.publication_date,
-            m.thumbnail_url AS preview_image,
-            pl.place_name,
-            c.city_name,
-            co.country_code,
-            (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.post_id) AS likes_count
-        FROM posts p
-        INNER JOIN users u ON p.user_id = u.user_id
-        LEFT JOIN user_preferences up ON u.user_id = up.user_id
-        LEFT JOIN media m ON p.post_id = m.post_id 
-            AND m.media_id = (SELECT MIN(media_id) FROM media WHERE post_id = p.post_id)
-        LEFT JOIN places pl ON p.place_id = pl.place_id
-        LEFT JOIN cities c ON pl.city_id = c.city_id
-        LEFT JOIN countries co ON c.country_id = co.country_id
-        WHERE p.latitude IS NOT NULL 
-          AND p.longitude IS NOT NULL
-          AND p.privacy = 'PUBLIC'
-          AND (up.show_on_map IS NULL OR up.show_on_map = 1)
-          AND u.is_active_flag = 'Y'
-        ORDER BY p.publication_date DESC;
+
+
+def upsert_map_feed_post(db: Session, post_id: int):
+    """
+    (Re)calcule la ligne map_feed d'un post : création, ajout de média...
+    Si le post ne doit plus être sur la carte, la ligne disparaît simplement.
+    """
+    _note_map_feed_change(db, post_id=post_id)
+    db.execute(text("DELETE FROM map_feed WHERE post_id = :pid"), {"pid": post_id})
+    db.execute(
+        text(MAP_FEED_INSERT.format(table="map_feed", where="AND p.post_id = :pid")),
+        {"pid": post_id},
+    )
+
+
+def delete_map_feed_post(db: Session, post_id: int):
+    _note_map_feed_change(db, post_id=post_id)
+    db.execute(text("DELETE FROM map_feed WHERE post_id = :pid"), {"pid": post_id})
+
+
+def refresh_map_feed_user(db: Session, user_id: int):
+    """
+    Profil (pseudo, avatar, compte désactivé) ou préférences (show_on_map)
+    modifiés : on recalcule toutes les lignes de cet utilisateur.
+    """
+    _note_map_feed_change(db, user_id=user_id)
+    db.execute(text("DELETE FROM map_feed WHERE user_id = :uid"), {"uid": user_id})
+    db.execute(
+        text(MAP_FEED_INSERT.format(table="map_feed", where="AND p.user_id = :uid")),
+        {"uid": user_id},
+    )
+
+
+def update_map_feed_likes(db: Session, post_id: int):
+    _note_map_feed_change(db, post_id=post_id)
+    sql = text("""
+        UPDATE map_feed mf
+        JOIN post_stats ps ON ps.post_id = mf.post_id
+        SET mf.likes_count = ps.likes_count
+        WHERE mf.post_id = :pid
     """)
-    db.execute(sql)
+    db.execute(sql, {"pid": post_id})
+
+
+def _replay_map_feed_pending(db: Session):
+    """Rejoue dans map_feed les utilisateurs puis les posts journalisés pendant la reconstruction."""
+    pending = db.execute(text("SELECT pending_id, post_id, user_id FROM map_feed_pending")).all()
+    if not pending:
+        return
+
+    for column, ids in (
+        ("user_id", {row.user_id for row in pending if row.user_id is not None}),
+        ("post_id", {row.post_id for row in pending if row.post_id is not None}),
+    ):
+        if not ids:
+            continue
+        params = {"ids": list(ids)}
+        db.execute(text(f"DELETE FROM map_feed WHERE {column} IN :ids").bindparams(bindparam("ids", expanding=True)), params)
+        db.execute(
+            text(MAP_FEED_INSERT.format(table="map_feed", where=f"AND p.{column} IN :ids"))
+            .bindparams(bindparam("ids", expanding=True)),
+            params,
+        )
+
+    db.execute(
+        text("DELETE FROM map_feed_pending WHERE pending_id <= :last"),
+        {"last": max(row.pending_id for row in pending)},
+    )
+    db.commit()
+
+
+def refresh_map_feed(db: Session):
+    """
+    Reconstruction complète (opération admin / hors ligne).
+    On remplit une table fantôme puis on l'échange avec map_feed via un
+    RENAME TABLE atomique : les lecteurs ne voient jamais une table vide.
+    Les écritures incrémentales faites pendant la construction sont
+    journalisées (_note_map_feed_change) puis rejouées après le RENAME,
+    sinon elles seraient perdues avec l'ancienne table.
+    """
+    # Attend les transactions incrémentales en cours (verrou partagé) : tout ce
+    # qui est validé avant est dans l'INSERT ... SELECT, tout ce qui suit est journalisé.
+    # Une reconstruction abandonnée (process tué) n'en bloque pas une autre au-delà d'1 h.
+    db.execute(text("INSERT IGNORE INTO map_feed_refresh (refresh_id, started_at) VALUES (1, NULL)"))
+    claimed = db.execute(text("""
+        UPDATE map_feed_refresh SET started_at = NOW()
+        WHERE refresh_id = 1 AND (started_at IS NULL OR started_at < NOW() - INTERVAL 1 HOUR)
+    """)).rowcount
+    if not claimed:
+        db.rollback()
+        raise HTTPException(409, "Reconstruction de map_feed déjà en cours")
+    db.execute(text("DELETE FROM map_feed_pending"))
     db.commit()
 
+    try:
+        db.execute(text("DROP TABLE IF EXISTS map_feed_shadow"))
+        db.execute(text("CREATE TABLE map_feed_shadow LIKE map_feed"))
+
+        db.execute(text(MAP_FEED_INSERT.format(table="map_feed_shadow", where="")))
+        db.commit()
+
+        # Le RENAME attend les transactions qui ont écrit dans l'ancienne table :
+        # une fois fait, leurs changements sont validés et journalisés.
+        db.execute(text("RENAME TABLE map_feed TO map_feed_old, map_feed_shadow TO map_feed"))
+        db.execute(text("DROP TABLE map_feed_old"))
+        db.commit()
+
+        _replay_map_feed_pending(db)
+    finally:
+        db.rollback()
+        db.execute(text("UPDATE map_feed_refresh SET started_at = NULL WHERE refresh_id = 1"))
+        db.commit()
+
 
 @router.post("/admin/map/refresh")
 def refresh_map(
@@ -76,6 +206,35 @@ def refresh_map(
     refresh_map_feed(db)
     return {"message": "map_feed rafraîchie"}
 
+# Au-delà de ce zoom on renvoie les posts un par un, en dessous des clusters
+CLUSTER_MAX_ZOOM = 14
+MAP_MAX_LIMIT = 500
+
+
+def _scope_filter(scope: str) -> str:
+    if scope == "me":
+        return "AND mf.user_id = :me"
+    if scope == "friends":
+        # Moi + mes amis + les comptes que je suis (map_feed ne contient que du PUBLIC)
+        return """
+            AND (
+                mf.user_id = :me
+                OR mf.user_id IN (
+                    SELECT CASE WHEN f.user_id = :me THEN f.user_id_friend ELSE f.user_id END
+                    FROM friends f
+                    WHERE f.status = 'ACCEPTED' AND (f.user_id = :me OR f.user_id_friend = :me)
+                )
+                OR mf.user_id IN (
+                    SELECT fo.user_id FROM followers fo
+                    WHERE fo.follower_user_id = :me AND fo.status = 'ACCEPTED'
+                )
+            )
+        """
+    if scope == "all":
+        return ""
+    raise HTTPException(400, "Scope invalide (me, friends ou all)")
+
+
 @router.get("/map/posts")
 def get_posts_on_map(
     min_lat: float,
@@ -83,20 +242,93 @@ def get_posts_on_map(
     min_lng: float,
     max_lng: float,
     scope: str = "friends",  # "me", "friends", "all"
-    db: Session = Depends(get_db),
-    _current_user: models.User = Depends(get_current_user),
+    zoom: int | None = None,
+    limit: int = 200,
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user),
 ):
     """
-    Récupère les posts dans une zone (bounding box).
-    Il faudra adapter les filtres selon ta BDD (visibilité, amis, etc.).
+    Récupère les posts dans une zone (bounding box) depuis map_feed.
+    La zone est découpée en préfixes geohash (un range scan chacun sur
+    idx_map_feed_geohash), puis filtrée exactement sur lat / lng.
+    - zoom >= CLUSTER_MAX_ZOOM (ou absent) : liste de posts (max `limit`)
+    - zoom < CLUSTER_MAX_ZOOM : un marqueur par cellule geohash
+      (nombre de posts, barycentre, post le plus récent en aperçu)
     """
-    q = db.query(models.Post).filter(
-        models.Post.latitude >= min_lat,
-        models.Post.latitude <= max_lat,
-        models.Post.longitude >= min_lng,
-        models.Post.longitude <= max_lng,
-    )
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(400, "Bounding box invalide")
+
+    limit = max(1, min(limit, MAP_MAX_LIMIT))
+
+    prefixes = sorted(geo.cover_bbox(min_lat, max_lat, min_lng, max_lng))
+    params = {f"gh_{i}": f"{prefix}%" for i, prefix in enumerate(prefixes)}
+    params.update({
+        "min_lat": min_lat,
+        "max_lat": max_lat,
+        "min_lng": min_lng,
+        "max_lng": max_lng,
+        "me": current_user.user_id,
+        "limit": limit,
+    })
+
+    where = f"""
+        WHERE ({" OR ".join(f"mf.geohash LIKE :gh_{i}" for i in range(len(prefixes)))})
+        AND mf.latitude BETWEEN :min_lat AND :max_lat
+        AND mf.longitude BETWEEN :min_lng AND :max_lng
+        {_scope_filter(scope)}
+    """
+
+    if zoom is None or zoom >= CLUSTER_MAX_ZOOM:
+        sql = text(f"""
+            SELECT mf.*
+            FROM map_feed mf
+            {where}
+            ORDER BY mf.publication_date DESC
+            LIMIT :limit
+        """)
+        return list(db.execute(sql, params).mappings().all())
+
+    # ---- Mode cluster ----
+    params["precision"] = geo.precision_for_zoom(zoom)
+    sql = text(f"""
+        SELECT
+            LEFT(mf.geohash, :precision) AS cell,
+            COUNT(*) AS count,
+            AVG(mf.latitude) AS latitude,
+            AVG(mf.longitude) AS longitude,
+            SUBSTRING_INDEX(
+                GROUP_CONCAT(mf.post_id ORDER BY mf.publication_date DESC), ',', 1
+            ) AS top_post_id
+        FROM map_feed mf
+        {where}
+        GROUP BY cell
+        ORDER BY count DESC
+        LIMIT :limit
+    """)
+    clusters = db.execute(sql, params).mappings().all()
 
-    # TODO: ajouter des filtres selon 'scope' et relations d'amis
+    # Aperçu : une seule requête pour tous les posts "vitrines"
+    top_ids = [int(c["top_post_id"]) for c in clusters]
+    previews = {}
+    if top_ids:
+        rows = db.execute(
+            text("""
+                SELECT post_id, user_id, username, profile_picture, post_title, preview_image
+                FROM map_feed
+                WHERE post_id IN :ids
+            """).bindparams(bindparam("ids", expanding=True)),
+            {"ids": top_ids},
+        ).mappings().all()
+        previews = {r["post_id"]: dict(r) for r in rows}
 
-    return q.all()
+    return [
+        {
+            "type": "cluster",
+            "geohash": c["cell"],
+            "count": c["count"],
+            "latitude": c["latitude"],
+            "longitude": c["longitude"],
+            "top_post": previews.get(int(c["top_post_id"])),
+        }
+        for c in clusters
+    ]
@@ -1,14 +1,20 @@
 # routers/messages.py
 
-from fastapi import APIRouter, Depends, HTTPException, Form
+import asyncio
+import json
+from fastapi import APIRouter, Depends, HTTPException, Form, Response, WebSocket, WebSocketDisconnect
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from datetime import datetime, timezone
 
 import database
 import models
-from .auth import get_current_user
+import pagination
+import realtime
+from .auth import Principal, _decode_token, get_current_principal, get_current_user
 from .notifications import create_notification
+from .stats import bump_user_stat
 
 router = APIRouter(tags=["Messages"])
 
@@ -17,43 +23,206 @@ router = APIRouter(tags=["Messages"])
 # 🔒 MESSAGES PRIVÉS
 # ============================================================
 
-@router.get("/messages/conversations")
-def get_my_conversations(
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
-):
+# ---- Résumé des conversations (table conversations) ----
+def _conversation_key(user_a: int, user_b: int) -> tuple[int, int]:
+    return (user_a, user_b) if user_a < user_b else (user_b, user_a)
+
+
+def _side(user_id: int, partner_id: int) -> str:
+    """Préfixe des colonnes propres à user_id dans la ligne de la paire."""
+    return "min_user" if user_id < partner_id else "max_user"
+
+
+def record_conversation_message(db: Session, pm: models.PrivateMessage) -> bool:
     """
-    Récupère la liste des conversations (dernier message pour chaque contact).
+    Dernier message + non lus du destinataire, en un seul upsert verrouillant
+    la ligne de la paire. Pas de commit ici : l'appelant commit avec le message.
+    Renvoie True si le destinataire a mis la conversation en sourdine.
+    """
+    low, high = _conversation_key(pm.sender_id, pm.receiver_id)
+    side = _side(pm.receiver_id, pm.sender_id)
+
+    # last_message_at avant last_message_id : MySQL applique les affectations dans l'ordre
+    db.execute(text(f"""
+        INSERT INTO conversations (min_user_id, max_user_id, last_message_id, last_message_at,
+                                   {side}_unread_count, creation_date, last_modification_date)
+        VALUES (:low, :high, :mid, :sent_at, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        ON DUPLICATE KEY UPDATE
+            last_message_at = IF(:mid > COALESCE(last_message_id, 0), :sent_at, last_message_at),
+            last_message_id = GREATEST(COALESCE(last_message_id, 0), :mid),
+            {side}_unread_count = {side}_unread_count + 1,
+            last_modification_date = CURRENT_TIMESTAMP
+    """), {"low": low, "high": high, "mid": pm.private_message_id, "sent_at": pm.sent_at})
+
+    muted = db.execute(
+        text(f"SELECT {side}_muted_flag FROM conversations WHERE min_user_id = :low AND max_user_id = :high"),
+        {"low": low, "high": high},
+    ).scalar()
+    return muted == "Y"
+
+
+def _mark_conversation_seen(db: Session, reader_id: int, partner_id: int, count: int):
+    """Retire `count` messages lus des compteurs de reader_id (conversation + badge). Pas de commit ici."""
+    if count <= 0:
+        return
+    bump_user_stat(db, reader_id, "unread_messages_count", -count)
+    low, high = _conversation_key(reader_id, partner_id)
+    side = _side(reader_id, partner_id)
+    db.execute(text(f"""
+        UPDATE conversations
+        SET {side}_unread_count = GREATEST({side}_unread_count - :n, 0),
+            last_modification_date = CURRENT_TIMESTAMP
+        WHERE min_user_id = :low AND max_user_id = :high
+    """), {"n": count, "low": low, "high": high})
+
+
+def reconcile_conversations(db: Session):
+    """
+    Reconstruit conversations depuis private_messages (mise en place sur une base
+    existante, dérive des compteurs). Les flags sourdine / archive sont conservés.
+    L'event ev_reconcile_conversations (init_events.sql) le fait toutes les nuits.
     """
-    # Cette requête SQL récupère le dernier message échangé avec chaque interlocuteur
     sql = text("""
-        WITH LastMsgs AS (
-            SELECT 
-                CASE WHEN sender_id = :uid THEN receiver_id ELSE sender_id END AS partner_id,
-                MAX(sent_at) as max_date
-            FROM private_messages
-            WHERE sender_id = :uid OR receiver_id = :uid
-            GROUP BY partner_id
+        INSERT INTO conversations (
+            min_user_id,
+            max_user_id,
+            last_message_id,
+            last_message_at,
+            min_user_unread_count,
+            max_user_unread_count,
+            creation_date,
+            last_modification_date
         )
-        SELECT 
-            u.user_id, 
-            u.username, 
+        SELECT
+            agg.min_user_id,
+            agg.max_user_id,
+            agg.last_message_id,
+            pm.sent_at,
+            agg.min_unread,
+            agg.max_unread,
+            CURRENT_TIMESTAMP,
+            CURRENT_TIMESTAMP
+        FROM (
+            SELECT
+                min_user_id,
+                max_user_id,
+                MAX(private_message_id) AS last_message_id,
+                SUM(is_read_flag = 'N' AND receiver_id = min_user_id) AS min_unread,
+                SUM(is_read_flag = 'N' AND receiver_id = max_user_id) AS max_unread
+            FROM private_messages
+            WHERE sender_id <> receiver_id
+            GROUP BY min_user_id, max_user_id
+        ) agg
+        JOIN private_messages pm ON pm.private_message_id = agg.last_message_id
+        ON DUPLICATE KEY UPDATE
+            last_message_id = VALUES(last_message_id),
+            last_message_at = VALUES(last_message_at),
+            min_user_unread_count = VALUES(min_user_unread_count),
+            max_user_unread_count = VALUES(max_user_unread_count),
+            last_modification_date = CURRENT_TIMESTAMP
+    """)
+    db.execute(sql)
+    db.commit()
+
+
+@router.get("/messages/conversations")
+async def get_my_conversations(
+    response: Response,
+    archived: bool = False,
+    cursor: str | None = None,
+    limit: int = pagination.DEFAULT_LIMIT,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: Principal = Depends(get_current_principal),
+):
+    """
+    Boîte de réception : une ligne par interlocuteur, la plus récente d'abord.
+    Lue dans conversations : un parcours d'index par côté de la paire
+    (idx_conversations_min_inbox / _max_inbox), fusionnés puis limités.
+    Tri sur last_message_id (croissant avec le temps, sans égalité possible).
+    """
+    limit = pagination.clamp_limit(limit)
+    after, after_params = pagination.keyset_filter(cursor, ["c.last_message_id"])
+
+    sides = []
+    for side, partner in (("min_user", "max_user_id"), ("max_user", "min_user_id")):
+        sides.append(f"""
+            SELECT * FROM (
+                SELECT
+                    c.{partner} AS partner_id,
+                    c.last_message_id,
+                    c.{side}_unread_count AS unread_count,
+                    c.{side}_muted_flag AS muted_flag,
+                    c.{side}_archived_flag AS archived_flag
+                FROM conversations c
+                WHERE c.{side}_id = :uid
+                  AND c.{side}_archived_flag = :archived
+                  AND c.last_message_id IS NOT NULL
+                  {after}
+                ORDER BY c.last_message_id DESC
+                LIMIT :limit_plus
+            ) AS {side}_side
+        """)
+
+    sql = text(f"""
+        SELECT
+            u.user_id,
+            u.username,
             u.profile_picture,
+            pm.private_message_id,
             pm.content,
             pm.sent_at,
             pm.is_read_flag,
-            pm.sender_id
-        FROM LastMsgs lm
-        JOIN users u ON u.user_id = lm.partner_id
-        JOIN private_messages pm ON 
-            (pm.sender_id = :uid AND pm.receiver_id = lm.partner_id AND pm.sent_at = lm.max_date)
-            OR 
-            (pm.sender_id = lm.partner_id AND pm.receiver_id = :uid AND pm.sent_at = lm.max_date)
-        ORDER BY lm.max_date DESC;
+            pm.sender_id,
+            conv.unread_count,
+            conv.muted_flag,
+            conv.archived_flag,
+            conv.last_message_id
+        FROM ({" UNION ALL ".join(sides)}) conv
+        JOIN users u ON u.user_id = conv.partner_id
+        JOIN private_messages pm ON pm.private_message_id = conv.last_message_id
+        ORDER BY conv.last_message_id DESC
+        LIMIT :limit_plus
     """)
-    
-    res = db.execute(sql, {"uid": current_user.user_id}).mappings().all()
-    return list(res)
+
+    res = (await db.execute(sql, {
+        "uid": current_user.user_id,
+        "archived": "Y" if archived else "N",
+        "limit_plus": limit + 1,
+        **after_params,
+    })).mappings().all()
+    return pagination.paginate(response, res, limit, ["last_message_id"])
+
+
+@router.patch("/messages/conversations/{user_id}")
+def update_conversation_settings(
+    user_id: int,
+    muted: bool | None = Form(None),
+    archived: bool | None = Form(None),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Sourdine (pas de notification) / archive, pour mon côté de la conversation seulement."""
+    side = _side(current_user.user_id, user_id)
+    updates = {}
+    if muted is not None:
+        updates[f"{side}_muted_flag"] = "Y" if muted else "N"
+    if archived is not None:
+        updates[f"{side}_archived_flag"] = "Y" if archived else "N"
+    if not updates:
+        raise HTTPException(400, "Rien à modifier")
+
+    low, high = _conversation_key(current_user.user_id, user_id)
+    assignments = ", ".join(f"{col} = :{col}" for col in updates)
+    result = db.execute(text(f"""
+        UPDATE conversations
+        SET {assignments}, last_modification_date = CURRENT_TIMESTAMP
+        WHERE min_user_id = :low AND max_user_id = :high
+    """), {**updates, "low": low, "high": high})
+    if result.rowcount == 0:
+        raise HTTPException(404, "Conversation introuvable")
+
+    db.commit()
+    return {"message": "Conversation mise à jour"}
 
 
 @router.post("/messages/private")
@@ -82,19 +251,39 @@ def send_private_message(
         is_read_flag="N",
     )
     db.add(pm)
+    db.flush()  # id du message pour le résumé de conversation
+    muted = record_conversation_message(db, pm)
+    bump_user_stat(db, receiver_id, "unread_messages_count", 1)
     db.commit()
     db.refresh(pm)
-    
-    # 🔔 notif au destinataire
-    create_notification(
-        db=db,
-        target_user_id=receiver_id,
-        notif_type="MESSAGE",
-        notif_text=f"Nouveau message de {current_user.username}",
-        related_id=pm.private_message_id,
-        related_table="private_messages",
-        creator_id=current_user.user_id,
-    )
+
+    # 🔔 notif au destinataire (sauf conversation en sourdine)
+    if not muted:
+        create_notification(
+            db=db,
+            target_user_id=receiver_id,
+            notif_type="MESSAGE",
+            notif_text=f"Nouveau message de {current_user.username}",
+            related_id=pm.private_message_id,
+            related_table="private_messages",
+            creator_id=current_user.user_id,
+        )
+
+    # ⚡ push aux connexions WebSocket (destinataire + autres appareils de l'expéditeur)
+    event = {
+        "type": "private_message",
+        "message": {
+            "private_message_id": pm.private_message_id,
+            "sender_id": pm.sender_id,
+            "sender_username": current_user.username,
+            "receiver_id": pm.receiver_id,
+            "content": pm.content,
+            "media_url": pm.media_url,
+            "sent_at": pm.sent_at,
+        },
+    }
+    realtime.publish(realtime.user_channel(receiver_id), event)
+    realtime.publish(realtime.user_channel(current_user.user_id), event)
 
     return {"message": "Message envoyé", "private_message_id": pm.private_message_id}
 
@@ -103,29 +292,56 @@ def send_private_message(
 def get_private_conversation(
     user_id: int,
     limit: int = 100,
+    before: int | None = None,
+    since: int | None = None,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     """
-    Récupère la conversation entre l'utilisateur courant et user_id
+    Récupère la conversation entre l'utilisateur courant et user_id.
+    - sans curseur : les `limit` derniers messages (plus récent d'abord) ;
+    - before=<private_message_id> : la page plus ancienne (même ordre) ;
+    - since=<private_message_id> : les messages arrivés après, du plus ancien
+      au plus récent (resynchro après une reconnexion du WebSocket).
+    La paire est lue via la clé canonique (min_user_id, max_user_id) : un seul
+    parcours ordonné de idx_pm_pair pour trouver les ids de la page, les lignes
+    complètes ne sont lues qu'ensuite.
     """
-    sql = text("""
+    if before is not None and since is not None:
+        raise HTTPException(400, "before et since ne peuvent pas être combinés")
+
+    low, high = _conversation_key(current_user.user_id, user_id)
+    limit = pagination.clamp_limit(limit)
+    params = {"low": low, "high": high, "limit": limit}
+
+    if since is not None:
+        cursor, order = "AND private_message_id > :since", "ASC"
+        params["since"] = since
+    elif before is not None:
+        cursor, order = "AND private_message_id < :before", "DESC"
+        params["before"] = before
+    else:
+        cursor, order = "", "DESC"
+
+    sql = text(f"""
         SELECT pm.*, 
                s.username AS sender_username,
                r.username AS receiver_username
-        FROM private_messages pm
+        FROM (
+            SELECT private_message_id
+            FROM private_messages
+            WHERE min_user_id = :low AND max_user_id = :high
+              {cursor}
+            ORDER BY private_message_id {order}
+            LIMIT :limit
+        ) page
+        JOIN private_messages pm ON pm.private_message_id = page.private_message_id
         JOIN users s ON s.user_id = pm.sender_id
         JOIN users r ON r.user_id = pm.receiver_id
-        WHERE (pm.sender_id = :me AND pm.receiver_id = :other)
-           OR (pm.sender_id = :other AND pm.receiver_id = :me)
-        ORDER BY pm.sent_at DESC
-        LIMIT :limit;
+        ORDER BY pm.private_message_id {order};
     """)
 
-    res = db.execute(
-        sql,
-        {"me": current_user.user_id, "other": user_id, "limit": limit},
-    ).mappings().all()
+    res = db.execute(sql, params).mappings().all()
 
     return list(res)
 
@@ -133,7 +349,7 @@ def get_private_conversation(
 @router.get("/messages/private/unread")
 def get_unread_messages(
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     sql = text("""
         SELECT pm.*, u.username AS sender_username
@@ -159,9 +375,17 @@ def mark_message_read(
     if pm.receiver_id != current_user.user_id:
         raise HTTPException(403, "Tu ne peux marquer comme lu que tes messages reçus")
 
-    pm.is_read_flag = "Y"
-    pm.last_modification_date = datetime.now(timezone.utc)
-    pm.last_modified_by = current_user.user_id
+    # UPDATE conditionnel : deux appels concurrents ne décrémentent qu'une fois
+    updated = db.query(models.PrivateMessage).filter(
+        models.PrivateMessage.private_message_id == message_id,
+        models.PrivateMessage.receiver_id == current_user.user_id,
+        models.PrivateMessage.is_read_flag == "N",
+    ).update({
+        models.PrivateMessage.is_read_flag: "Y",
+        models.PrivateMessage.last_modification_date: datetime.now(timezone.utc),
+        models.PrivateMessage.last_modified_by: current_user.user_id,
+    }, synchronize_session=False)
+    _mark_conversation_seen(db, current_user.user_id, pm.sender_id, updated)
 
     db.commit()
     return {"message": "Message marqué comme lu"}
@@ -202,6 +426,12 @@ def create_group(
     db.add(member)
     db.commit()
 
+    # Les connexions ouvertes du créateur s'abonnent au groupe
+    realtime.publish(
+        realtime.user_channel(current_user.user_id),
+        {"type": "group_joined", "group_chat_id": group.group_chat_id},
+    )
+
     return {"message": "Groupe créé", "group_chat_id": group.group_chat_id}
 
 
@@ -234,6 +464,8 @@ def join_group(
     db.add(member)
     db.commit()
 
+    realtime.publish(realtime.user_channel(current_user.user_id), {"type": "group_joined", "group_chat_id": group_id})
+
     return {"message": "Tu as rejoint le groupe"}
 
 
@@ -254,6 +486,8 @@ def leave_group(
     db.delete(member)
     db.commit()
 
+    realtime.publish(realtime.user_channel(current_user.user_id), {"type": "group_left", "group_chat_id": group_id})
+
     return {"message": "Tu as quitté le groupe"}
 
 
@@ -326,6 +560,19 @@ def send_group_message(
     db.commit()
     db.refresh(gm)
 
+    realtime.publish(realtime.group_channel(group_id), {
+        "type": "group_message",
+        "message": {
+            "group_message_id": gm.group_message_id,
+            "group_chat_id": group_id,
+            "sender_id": gm.sender_id,
+            "sender_username": current_user.username,
+            "message_text": gm.message_text,
+            "media_url": gm.media_url,
+            "sent_at": gm.sent_at,
+        },
+    })
+
     return {"message": "Message envoyé", "group_message_id": gm.group_message_id}
 
 
@@ -370,11 +617,99 @@ def mark_conversation_read(
     Marque tous les messages reçus de 'sender_id' comme lus (is_read_flag = 'Y').
     """
     # Mise à jour de masse (UPDATE)
-    db.query(models.PrivateMessage).filter(
+    updated = db.query(models.PrivateMessage).filter(
         models.PrivateMessage.sender_id == sender_id,
         models.PrivateMessage.receiver_id == current_user.user_id,
         models.PrivateMessage.is_read_flag == 'N'
     ).update({models.PrivateMessage.is_read_flag: "Y"}, synchronize_session=False)
 
+    # Décrément du nb réellement marqué (pas de remise à 0) : un message arrivé
+    # entre-temps reste compté comme non lu
+    _mark_conversation_seen(db, current_user.user_id, sender_id, updated)
+
     db.commit()
-    return {"message": "Conversation marquée comme lue"}
\ No newline at end of file
+    return {"message": "Conversation marquée comme lue"}
+
+
+# ============================================================
+# ⚡ TEMPS RÉEL (WEBSOCKET)
+# ============================================================
+
+async def _push_events(websocket: WebSocket, sub: realtime.Subscription):
+    """Vide la file de la connexion vers le client."""
+    while True:
+        event = await sub.queue.get()
+        if event is None:
+            # Client trop lent : il se reconnecte et relit l'historique en HTTP
+            await websocket.close(code=1013)
+            return
+        if event.get("type") == "group_joined":
+            realtime.hub.subscribe(sub, realtime.group_channel(event["group_chat_id"]))
+        elif event.get("type") == "group_left":
+            realtime.hub.unsubscribe(sub, realtime.group_channel(event["group_chat_id"]))
+        await websocket.send_json(event)
+
+
+async def _read_client(websocket: WebSocket):
+    """Seul message attendu du client : {"action": "ping"} (keepalive)."""
+    while True:
+        raw = await websocket.receive_text()
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            continue
+        if isinstance(data, dict) and data.get("action") == "ping":
+            await websocket.send_json({"type": "pong"})
+
+
+@router.websocket("/messages/ws")
+async def messages_socket(websocket: WebSocket, token: str | None = None):
+    """
+    Messages privés et de groupe poussés en temps réel, à la place du polling.
+    Le token passe en query string (?token=...) : les navigateurs ne peuvent
+    pas poser de header Authorization sur un WebSocket.
+    """
+    try:
+        user_id = int(_decode_token(token or "")["sub"])
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    async with database.AsyncReadSessionLocal() as db:
+        group_ids = (await db.execute(
+            text("SELECT group_chat_id FROM group_members WHERE user_id = :uid"),
+            {"uid": user_id},
+        )).scalars().all()
+
+    await websocket.accept()
+    sub = realtime.Subscription(user_id)
+    realtime.hub.subscribe(sub, realtime.user_channel(user_id))
+    for group_id in group_ids:
+        realtime.hub.subscribe(sub, realtime.group_channel(group_id))
+
+    tasks = {asyncio.create_task(_push_events(websocket, sub)), asyncio.create_task(_read_client(websocket))}
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not isinstance(task.exception(), (WebSocketDisconnect, type(None))):
+                print(f"⚠️ WebSocket messages fermé sur erreur : {task.exception()}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        realtime.hub.unsubscribe(sub)
+
+
+@router.post("/admin/messages/conversations/reconcile")
+def reconcile_conversations_endpoint(
+    db: Session = Depends(database.get_db),
+    _current_user: models.User = Depends(get_current_user),
+):
+    reconcile_conversations(db)
+    return {"message": "conversations recalculée"}
+
+
+@router.get("/admin/realtime")
+def realtime_stats(
+    _current_user: models.User = Depends(get_current_user),
+):
+    return realtime.get_stats()
@@ -1,17 +1,92 @@
 # routers/notifications.py
 
+import os
+import threading
+import time
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import bindparam, desc, select, text
 from datetime import datetime, timezone
 
 import database
 import models
-from .auth import get_current_user
+from .auth import Principal, get_current_principal, get_current_user
+from .stats import bump_user_stat
 
 router = APIRouter(tags=["Notifications"])
 
 
+# ---- Pipeline d'écriture (hors du chemin de la requête) ----
+NOTIFICATION_FLUSH_SIZE = int(os.getenv("NOTIFICATION_FLUSH_SIZE", "500"))          # flush dès N lignes...
+NOTIFICATION_FLUSH_INTERVAL = float(os.getenv("NOTIFICATION_FLUSH_INTERVAL", "1"))  # ... ou toutes les N s
+NOTIFICATION_BUFFER_MAX = int(os.getenv("NOTIFICATION_BUFFER_MAX", "50000"))        # au-delà : notifications écartées
+NOTIFICATION_COALESCE_WINDOW = int(os.getenv("NOTIFICATION_COALESCE_WINDOW", "3600"))  # regroupement par tranche de N s
+
+# Types regroupés -> l'objet (related_id) fait-il partie de la clé ?
+# FOLLOW : related_id est l'abonné lui-même, on regroupe tous les nouveaux abonnés
+# (abonnements acceptés seulement : une demande en attente reste une notification
+# par demandeur, voir coalesce dans create_notification).
+COALESCED_TYPES = {"LIKE": True, "COMMENT": True, "FOLLOW": False}
+
+_groups = {}   # (user_id, group_key) -> ligne agrégée
+_singles = []  # notifications non regroupables, ou remises en file après une erreur
+_buffer_lock = threading.Lock()
+_flush_wanted = threading.Event()
+_flush_lock = threading.Lock()
+buffer_stats = {
+    "accepted": 0, "coalesced": 0, "dropped": 0, "flushed": 0,
+    "dead_rows": 0,  # refusées par la base même seules (destinataire supprimé, texte trop long...)
+    "flush_errors": 0, "last_flush_seconds": 0.0,
+}
+
+# Une ligne par notification ou par groupe : la clé unique (user_id, group_key)
+# fusionne avec le groupe déjà en base pour la même tranche (idx_notifications_group).
+# VALUES(...) ne contient que des paramètres : le driver en fait un INSERT multi-lignes.
+# Une fusion reprend la date et le texte (base_text) du dernier acteur : le groupe
+# remonte en tête de GET /notifications (trié sur creation_date). Les affectations
+# sont évaluées dans l'ordre : notification_text voit le nouvel actor_count.
+_INSERT_SQL = text("""
+    INSERT INTO notifications (
+        user_id, notification_text, base_text, notification_type, related_id, related_table,
+        group_key, actor_count, is_read_flag,
+        creation_date, created_by, last_modification_date, last_modified_by
+    )
+    VALUES (
+        :user_id, :notification_text, :base_text, :notification_type, :related_id, :related_table,
+        :group_key, :actor_count, :is_read_flag,
+        :creation_date, :created_by, :creation_date, :created_by
+    )
+    ON DUPLICATE KEY UPDATE
+        actor_count = actor_count + VALUES(actor_count),
+        base_text = VALUES(base_text),
+        notification_text = CONCAT(
+            VALUES(base_text),
+            CONCAT(' (et ', actor_count - 1, IF(actor_count > 2, ' autres)', ' autre)'))
+        ),
+        related_id = VALUES(related_id),
+        is_read_flag = 'N',
+        creation_date = VALUES(creation_date),
+        last_modification_date = VALUES(last_modification_date),
+        last_modified_by = VALUES(last_modified_by)
+""")
+
+
+def _group_key(notif_type: str, related_table: str | None, related_id: int | None, at: datetime) -> str | None:
+    if notif_type not in COALESCED_TYPES:
+        return None
+    bucket = int(at.timestamp()) // NOTIFICATION_COALESCE_WINDOW
+    subject = f"{related_table}:{related_id}" if COALESCED_TYPES[notif_type] else "*"
+    return f"{notif_type}:{subject}:{bucket}"
+
+
+def _coalesced_text(base_text: str, actor_count: int) -> str:
+    """"Alice a aimé votre post (et 37 autres)" (même rendu que le ON DUPLICATE KEY UPDATE)."""
+    if actor_count <= 1:
+        return base_text
+    return f"{base_text} (et {actor_count - 1} autre{'s' if actor_count > 2 else ''})"
+
+
 # 🔧 Helper réutilisable partout
 def create_notification(
     db: Session,
@@ -21,49 +96,227 @@ def create_notification(
     related_id: int | None = None,
     related_table: str | None = None,
     creator_id: int | None = None,
+    coalesce: bool = True,
 ):
     """
-    Crée une notification simple.
+    Met une notification en file : elle est écrite par le flusher (INSERT
+    multi-lignes), jamais dans la requête. LIKE / COMMENT / FOLLOW sont
+    regroupées par destinataire et objet sur NOTIFICATION_COALESCE_WINDOW s
+    (coalesce=False : jamais regroupée, ex. une demande d'abonnement).
+    `db` n'est plus utilisé, il reste dans la signature pour les appelants.
     """
-    notif = models.Notification(
-        user_id=target_user_id,
-        notification_text=notif_text,
-        notification_type=notif_type,
-        related_id=related_id,
-        related_table=related_table,
-        creation_date=datetime.now(timezone.utc),
-        created_by=creator_id,
-        last_modification_date=datetime.now(timezone.utc),
-        last_modified_by=creator_id,
-    )
-    db.add(notif)
-    db.commit()
-    return notif
+    now = datetime.now(timezone.utc)
+    group_key = _group_key(notif_type, related_table, related_id, now) if coalesce else None
+    row = {
+        "user_id": target_user_id,
+        "base_text": notif_text,
+        "notification_type": notif_type,
+        "related_id": related_id,
+        "related_table": related_table,
+        "group_key": group_key,
+        "actor_count": 1,
+        "actors": {creator_id} if creator_id is not None else set(),
+        "is_read_flag": "N",
+        "creation_date": now,
+        "created_by": creator_id,
+    }
+
+    with _buffer_lock:
+        if len(_singles) + len(_groups) >= NOTIFICATION_BUFFER_MAX:
+            buffer_stats["dropped"] += 1
+            return
+        buffer_stats["accepted"] += 1
+        if group_key is None:
+            _singles.append(row)
+        elif (target_user_id, group_key) in _groups:
+            group = _groups[(target_user_id, group_key)]
+            buffer_stats["coalesced"] += 1
+            if creator_id not in group["actors"]:  # un même acteur (like / unlike / like) ne compte qu'une fois
+                if creator_id is not None:
+                    group["actors"].add(creator_id)
+                group["actor_count"] += 1
+                group["base_text"] = notif_text  # le dernier acteur est cité
+                group["related_id"] = related_id
+                group["creation_date"] = now
+                group["created_by"] = creator_id
+        else:
+            _groups[(target_user_id, group_key)] = row
+        size = len(_singles) + len(_groups)
+
+    if size >= NOTIFICATION_FLUSH_SIZE:
+        _flush_wanted.set()
+
+
+def _refresh_unread_badges(db: Session, user_ids: set[int]):
+    """
+    Recompte les non lues des destinataires du lot (idx_notifications_unread) :
+    un regroupement ne crée pas forcément de ligne, le delta exact n'est pas connu.
+    """
+    sql = text("""
+        INSERT INTO user_stats (user_id, unread_notifications_count, last_modification_date)
+        SELECT n.user_id, COUNT(*), CURRENT_TIMESTAMP
+        FROM notifications n
+        WHERE n.user_id IN :ids AND n.is_read_flag = 'N'
+        GROUP BY n.user_id
+        ON DUPLICATE KEY UPDATE
+            unread_notifications_count = VALUES(unread_notifications_count),
+            last_modification_date = CURRENT_TIMESTAMP
+    """).bindparams(bindparam("ids", expanding=True))
+    db.execute(sql, {"ids": list(user_ids)})
+
+
+def _group_ids(db: Session, groups: list[dict]) -> dict[tuple, int]:
+    """(user_id, group_key) -> notification_id des groupes du lot déjà en base."""
+    sql = text("""
+        SELECT user_id, group_key, notification_id
+        FROM notifications
+        WHERE user_id IN :uids AND group_key IN :keys
+    """).bindparams(bindparam("uids", expanding=True), bindparam("keys", expanding=True))
+    res = db.execute(sql, {
+        "uids": list({row["user_id"] for row in groups}),
+        "keys": list({row["group_key"] for row in groups}),
+    }).all()
+    return {(user_id, group_key): notification_id for user_id, group_key, notification_id in res}
+
+
+def _known_actors(db: Session, ids: dict[tuple, int]) -> dict[tuple, set[int]]:
+    """Acteurs déjà comptés dans ces groupes (flushs précédents, autres replicas)."""
+    by_id = {notification_id: key for key, notification_id in ids.items()}
+    sql = text("""
+        SELECT notification_id, actor_id
+        FROM notification_actors
+        WHERE notification_id IN :ids
+    """).bindparams(bindparam("ids", expanding=True))
+    known = {}
+    for notification_id, actor_id in db.execute(sql, {"ids": list(by_id)}).all():
+        known.setdefault(by_id[notification_id], set()).add(actor_id)
+    return known
+
+
+def _write_notifications(rows: list[dict]):
+    """
+    Une transaction : retire des groupes les acteurs déjà comptés en base,
+    INSERT multi-lignes, enregistre les acteurs des groupes
+    (notification_actors) puis badges des destinataires du lot.
+    """
+    db = database.SessionLocal()
+    try:
+        groups = [row for row in rows if row["group_key"] is not None]
+        known = _known_actors(db, _group_ids(db, groups)) if groups else {}
+
+        payload = []
+        for row in rows:
+            seen = known.setdefault((row["user_id"], row["group_key"]), set())
+            actors = row["actors"] - seen
+            actor_count = row["actor_count"] - (len(row["actors"]) - len(actors))
+            if actor_count <= 0:
+                continue  # uniquement des acteurs déjà comptés : rien à fusionner
+            if row["group_key"] is not None:
+                seen |= actors  # même groupe remis en file et présent deux fois dans le lot
+            payload.append({
+                **row,
+                "actors": actors,
+                "actor_count": actor_count,
+                "notification_text": _coalesced_text(row["base_text"], actor_count),
+            })
+
+        if payload:
+            db.execute(_INSERT_SQL, payload)
+            new_actors = [row for row in payload if row["actors"]]
+            if new_actors:
+                ids = _group_ids(db, new_actors)
+                db.execute(text("""
+                    INSERT IGNORE INTO notification_actors (notification_id, actor_id)
+                    VALUES (:notification_id, :actor_id)
+                """), [
+                    {"notification_id": ids[(row["user_id"], row["group_key"])], "actor_id": actor_id}
+                    for row in new_actors for actor_id in row["actors"]
+                ])
+            _refresh_unread_badges(db, {row["user_id"] for row in payload})
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def flush_notifications() -> int:
+    """
+    Écrit le buffer (voir _write_notifications). Une ligne refusée par la base
+    est isolée (database.write_isolating), journalisée puis abandonnée. Si la
+    base est injoignable, les lignes non écrites (déjà agrégées) sont remises
+    en file : la clé unique les refusionnera avec leur groupe au prochain flush.
+    """
+    with _flush_lock:
+        with _buffer_lock:
+            rows = _singles + list(_groups.values())
+            _singles.clear()
+            _groups.clear()
+        if not rows:
+            return 0
+
+        start = time.perf_counter()
+        dead, unwritten, error = database.write_isolating(_write_notifications, rows)
+        for row in dead:
+            print(f"⚠️ Notification abandonnée (user {row['user_id']}, {row['notification_type']}) : refusée par la base")
+        if error is not None:
+            print(f"⚠️ Erreur écriture notifications ({len(unwritten)} lignes) : {error}")
+
+        with _buffer_lock:
+            if unwritten:
+                requeued = unwritten[:max(NOTIFICATION_BUFFER_MAX - len(_singles) - len(_groups), 0)]
+                _singles.extend(requeued)
+                buffer_stats["dropped"] += len(unwritten) - len(requeued)
+                buffer_stats["flush_errors"] += 1
+            buffer_stats["dead_rows"] += len(dead)
+            written = len(rows) - len(dead) - len(unwritten)
+            buffer_stats["flushed"] += written
+            buffer_stats["last_flush_seconds"] = round(time.perf_counter() - start, 3)
+        return written
+
+
+def start_notification_flusher():
+    """Thread de fond : flush toutes les NOTIFICATION_FLUSH_INTERVAL s, ou dès que le buffer est plein."""
+    def loop():
+        while True:
+            _flush_wanted.wait(NOTIFICATION_FLUSH_INTERVAL)
+            _flush_wanted.clear()
+            try:
+                flush_notifications()
+            except Exception as e:
+                print(f"⚠️ Erreur flush notifications : {e}")
+
+    threading.Thread(target=loop, name="notification-flusher", daemon=True).start()
 
 
+def get_buffer_stats() -> dict:
+    with _buffer_lock:
+        return {**buffer_stats, "buffered": len(_singles) + len(_groups)}
+
 
 # ============================================================
 # 📨 GET — Toutes mes notifications
 # ============================================================
 @router.get("/notifications")
-def get_my_notifications(
+async def get_my_notifications(
     unread_only: bool = False,
     limit: int = 50,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: Principal = Depends(get_current_principal),
 ):
-    q = db.query(models.Notification).filter(
+    q = select(models.Notification).where(
         models.Notification.user_id == current_user.user_id
     )
 
     if unread_only:
-        q = q.filter(models.Notification.is_read_flag == "N")
+        q = q.where(models.Notification.is_read_flag == "N")
 
-    notifications = (
+    res = await db.execute(
         q.order_by(desc(models.Notification.creation_date))
         .limit(limit)
-        .all()
     )
+    notifications = res.scalars().all()
 
     return notifications
 
@@ -87,9 +340,14 @@ def mark_as_read(
     if notif.user_id != current_user.user_id:
         raise HTTPException(status_code=403, detail="Accès interdit")
 
-    notif.is_read_flag = "Y"
-    notif.last_modified_by = current_user.user_id
-
+    # UPDATE conditionnel : deux appels concurrents ne décrémentent qu'une fois
+    updated = db.query(models.Notification).filter(
+        models.Notification.notification_id == notification_id,
+        models.Notification.user_id == current_user.user_id,
+        models.Notification.is_read_flag == "N",
+    ).update({"is_read_flag": "Y", "last_modified_by": current_user.user_id}, synchronize_session=False)
+    if updated:
+        bump_user_stat(db, current_user.user_id, "unread_notifications_count", -updated)
     db.commit()
     return {"message": "Notification marquée comme lue"}
 
@@ -102,11 +360,14 @@ def mark_all_as_read(
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    db.query(models.Notification).filter(
+    updated = db.query(models.Notification).filter(
         models.Notification.user_id == current_user.user_id,
         models.Notification.is_read_flag == "N"
     ).update({"is_read_flag": "Y"})
 
+    # Décrément du nb réellement marqué : une notif arrivée entre-temps reste comptée
+    if updated:
+        bump_user_stat(db, current_user.user_id, "unread_notifications_count", -updated)
     db.commit()
     return {"message": "Toutes les notifications marquées comme lues"}
 
@@ -130,7 +391,27 @@ def delete_notification(
     if notif.user_id != current_user.user_id:
         raise HTTPException(403, "Tu ne peux supprimer QUE tes notifications")
 
-    db.delete(notif)
+    # DELETE conditionnel : seule la requête qui supprime une notif encore non
+    # lue décrémente (pas de double décrément face à mark_as_read / un 2e DELETE)
+    mine = db.query(models.Notification).filter(
+        models.Notification.notification_id == notification_id,
+        models.Notification.user_id == current_user.user_id,
+    )
+    unread = mine.filter(models.Notification.is_read_flag == "N").delete(synchronize_session=False)
+    if unread:
+        bump_user_stat(db, current_user.user_id, "unread_notifications_count", -unread)
+    else:
+        mine.delete(synchronize_session=False)
     db.commit()
 
     return {"message": "Notification supprimée"}
+
+
+# ============================================================
+# 🛠️ ADMIN : ÉTAT DU BUFFER DE NOTIFICATIONS
+# ============================================================
+@router.get("/admin/notifications/buffer")
+def notification_buffer_stats(
+    _current_user: models.User = Depends(get_current_user),
+):
+    return get_buffer_stats()
@@ -1,16 +1,23 @@
 # routers/posts.py
 
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import text, desc
 from datetime import datetime, timezone
 import cloudinary
 import cloudinary.uploader
+import cache
 import database
 import models
-from .auth import get_current_user
+import pagination
+from .auth import Principal, get_current_principal, get_current_user
 from .notifications import create_notification
-from routers.map import refresh_map_feed
+from .stats import bump_post_stat, bump_user_stat
+from .timeline import fan_out_post, retract_post, CELEBRITY_FOLLOWER_THRESHOLD
+from routers.map import upsert_map_feed_post, delete_map_feed_post, update_map_feed_likes
+from .uploads import spool_upload, submit_upload
+from .assets import enqueue_asset_deletion, kick_asset_deletions
 
 router = APIRouter(tags=["Posts"])
 
@@ -38,6 +45,14 @@ def create_post(
     if post_type not in ["POST", "MEMORY"]:
         raise HTTPException(400, "Type de post invalide (POST ou MEMORY)")
 
+    # Hors plage, ST_GeoHash (map_feed) échoue côté MySQL
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except ValueError:
+        raise HTTPException(400, "Coordonnées invalides")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise HTTPException(400, "Coordonnées hors limites (latitude ±90, longitude ±180)")
+
     post = models.Post(
         post_title=post_title,
         post_description=post_description,
@@ -55,10 +70,14 @@ def create_post(
     )
 
     db.add(post)
+    db.flush()
+    db.add(models.PostStats(post_id=post.post_id))
+    bump_user_stat(db, current_user.user_id, "posts_count", 1)
+    fan_out_post(db, post)
+    upsert_map_feed_post(db, post.post_id)
     db.commit()
     db.refresh(post)
-
-    refresh_map_feed(db)
+    cache.invalidate(f"user:{current_user.user_id}")
 
     return {"message": "Post créé", "post_id": post.post_id}
 
@@ -66,7 +85,7 @@ def create_post(
 # ============================================================
 # 2. UPLOAD MEDIA DANS UN POST
 # ============================================================
-@router.post("/posts/{post_id}/media")
+@router.post("/posts/{post_id}/media", status_code=202)
 def upload_media(
     post_id: int,
     file: UploadFile = File(...),
@@ -79,48 +98,52 @@ def upload_media(
         raise HTTPException(404, "Post introuvable")
     if post.user_id != current_user.user_id:
         raise HTTPException(403, "Tu ne peux modifier que tes posts")
-    
-    try:
-        upload = cloudinary.uploader.upload(
-            file.file,
-            folder=f"posts/{post_id}/",
-            resource_type="auto"
-        )
-    except Exception as e:
-        raise HTTPException(500, f"Erreur Cloudinary: {e}")
 
-    media_type = "IMAGE" if upload.get("resource_type") == "image" else "VIDEO"
-    
+    # Le média reste PENDING jusqu'à la fin de l'upload en arrière-plan
+    # (routers/uploads.py) : URL, taille... sont remplies à ce moment-là.
+    media_type = "VIDEO" if (file.content_type or "").startswith("video/") else "IMAGE"
+
     media = models.Media(
         post_id=post_id,
-        media_url=upload["secure_url"],
-        thumbnail_url=upload.get("thumbnail_url"),
+        media_url="",
         media_type=media_type,
-        cloud_id=upload.get("public_id"),
-        size=upload.get("bytes"),
-        width=upload.get("width"),
-        height=upload.get("height"),
-        duration_seconds=upload.get("duration"),
         original_filename=file.filename,
         created_by=current_user.user_id,
+        status="PENDING",
     )
 
     db.add(media)
+    db.flush()
+    job = spool_upload(
+        db, file, current_user.user_id, "MEDIA",
+        folder=f"posts/{post_id}/", target_id=media.media_id,
+    )
     db.commit()
+    submit_upload(job.job_id)
 
-    return {"message": "Media ajouté", "url": upload["secure_url"]}
+    return {"message": "Media en cours d'upload", "media_id": media.media_id, "job_id": job.job_id, "status": "PENDING"}
 
 
 # ============================================================
 # 3. FEED (posts que je peux voir)
 # ============================================================
 @router.get("/posts/feed")
-def get_feed(
+async def get_feed(
+    response: Response,
     post_type: str = "POST",
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: Principal = Depends(get_current_principal),
 ):
-    sql = text("""
+    limit = pagination.clamp_limit(limit)
+    # Même curseur appliqué aux deux sources du feed
+    after_tl, after_params = pagination.keyset_filter(cursor, ["tl.publication_date", "tl.post_id"])
+    after_celeb, _ = pagination.keyset_filter(cursor, ["cp.publication_date", "cp.post_id"])
+
+    # Timeline matérialisée (fan-out à l'écriture, cf. routers/timeline.py)
+    # + posts publics des "célébrités" que je suis, fusionnés à la lecture.
+    sql = text(f"""
         SELECT 
             p.*, 
             u.username, 
@@ -128,33 +151,53 @@ def get_feed(
             t.trip_title,             
             pl.place_name,            
             c.city_name,              
-            (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.post_id) as likes_count,
-            (SELECT COUNT(*) FROM comments c WHERE c.post_id = p.post_id) as comments_count,
-            (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.post_id AND l.user_id = :me) as is_liked,
-            (SELECT GROUP_CONCAT(media_url SEPARATOR ',') FROM media m WHERE m.post_id = p.post_id) as media_urls
-        FROM posts p
+            COALESCE(ps.likes_count, 0) as likes_count,
+            COALESCE(ps.comments_count, 0) as comments_count,
+            (ml.user_id IS NOT NULL) as is_liked,
+            (SELECT GROUP_CONCAT(media_url SEPARATOR ',') FROM media m WHERE m.post_id = p.post_id AND m.status = 'READY') as media_urls
+        FROM (
+            (
+                SELECT tl.post_id, tl.publication_date
+                FROM timelines tl
+                WHERE tl.user_id = :me AND tl.post_type = :ptype
+                {after_tl}
+                ORDER BY tl.publication_date DESC, tl.post_id DESC
+                LIMIT :limit
+            )
+            UNION
+            (
+                SELECT cp.post_id, cp.publication_date
+                FROM followers fo
+                JOIN user_stats us ON us.user_id = fo.user_id AND us.followers_count > :celeb_threshold
+                JOIN posts cp ON cp.user_id = fo.user_id
+                WHERE fo.follower_user_id = :me
+                AND fo.status = 'ACCEPTED'
+                AND cp.privacy = 'PUBLIC'
+                AND cp.post_type = :ptype
+                {after_celeb}
+                ORDER BY cp.publication_date DESC, cp.post_id DESC
+                LIMIT :limit
+            )
+        ) feed
+        JOIN posts p ON p.post_id = feed.post_id
         JOIN users u ON u.user_id = p.user_id
+        LEFT JOIN post_stats ps ON ps.post_id = p.post_id
+        LEFT JOIN likes ml ON ml.post_id = p.post_id AND ml.user_id = :me
         LEFT JOIN trips t ON p.trip_id = t.trip_id          
         LEFT JOIN places pl ON p.place_id = pl.place_id     
         LEFT JOIN cities c ON pl.city_id = c.city_id        
-        WHERE 
-            p.post_type = :ptype
-            AND (
-                p.privacy = 'PUBLIC'
-                OR (p.privacy = 'FRIENDS' AND p.user_id IN (
-                    SELECT 
-                        CASE WHEN f.user_id = :me THEN f.user_id_friend ELSE f.user_id END
-                    FROM friends f
-                    WHERE f.status = 'ACCEPTED' AND (f.user_id = :me OR f.user_id_friend = :me)
-                ))
-                OR p.user_id = :me
-            )
-        ORDER BY p.publication_date DESC
-        LIMIT 100
+        ORDER BY feed.publication_date DESC, feed.post_id DESC
+        LIMIT :limit
     """)
 
-    res = db.execute(sql, {"me": current_user.user_id, "ptype": post_type}).mappings().all()
-    return list(res)
+    res = (await db.execute(sql, {
+        "me": current_user.user_id,
+        "ptype": post_type,
+        "limit": limit + 1,
+        "celeb_threshold": CELEBRITY_FOLLOWER_THRESHOLD,
+        **after_params,
+    })).mappings().all()
+    return pagination.paginate(response, res, limit, ["publication_date", "post_id"])
 
 
 # ============================================================
@@ -191,24 +234,22 @@ def delete_post(
     if post.user_id != current_user.user_id:
         raise HTTPException(403, "Tu ne peux supprimer que tes posts")
     
-    medias = db.query(models.Media).filter_by(post_id=post_id).all()
-
-    for media in medias:
-        if media.cloud_id:  
-            try:
-                resource_type = "image"
-                if media.media_type == "VIDEO":
-                    resource_type = "video"
-
-                cloudinary.uploader.destroy(media.cloud_id, resource_type=resource_type)
-            except Exception as e:
-                print(f"⚠️ Erreur suppression Cloudinary pour {media.cloud_id}: {e}")
-        db.delete(media)
-        db.commit()
-                
-                
+    # Les fichiers sont supprimés du stockage en arrière-plan (routers/assets.py) :
+    # l'outbox est écrite dans la même transaction que la suppression du post.
+    medias = db.query(models.Media.cloud_id, models.Media.media_type).filter_by(post_id=post_id).all()
+    for cloud_id, media_type in medias:
+        if cloud_id:
+            enqueue_asset_deletion(db, cloud_id, "video" if media_type == "VIDEO" else "image")
+
+    db.query(models.Media).filter_by(post_id=post_id).delete(synchronize_session=False)
+    retract_post(db, post_id)
+    delete_map_feed_post(db, post_id)
+    bump_user_stat(db, current_user.user_id, "posts_count", -1)
     db.delete(post)
     db.commit()
+    cache.invalidate(f"post:{post_id}:likes", f"user:{current_user.user_id}")
+    if any(cloud_id for cloud_id, _ in medias):
+        kick_asset_deletions()
 
     return {"message": "Post supprimé"}
 
@@ -263,7 +304,10 @@ def like_post(
         last_modified_by=current_user.user_id,
     )
     db.add(like)
+    bump_post_stat(db, post_id, "likes_count", 1)
+    update_map_feed_likes(db, post_id)
     db.commit()
+    cache.invalidate(f"post:{post_id}:likes")
     if post.user_id != current_user.user_id:
         create_notification(
             db=db,
@@ -292,7 +336,10 @@ def unlike_post(
         raise HTTPException(404, "Tu n'as pas liké ce post")
 
     db.delete(like)
+    bump_post_stat(db, post_id, "likes_count", -1)
+    update_map_feed_likes(db, post_id)
     db.commit()
+    cache.invalidate(f"post:{post_id}:likes")
 
     return {"message": "Like retiré"}
 
@@ -300,7 +347,7 @@ def unlike_post(
 @router.get("/posts/{post_id}/likes")
 def get_post_likes(
     post_id: int,
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
 ):
     sql = text("""
         SELECT u.user_id, u.username, u.profile_picture
@@ -308,8 +355,11 @@ def get_post_likes(
         JOIN users u ON u.user_id = l.user_id
         WHERE l.post_id = :pid
     """)
-    res = db.execute(sql, {"pid": post_id}).mappings().all()
-    return list(res)
+    return cache.get_or_set(
+        f"post:{post_id}:likes",
+        lambda: db.execute(sql, {"pid": post_id}).mappings().all(),
+        tags=[f"post:{post_id}:likes"],
+    )
 
 
 @router.post("/posts/{post_id}/save")
@@ -336,6 +386,7 @@ def save_post(
         saved_at=datetime.now(timezone.utc),
     )
     db.add(saved)
+    bump_post_stat(db, post_id, "saves_count", 1)
     db.commit()
 
     return {"message": "Post ajouté aux favoris"}
@@ -356,6 +407,7 @@ def unsave_post(
         raise HTTPException(404, "Ce post n'est pas dans tes favoris")
 
     db.delete(saved)
+    bump_post_stat(db, post_id, "saves_count", -1)
     db.commit()
 
     return {"message": "Post retiré des favoris"}
@@ -393,6 +445,7 @@ def share_post(
         created_by=current_user.user_id,
     )
     db.add(share)
+    bump_post_stat(db, post_id, "shares_count", 1)
     db.commit()
     if receiver_id != current_user.user_id:
         create_notification(
@@ -424,8 +477,8 @@ def share_post(
 @router.get("/posts/{post_id}/media")
 def get_post_media(
     post_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(database.get_read_db),
+    current_user: Principal = Depends(get_current_principal),
 ):
     post = db.query(models.Post).filter_by(post_id=post_id).first()
 
@@ -435,8 +488,9 @@ def get_post_media(
     if post.privacy == 'PRIVATE' and post.user_id != current_user.user_id:
         raise HTTPException(403, "Post privé")
     
+    # Médias en cours d'upload (PENDING) ou abandonnés (FAILED) : pas encore d'URL
     res = db.query(models.Media)\
-            .filter_by(post_id=post_id)\
+            .filter_by(post_id=post_id, status="READY")\
             .order_by(models.Media.carrousel_rank)\
             .all()
             
@@ -449,8 +503,8 @@ def get_post_media(
 @router.get("/posts/{post_id}/media/first")
 def get_post_first_media(
     post_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(database.get_read_db),
+    current_user: Principal = Depends(get_current_principal),
 ):
     post = db.query(models.Post).filter_by(post_id=post_id).first()
 
@@ -461,7 +515,7 @@ def get_post_first_media(
         raise HTTPException(403, "Post privé")
     
     res = db.query(models.Media)\
-            .filter_by(post_id=post_id)\
+            .filter_by(post_id=post_id, status="READY")\
             .order_by(models.Media.carrousel_rank)\
             .first()
             
@@ -480,10 +534,16 @@ def get_post_first_media(
 # ============================================================
 @router.get("/posts")
 def get_post(
+    response: Response,
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
-    sql = text("""
+    limit = pagination.clamp_limit(limit)
+    after, after_params = pagination.keyset_filter(cursor, ["p.publication_date", "p.post_id"])
+
+    sql = text(f"""
         SELECT 
             p.post_id, p.post_title, p.post_description, p.publication_date, 
             p.latitude, p.longitude, p.user_id,
@@ -492,35 +552,45 @@ def get_post(
             pl.place_name,
             c.city_name,
             
-            (SELECT GROUP_CONCAT(media_url SEPARATOR ',') FROM media m WHERE m.post_id = p.post_id) as media_urls,
-            (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.post_id) as likes_count,
-            (SELECT COUNT(*) FROM comments c WHERE c.post_id = p.post_id) as comments_count,
-            (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.post_id AND l.user_id = :me) as is_liked
+            (SELECT GROUP_CONCAT(media_url SEPARATOR ',') FROM media m WHERE m.post_id = p.post_id AND m.status = 'READY') as media_urls,
+            COALESCE(ps.likes_count, 0) as likes_count,
+            COALESCE(ps.comments_count, 0) as comments_count,
+            (ml.user_id IS NOT NULL) as is_liked
 
         FROM posts p
         JOIN users u ON u.user_id = p.user_id
+        LEFT JOIN post_stats ps ON ps.post_id = p.post_id
+        LEFT JOIN likes ml ON ml.post_id = p.post_id AND ml.user_id = :me
         LEFT JOIN trips t ON p.trip_id = t.trip_id
         LEFT JOIN places pl ON p.place_id = pl.place_id
         LEFT JOIN cities c ON pl.city_id = c.city_id
         WHERE p.user_id = :me
-        ORDER BY p.publication_date DESC
+        {after}
+        ORDER BY p.publication_date DESC, p.post_id DESC
+        LIMIT :limit
     """)
 
-    res = db.execute(sql, {"me": current_user.user_id}).mappings().all()
-    return list(res)
+    res = db.execute(sql, {"me": current_user.user_id, "limit": limit + 1, **after_params}).mappings().all()
+    return pagination.paginate(response, res, limit, ["publication_date", "post_id"])
     
 
 # ============================================================
 # 10. FEED DÉCOUVERTE (CORRIGÉ : SÉPARATION DES TYPES)
 # ============================================================
 @router.get("/feed/discovery")
-def get_discovery_feed(
+async def get_discovery_feed(
+    response: Response,
     post_type: str = "POST",
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: Principal = Depends(get_current_principal),
 ):
+    limit = pagination.clamp_limit(limit)
+    after, after_params = pagination.keyset_filter(cursor, ["p.publication_date", "p.post_id"])
+
     # CORRECTION CRUCIALE : Ajout de "WHERE post_type = :ptype" DANS LA SOUS-REQUÊTE
-    sql = text("""
+    sql = text(f"""
         SELECT 
             p.post_id, p.post_title, p.post_description, p.publication_date, p.longitude, p.latitude, p.post_type,
             u.user_id, u.username, u.profile_picture,
@@ -529,13 +599,15 @@ def get_discovery_feed(
             pl.place_name,            
             c.city_name,              
             
-            (SELECT GROUP_CONCAT(media_url SEPARATOR ',') FROM media m WHERE m.post_id = p.post_id) as media_urls,
-            (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.post_id) as likes_count,
-            (SELECT COUNT(*) FROM comments c WHERE c.post_id = p.post_id) as comments_count,
-            (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.post_id AND l.user_id = :uid) as is_liked
+            (SELECT GROUP_CONCAT(media_url SEPARATOR ',') FROM media m WHERE m.post_id = p.post_id AND m.status = 'READY') as media_urls,
+            COALESCE(ps.likes_count, 0) as likes_count,
+            COALESCE(ps.comments_count, 0) as comments_count,
+            (ml.user_id IS NOT NULL) as is_liked
 
         FROM posts p
         JOIN users u ON u.user_id = p.user_id
+        LEFT JOIN post_stats ps ON ps.post_id = p.post_id
+        LEFT JOIN likes ml ON ml.post_id = p.post_id AND ml.user_id = :uid
         LEFT JOIN trips t ON p.trip_id = t.trip_id          
         LEFT JOIN places pl ON p.place_id = pl.place_id     
         LEFT JOIN cities c ON pl.city_id = c.city_id        
@@ -547,24 +619,37 @@ def get_discovery_feed(
         ) latest ON p.user_id = latest.user_id AND p.publication_date = latest.max_date
         WHERE p.user_id != :uid
         AND p.post_type = :ptype
-        ORDER BY p.publication_date DESC;
+        {after}
+        ORDER BY p.publication_date DESC, p.post_id DESC
+        LIMIT :limit;
     """)
 
-    res = db.execute(sql, {"uid": current_user.user_id, "ptype": post_type}).mappings().all()
-    return list(res)
+    res = (await db.execute(sql, {
+        "uid": current_user.user_id,
+        "ptype": post_type,
+        "limit": limit + 1,
+        **after_params,
+    })).mappings().all()
+    return pagination.paginate(response, res, limit, ["publication_date", "post_id"])
 
 
 # ============================================================
 # 11. POSTS D'UN UTILISATEUR
 # ============================================================
 @router.get("/posts/user/{target_user_id}")
-def get_posts_by_user(
+async def get_posts_by_user(
+    response: Response,
     target_user_id: int,
     post_type: str = "POST",
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: Principal = Depends(get_current_principal),
 ):
-    sql = text("""
+    limit = pagination.clamp_limit(limit)
+    after, after_params = pagination.keyset_filter(cursor, ["p.publication_date", "p.post_id"])
+
+    sql = text(f"""
         SELECT 
             p.post_id, p.post_title, p.post_description, p.publication_date, 
             p.latitude, p.longitude, p.post_type, 
@@ -573,26 +658,32 @@ def get_posts_by_user(
             pl.place_name,
             c.city_name,
             
-            (SELECT GROUP_CONCAT(media_url SEPARATOR ',') FROM media m WHERE m.post_id = p.post_id) as media_urls,
-            (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.post_id) as likes_count,
-            (SELECT COUNT(*) FROM comments c WHERE c.post_id = p.post_id) as comments_count,
-            (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.post_id AND l.user_id = :current_id) as is_liked
+            (SELECT GROUP_CONCAT(media_url SEPARATOR ',') FROM media m WHERE m.post_id = p.post_id AND m.status = 'READY') as media_urls,
+            COALESCE(ps.likes_count, 0) as likes_count,
+            COALESCE(ps.comments_count, 0) as comments_count,
+            (ml.user_id IS NOT NULL) as is_liked
 
         FROM posts p
         JOIN users u ON u.user_id = p.user_id
+        LEFT JOIN post_stats ps ON ps.post_id = p.post_id
+        LEFT JOIN likes ml ON ml.post_id = p.post_id AND ml.user_id = :current_id
         LEFT JOIN trips t ON p.trip_id = t.trip_id
         LEFT JOIN places pl ON p.place_id = pl.place_id
         LEFT JOIN cities c ON pl.city_id = c.city_id
         WHERE p.user_id = :target_id
         AND p.post_type = :ptype
         AND (p.privacy = 'PUBLIC' OR p.user_id = :current_id)
-        ORDER BY p.publication_date DESC;
+        {after}
+        ORDER BY p.publication_date DESC, p.post_id DESC
+        LIMIT :limit;
     """)
 
-    res = db.execute(sql, {
+    res = (await db.execute(sql, {
         "target_id": target_user_id,
         "current_id": current_user.user_id,
-        "ptype": post_type
-    }).mappings().all()
+        "ptype": post_type,
+        "limit": limit + 1,
+        **after_params,
+    })).mappings().all()
     
-    return list(res)
\ No newline at end of file
+    return pagination.paginate(response, res, limit, ["publication_date", "post_id"])
\ No newline at end of file
@@ -0,0 +1,223 @@
+# routers/stats.py
+from fastapi import APIRouter, Depends
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import get_db
+import cache
+import database
+import models
+import profiler
+from .auth import get_current_user
+
+router = APIRouter(tags=["Stats"])
+
+
+STAT_COLUMNS = ["likes_count", "comments_count", "shares_count", "saves_count", "views_count"]
+
+
+# 🔧 Helper réutilisable dans les routers (likes, commentaires, partages...)
+def bump_post_stat(db: Session, post_id: int, column: str, delta: int = 1):
+    """
+    Incrémente (ou décrémente) un compteur de post_stats.
+    Pas de commit ici : l'appelant commit en même temps que le like / commentaire,
+    comme ça le compteur reste cohérent avec la table source.
+    """
+    if column not in STAT_COLUMNS:
+        raise ValueError(f"Compteur inconnu : {column}")
+
+    sql = text(f"""
+        INSERT INTO post_stats (post_id, {column}, last_modification_date)
+        VALUES (:pid, GREATEST(:delta, 0), CURRENT_TIMESTAMP)
+        ON DUPLICATE KEY UPDATE
+            {column} = GREATEST({column} + :delta, 0),
+            last_modification_date = CURRENT_TIMESTAMP
+    """)
+    db.execute(sql, {"pid": post_id, "delta": delta})
+
+
+def bump_post_stats_many(db: Session, column: str, deltas: dict[int, int]):
+    """
+    Version groupée de bump_post_stat pour des deltas positifs (vues...) :
+    {post_id: delta} en un seul executemany (INSERT multi-lignes côté MySQL).
+    Pas de commit ici non plus.
+    """
+    if column not in STAT_COLUMNS:
+        raise ValueError(f"Compteur inconnu : {column}")
+    if not deltas:
+        return
+
+    sql = text(f"""
+        INSERT INTO post_stats (post_id, {column}, last_modification_date)
+        VALUES (:pid, GREATEST(:delta, 0), CURRENT_TIMESTAMP)
+        ON DUPLICATE KEY UPDATE
+            {column} = GREATEST({column} + VALUES({column}), 0),
+            last_modification_date = CURRENT_TIMESTAMP
+    """)
+    db.execute(sql, [{"pid": post_id, "delta": delta} for post_id, delta in deltas.items()])
+
+
+def reconcile_post_stats(db: Session):
+    """
+    Recalcule tous les compteurs depuis les tables sources (likes, comments...).
+    Sert à corriger une éventuelle dérive ; l'event ev_reconcile_post_stats
+    (init_events.sql) fait la même chose toutes les nuits.
+    """
+    sql = text("""
+        INSERT INTO post_stats (
+            post_id,
+            likes_count,
+            comments_count,
+            shares_count,
+            saves_count,
+            views_count,
+            last_modification_date
+        )
+        SELECT
+            p.post_id,
+            (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.post_id),
+            (SELECT COUNT(*) FROM comments c WHERE c.post_id = p.post_id),
+            (SELECT COUNT(*) FROM post_shares s WHERE s.post_id = p.post_id),
+            (SELECT COUNT(*) FROM saved_posts sp WHERE sp.post_id = p.post_id),
+            (SELECT COUNT(*) FROM user_interactions ui WHERE ui.post_id = p.post_id AND ui.interaction_type = 'VIEW'),
+            CURRENT_TIMESTAMP
+        FROM posts p
+        ON DUPLICATE KEY UPDATE
+            likes_count = VALUES(likes_count),
+            comments_count = VALUES(comments_count),
+            shares_count = VALUES(shares_count),
+            saves_count = VALUES(saves_count),
+            views_count = VALUES(views_count),
+            last_modification_date = CURRENT_TIMESTAMP
+    """)
+    db.execute(sql)
+    db.commit()
+
+
+USER_STAT_COLUMNS = ["followers_count", "following_count", "posts_count", "trips_count", "friends_count"]
+# Compteurs privés de user_stats, lus par GET /me/badges uniquement
+BADGE_COLUMNS = [
+    "unread_messages_count",
+    "unread_notifications_count",
+    "pending_follow_requests_count",
+    "pending_friend_requests_count",
+]
+
+
+def bump_user_stat(db: Session, user_id: int, column: str, delta: int = 1):
+    """
+    Même principe que bump_post_stat, pour les compteurs de profil et les badges (user_stats).
+    Pas de commit ici : l'appelant commit avec le follow / post / voyage / message.
+    """
+    if column not in USER_STAT_COLUMNS and column not in BADGE_COLUMNS:
+        raise ValueError(f"Compteur inconnu : {column}")
+
+    sql = text(f"""
+        INSERT INTO user_stats (user_id, {column}, last_modification_date)
+        VALUES (:uid, GREATEST(:delta, 0), CURRENT_TIMESTAMP)
+        ON DUPLICATE KEY UPDATE
+            {column} = GREATEST({column} + :delta, 0),
+            last_modification_date = CURRENT_TIMESTAMP
+    """)
+    db.execute(sql, {"uid": user_id, "delta": delta})
+
+
+def reconcile_user_stats(db: Session):
+    """
+    Recalcule les compteurs de profil depuis followers / posts / trips / friends,
+    et les badges depuis private_messages / notifications / demandes en attente.
+    L'event ev_reconcile_user_stats (init_events.sql) le fait toutes les nuits.
+    """
+    sql = text("""
+        INSERT INTO user_stats (
+            user_id,
+            followers_count,
+            following_count,
+            posts_count,
+            trips_count,
+            friends_count,
+            unread_messages_count,
+            unread_notifications_count,
+            pending_follow_requests_count,
+            pending_friend_requests_count,
+            last_modification_date
+        )
+        SELECT
+            u.user_id,
+            (SELECT COUNT(*) FROM followers f WHERE f.user_id = u.user_id AND f.status = 'ACCEPTED'),
+            (SELECT COUNT(*) FROM followers f WHERE f.follower_user_id = u.user_id AND f.status = 'ACCEPTED'),
+            (SELECT COUNT(*) FROM posts p WHERE p.user_id = u.user_id),
+            (SELECT COUNT(*) FROM trips t WHERE t.user_id = u.user_id),
+            (SELECT COUNT(DISTINCT CASE WHEN fr.user_id = u.user_id THEN fr.user_id_friend ELSE fr.user_id END)
+             FROM friends fr
+             WHERE fr.status = 'ACCEPTED' AND (fr.user_id = u.user_id OR fr.user_id_friend = u.user_id)),
+            (SELECT COUNT(*) FROM private_messages pm WHERE pm.receiver_id = u.user_id AND pm.is_read_flag = 'N'),
+            (SELECT COUNT(*) FROM notifications n WHERE n.user_id = u.user_id AND n.is_read_flag = 'N'),
+            (SELECT COUNT(*) FROM followers f WHERE f.user_id = u.user_id AND f.status = 'PENDING'),
+            (SELECT COUNT(*) FROM friends fr WHERE fr.user_id_friend = u.user_id AND fr.status = 'PENDING'),
+            CURRENT_TIMESTAMP
+        FROM users u
+        ON DUPLICATE KEY UPDATE
+            followers_count = VALUES(followers_count),
+            following_count = VALUES(following_count),
+            posts_count = VALUES(posts_count),
+            trips_count = VALUES(trips_count),
+            friends_count = VALUES(friends_count),
+            unread_messages_count = VALUES(unread_messages_count),
+            unread_notifications_count = VALUES(unread_notifications_count),
+            pending_follow_requests_count = VALUES(pending_follow_requests_count),
+            pending_friend_requests_count = VALUES(pending_friend_requests_count),
+            last_modification_date = CURRENT_TIMESTAMP
+    """)
+    db.execute(sql)
+    db.commit()
+
+
+@router.post("/admin/posts/stats/reconcile")
+def reconcile_stats(
+    db: Session = Depends(get_db),
+    _current_user: models.User = Depends(get_current_user),
+):
+    reconcile_post_stats(db)
+    return {"message": "post_stats recalculée"}
+
+
+@router.post("/admin/users/stats/reconcile")
+def reconcile_users_stats(
+    db: Session = Depends(get_db),
+    _current_user: models.User = Depends(get_current_user),
+):
+    reconcile_user_stats(db)
+    return {"message": "user_stats recalculée"}
+
+
+@router.get("/admin/cache/stats")
+def cache_stats(
+    _current_user: models.User = Depends(get_current_user),
+):
+    return cache.get_stats()
+
+
+@router.get("/admin/db/pool")
+def db_pool_stats(
+    _current_user: models.User = Depends(get_current_user),
+):
+    return database.get_pool_stats()
+
+
+# ============================================================
+# PROFILAGE SQL (staging, SQL_PROFILE=1)
+# ============================================================
+@router.get("/admin/profiler")
+def sql_profile_report(
+    top: int = 10,
+    _current_user: models.User = Depends(get_current_user),
+):
+    return profiler.report(top)
+
+
+@router.delete("/admin/profiler")
+def reset_sql_profile(
+    _current_user: models.User = Depends(get_current_user),
+):
+    profiler.reset()
+    return {"message": "profil SQL remis à zéro"}
@@ -1,20 +1,23 @@
 from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from datetime import datetime, timezone, timedelta
-import cloudinary
-import cloudinary.uploader
+from sqlalchemy import text, bindparam
+from datetime import datetime, timezone
 
+import cache
 import database
 import models
-from .auth import get_current_user
+from .auth import Principal, get_current_principal, get_current_user
+from .uploads import spool_upload, submit_upload
 
 router = APIRouter(tags=["Stories"])
 
+STORIES_CACHE_TTL = 30
+
 # ============================================================
 # 1. CRÉER UNE STORY
 # ============================================================
-@router.post("/stories")
+@router.post("/stories", status_code=202)
 def create_story(
     file: UploadFile = File(...),
     caption: str = Form(None),
@@ -23,49 +26,26 @@ def create_story(
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    try:
-        upload = cloudinary.uploader.upload(
-            file.file,
-            folder=f"stories/{current_user.user_id}/",
-            resource_type="auto"
-        )
-    except Exception as e:
-        raise HTTPException(500, f"Erreur Cloudinary: {e}")
-
-    media_type = "IMAGE"
-    if upload.get("resource_type") == "video":
-        media_type = "VIDEO"
-
-    now = datetime.now(timezone.utc)
-    expires_at = now + timedelta(hours=24)
-
-    story = models.Story(
-        user_id=current_user.user_id,
-        media_url=upload["secure_url"],
-        thumbnail_url=upload.get("thumbnail_url"),
-        media_type=media_type,
-        caption=caption,
-        latitude=latitude,
-        longitude=longitude,
-        created_at=now,
-        expires_at=expires_at,
-        view_count=0
+    # La story est créée par le worker d'upload (routers/uploads.py) une fois
+    # le média en ligne : jamais de story sans image dans les feeds.
+    job = spool_upload(
+        db, file, current_user.user_id, "STORY",
+        folder=f"stories/{current_user.user_id}/",
+        payload={"caption": caption, "latitude": latitude, "longitude": longitude},
     )
-
-    db.add(story)
     db.commit()
-    db.refresh(story)
+    submit_upload(job.job_id)
 
-    return {"message": "Story publiée", "story_id": story.story_id, "url": story.media_url}
+    return {"message": "Story en cours de publication", "job_id": job.job_id, "status": "PENDING"}
 
 
 # ============================================================
 # 2. FEED DES STORIES (CORRIGÉ)
 # ============================================================
 @router.get("/stories/feed")
-def get_stories_feed(
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+async def get_stories_feed(
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: Principal = Depends(get_current_principal),
 ):
     now = datetime.now(timezone.utc)
 
@@ -97,7 +77,7 @@ def get_stories_feed(
         ORDER BY s.created_at ASC
     """)
 
-    rows = db.execute(sql, {"me": current_user.user_id, "now": now}).mappings().all()
+    rows = (await db.execute(sql, {"me": current_user.user_id, "now": now})).mappings().all()
 
     grouped_stories = {}
 
@@ -217,6 +197,7 @@ def delete_story(
 
     db.delete(story)
     db.commit()
+    cache.invalidate(f"stories:user:{current_user.user_id}")
 
     return {"message": "Story supprimée"}
 
@@ -228,27 +209,51 @@ def delete_story(
 def get_user_stories(
     target_user_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     now = datetime.now(timezone.utc)
-    sql = text("""
-        SELECT 
-            s.story_id, s.media_url, s.media_type, s.created_at, s.caption, s.latitude, s.longitude,
-            CASE WHEN sv.viewed_at IS NOT NULL THEN 1 ELSE 0 END as is_viewed
-        FROM stories s
-        LEFT JOIN story_views sv ON s.story_id = sv.story_id AND sv.user_id = :me
-        WHERE s.user_id = :target
-        AND s.expires_at > :now
-        ORDER BY s.created_at ASC
-    """)
 
-    rows = db.execute(sql, {"me": current_user.user_id, "target": target_user_id, "now": now}).mappings().all()
+    # Les stories de l'utilisateur (communes à tous les lecteurs) passent par le cache,
+    # invalidé par create_story / delete_story.
+    def load_stories():
+        sql = text("""
+            SELECT 
+                s.story_id, s.media_url, s.media_type, s.created_at, s.expires_at,
+                s.caption, s.latitude, s.longitude
+            FROM stories s
+            WHERE s.user_id = :target
+            AND s.expires_at > :now
+            ORDER BY s.created_at ASC
+        """)
+        return db.execute(sql, {"target": target_user_id, "now": now}).mappings().all()
+
+    rows = cache.get_or_set(
+        f"stories:user:{target_user_id}",
+        load_stories,
+        ttl=STORIES_CACHE_TTL,
+        tags=[f"stories:user:{target_user_id}"],
+    )
+    # Une story peut avoir expiré depuis sa mise en cache
+    now_naive = now.replace(tzinfo=None)
+    rows = [r for r in rows if datetime.fromisoformat(r["expires_at"]).replace(tzinfo=None) > now_naive]
+
+    # Seule partie propre au lecteur : quelles stories ai-je déjà vues ?
+    viewed = set()
+    if rows:
+        viewed_sql = text("""
+            SELECT story_id FROM story_views
+            WHERE user_id = :me AND story_id IN :ids
+        """).bindparams(bindparam("ids", expanding=True))
+        viewed = set(db.execute(viewed_sql, {
+            "me": current_user.user_id,
+            "ids": [r["story_id"] for r in rows],
+        }).scalars().all())
 
     stories = []
     all_seen = True
 
     for row in rows:
-        is_viewed = bool(row["is_viewed"])
+        is_viewed = row["story_id"] in viewed
         if not is_viewed:
             all_seen = False
             
@@ -267,4 +272,4 @@ def get_user_stories(
         "user_id": target_user_id,
         "all_seen": all_seen,
         "stories": stories
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,192 @@
+# routers/timeline.py
+import os
+from fastapi import APIRouter, Depends
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import get_db
+import models
+from .auth import get_admin_user
+
+router = APIRouter(tags=["Timeline"])
+
+
+# Au-delà de ce nombre d'abonnés, on ne recopie pas les posts chez chaque abonné :
+# ils sont fusionnés à la lecture (fan-out-on-read) dans /posts/feed.
+CELEBRITY_FOLLOWER_THRESHOLD = int(os.getenv("TIMELINE_CELEBRITY_THRESHOLD", "5000"))
+
+# Nombre de posts recopiés quand une relation (follow / ami) apparaît
+BACKFILL_LIMIT = int(os.getenv("TIMELINE_BACKFILL_LIMIT", "200"))
+
+# Lecteurs traités par transaction lors d'une reconstruction complète
+REBUILD_CHUNK = int(os.getenv("TIMELINE_REBUILD_CHUNK", "500"))
+
+
+def is_celebrity(db: Session, user_id: int) -> bool:
+    # Compteur maintenu par routers/followers.py (cf. user_stats)
+    sql = text("SELECT followers_count FROM user_stats WHERE user_id = :uid")
+    return (db.execute(sql, {"uid": user_id}).scalar() or 0) > CELEBRITY_FOLLOWER_THRESHOLD
+
+
+# 🔧 Helpers appelés par les routers (pas de commit : l'appelant commit)
+def fan_out_post(db: Session, post: models.Post):
+    """
+    Recopie le post dans la timeline de son public :
+    - l'auteur lui-même
+    - ses amis (PUBLIC / FRIENDS)
+    - ses abonnés (PUBLIC), sauf si l'auteur est une "célébrité"
+    Idempotent : on retire d'abord les lignes existantes, donc on peut
+    le rappeler après un changement de confidentialité du post.
+    """
+    retract_post(db, post.post_id)
+
+    fanout_followers = 0 if is_celebrity(db, post.user_id) else 1
+
+    sql = text("""
+        INSERT IGNORE INTO timelines (user_id, publication_date, post_id, post_type, author_id)
+        SELECT audience.uid, :pdate, :pid, :ptype, :author
+        FROM (
+            SELECT :author AS uid
+
+            UNION
+
+            SELECT CASE WHEN f.user_id = :author THEN f.user_id_friend ELSE f.user_id END
+            FROM friends f
+            WHERE f.status = 'ACCEPTED'
+              AND (f.user_id = :author OR f.user_id_friend = :author)
+              AND :privacy IN ('PUBLIC', 'FRIENDS')
+
+            UNION
+
+            SELECT fo.follower_user_id
+            FROM followers fo
+            WHERE fo.user_id = :author
+              AND fo.status = 'ACCEPTED'
+              AND :privacy = 'PUBLIC'
+              AND :fanout_followers = 1
+        ) audience
+    """)
+    db.execute(sql, {
+        "pid": post.post_id,
+        "pdate": post.publication_date,
+        "ptype": post.post_type,
+        "author": post.user_id,
+        "privacy": post.privacy,
+        "fanout_followers": fanout_followers,
+    })
+
+
+def retract_post(db: Session, post_id: int):
+    db.execute(text("DELETE FROM timelines WHERE post_id = :pid"), {"pid": post_id})
+
+
+def sync_author_in_timeline(db: Session, viewer_id: int, author_id: int):
+    """
+    À appeler quand la relation viewer -> author change (follow, unfollow, amitié...).
+    Retire les posts de l'auteur de la timeline du lecteur puis remet les
+    BACKFILL_LIMIT plus récents qu'il a désormais le droit de voir.
+    """
+    db.execute(
+        text("DELETE FROM timelines WHERE user_id = :viewer AND author_id = :author"),
+        {"viewer": viewer_id, "author": author_id},
+    )
+
+    sql = text("""
+        INSERT IGNORE INTO timelines (user_id, publication_date, post_id, post_type, author_id)
+        SELECT :viewer, p.publication_date, p.post_id, p.post_type, p.user_id
+        FROM posts p
+        WHERE p.user_id = :author
+        AND (
+            (p.privacy IN ('PUBLIC', 'FRIENDS') AND EXISTS (
+                SELECT 1 FROM friends f
+                WHERE f.status = 'ACCEPTED'
+                AND (
+                    (f.user_id = :viewer AND f.user_id_friend = :author)
+                    OR (f.user_id = :author AND f.user_id_friend = :viewer)
+                )
+            ))
+            OR (p.privacy = 'PUBLIC' AND :fanout_followers = 1 AND EXISTS (
+                SELECT 1 FROM followers fo
+                WHERE fo.user_id = :author AND fo.follower_user_id = :viewer AND fo.status = 'ACCEPTED'
+            ))
+        )
+        ORDER BY p.publication_date DESC
+        LIMIT :backfill
+    """)
+    db.execute(sql, {
+        "viewer": viewer_id,
+        "author": author_id,
+        "fanout_followers": 0 if is_celebrity(db, author_id) else 1,
+        "backfill": BACKFILL_LIMIT,
+    })
+
+
+def rebuild_timelines(db: Session) -> int:
+    """
+    Reconstruit toutes les timelines depuis posts / friends / followers.
+    Opération lourde (migration de déploiement, incident) : par lots de
+    TIMELINE_REBUILD_CHUNK lecteurs, un commit par lot. La table n'est jamais
+    vidée d'un coup et chaque transaction reste courte.
+    Renvoie le nb de lignes écrites.
+    """
+    written = 0
+    last_user_id = 0
+    while True:
+        readers = db.execute(
+            text("SELECT user_id FROM users WHERE user_id > :last ORDER BY user_id LIMIT :n"),
+            {"last": last_user_id, "n": REBUILD_CHUNK},
+        ).scalars().all()
+        if not readers:
+            return written
+        params = {"lo": readers[0], "hi": readers[-1], "threshold": CELEBRITY_FOLLOWER_THRESHOLD}
+
+        db.execute(text("DELETE FROM timelines WHERE user_id BETWEEN :lo AND :hi"), params)
+
+        # 1) Mes propres posts
+        written += db.execute(text("""
+            INSERT IGNORE INTO timelines (user_id, publication_date, post_id, post_type, author_id)
+            SELECT p.user_id, p.publication_date, p.post_id, p.post_type, p.user_id
+            FROM posts p
+            WHERE p.user_id BETWEEN :lo AND :hi
+        """), params).rowcount
+
+        # 2) Posts de mes amis
+        written += db.execute(text("""
+            INSERT IGNORE INTO timelines (user_id, publication_date, post_id, post_type, author_id)
+            SELECT r.reader, p.publication_date, p.post_id, p.post_type, p.user_id
+            FROM (
+                SELECT f.user_id AS reader, f.user_id_friend AS author
+                FROM friends f
+                WHERE f.status = 'ACCEPTED' AND f.user_id BETWEEN :lo AND :hi
+                UNION ALL
+                SELECT f.user_id_friend, f.user_id
+                FROM friends f
+                WHERE f.status = 'ACCEPTED' AND f.user_id_friend BETWEEN :lo AND :hi
+            ) r
+            JOIN posts p ON p.user_id = r.author
+            WHERE p.privacy IN ('PUBLIC', 'FRIENDS')
+        """), params).rowcount
+
+        # 3) Posts publics des comptes que je suis (hors célébrités)
+        written += db.execute(text("""
+            INSERT IGNORE INTO timelines (user_id, publication_date, post_id, post_type, author_id)
+            SELECT fo.follower_user_id, p.publication_date, p.post_id, p.post_type, p.user_id
+            FROM followers fo
+            JOIN posts p ON p.user_id = fo.user_id
+            LEFT JOIN user_stats us ON us.user_id = p.user_id
+            WHERE fo.follower_user_id BETWEEN :lo AND :hi
+            AND fo.status = 'ACCEPTED'
+            AND p.privacy = 'PUBLIC'
+            AND COALESCE(us.followers_count, 0) <= :threshold
+        """), params).rowcount
+
+        db.commit()
+        last_user_id = readers[-1]
+
+
+@router.post("/admin/timelines/rebuild")
+def rebuild_all_timelines(
+    db: Session = Depends(get_db),
+    _admin: models.User = Depends(get_admin_user),
+):
+    written = rebuild_timelines(db)
+    return {"message": "timelines reconstruites", "rows": written}
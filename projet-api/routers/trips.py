@@ -1,15 +1,19 @@
 # routers/trips.py
 
-from fastapi import APIRouter, Depends, HTTPException, Form, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, Form, File, UploadFile, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from datetime import datetime, timezone
 import cloudinary
 import cloudinary.uploader
 import os
+import cache
 import database
 import models
+import pagination
 from .auth import get_current_user
+from .stats import bump_user_stat
+from .uploads import spool_upload, submit_upload
 
 router = APIRouter(tags=["Trips"])
 
@@ -35,22 +39,7 @@ def create_trip(
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    # 1. Upload de la bannière
-    banner_url = None
-    if banner_file:
-        try:
-            print(f"📤 Tentative upload banner: {banner_file.filename}")
-            upload_result = cloudinary.uploader.upload(
-                banner_file.file,
-                folder="trips/banners",
-                resource_type="image"
-            )
-            banner_url = upload_result.get("secure_url")
-            print(f"✅ Banner uploadée: {banner_url}")
-        except Exception as e:
-            print(f"⚠️ Erreur upload banner: {e}")
-
-    # 2. Création
+    # 1. Création (la bannière est ajoutée par le worker d'upload)
     trip = models.Trip(
         trip_title=trip_title,
         trip_description=trip_description,
@@ -58,17 +47,36 @@ def create_trip(
         end_date=end_date,
         is_public_flag="Y" if is_public else "N",
         user_id=current_user.user_id,
-        banner=banner_url,
+        banner=None,
         created_by=current_user.user_id,
         last_modified_by=current_user.user_id,
         last_modification_date=datetime.now(timezone.utc)
     )
 
     db.add(trip)
+    db.flush()
+    bump_user_stat(db, current_user.user_id, "trips_count", 1)
+
+    # 2. Upload de la bannière en arrière-plan
+    job = None
+    if banner_file:
+        job = spool_upload(
+            db, banner_file, current_user.user_id, "TRIP_BANNER",
+            folder="trips/banners", target_id=trip.trip_id, resource_type="image",
+        )
+
     db.commit()
     db.refresh(trip)
+    cache.invalidate("trips:public", f"user:{current_user.user_id}")
+    if job:
+        submit_upload(job.job_id)
 
-    return {"message": "Voyage créé", "trip_id": trip.trip_id, "banner_url": banner_url}
+    return {
+        "message": "Voyage créé",
+        "trip_id": trip.trip_id,
+        "banner_url": None,
+        "banner_job_id": job.job_id if job else None,
+    }
 
 
 # ============================================================
@@ -115,6 +123,7 @@ def update_trip(
     trip.last_modification_date = datetime.now(timezone.utc)
 
     db.commit()
+    cache.invalidate("trips:public")
     return {"message": "Voyage mis à jour"}
 
 
@@ -135,8 +144,10 @@ def delete_trip(
     if trip.user_id != current_user.user_id:
         raise HTTPException(403, "Tu ne peux supprimer que tes voyages")
 
+    bump_user_stat(db, current_user.user_id, "trips_count", -1)
     db.delete(trip)
     db.commit()
+    cache.invalidate("trips:public", f"user:{current_user.user_id}")
 
     return {"message": "Voyage supprimé"}
 
@@ -183,10 +194,13 @@ def get_my_trips(
 # ============================================================
 @router.get("/trips/public")
 def get_public_trips(
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
 ):
-    trips = db.query(models.Trip).filter_by(is_public_flag="Y").all()
-    return trips
+    return cache.get_or_set(
+        "trips:public",
+        lambda: db.query(models.Trip).filter_by(is_public_flag="Y").all(),
+        tags=["trips:public"],
+    )
 
 
 # ============================================================
@@ -304,8 +318,11 @@ def list_trip_places(
 # ============================================================
 @router.get("/trips/{trip_id}/posts")
 def get_trip_posts(
+    response: Response,
     trip_id: int,
-    db: Session = Depends(database.get_db),
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
+    db: Session = Depends(database.get_read_db),
     current_user: models.User = Depends(get_current_user),
 ):
     # 1. Vérification d'accès
@@ -317,32 +334,44 @@ def get_trip_posts(
     if trip.is_public_flag == "N" and trip.user_id != current_user.user_id:
         raise HTTPException(403, "Voyage privé")
 
+    limit = pagination.clamp_limit(limit)
+    after, after_params = pagination.keyset_filter(cursor, ["p.creation_date", "p.post_id"], order="ASC")
+
     # 2. Requête SQL complète (Style Feed)
     # C'est ce qui manquait : récupération du user, des likes, des commentaires et des images.
-    sql = text("""
+    sql = text(f"""
         SELECT 
             p.*, 
             u.username, 
             u.profile_picture,
             
             -- Récupération des médias concaténés
-            (SELECT GROUP_CONCAT(media_url SEPARATOR ',') FROM media m WHERE m.post_id = p.post_id) as media_urls,
+            (SELECT GROUP_CONCAT(media_url SEPARATOR ',') FROM media m WHERE m.post_id = p.post_id AND m.status = 'READY') as media_urls,
             
-            -- Compteurs et Status pour l'utilisateur connecté (:me)
-            (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.post_id) as likes_count,
-            (SELECT COUNT(*) FROM comments c WHERE c.post_id = p.post_id) as comments_count,
-            (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.post_id AND l.user_id = :me) as is_liked
+            -- Compteurs (post_stats) et Status pour l'utilisateur connecté (:me)
+            COALESCE(ps.likes_count, 0) as likes_count,
+            COALESCE(ps.comments_count, 0) as comments_count,
+            (ml.user_id IS NOT NULL) as is_liked
 
         FROM posts p
         JOIN users u ON u.user_id = p.user_id
+        LEFT JOIN post_stats ps ON ps.post_id = p.post_id
+        LEFT JOIN likes ml ON ml.post_id = p.post_id AND ml.user_id = :me
         WHERE p.trip_id = :tid
-        ORDER BY p.creation_date ASC
+        {after}
+        ORDER BY p.creation_date ASC, p.post_id ASC
+        LIMIT :limit
     """)
 
     # Exécution de la requête avec les paramètres
-    res = db.execute(sql, {"tid": trip_id, "me": current_user.user_id}).mappings().all()
+    res = db.execute(sql, {
+        "tid": trip_id,
+        "me": current_user.user_id,
+        "limit": limit + 1,
+        **after_params,
+    }).mappings().all()
 
-    return list(res)
+    return pagination.paginate(response, res, limit, ["creation_date", "post_id"])
 
 
 # ============================================================
@@ -351,7 +380,7 @@ def get_trip_posts(
 @router.get("/trips/user/{target_user_id}")
 def get_trips_by_user(
     target_user_id: int,
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
     current_user: models.User = Depends(get_current_user),
 ):
     query = db.query(models.Trip).filter(models.Trip.user_id == target_user_id)
@@ -0,0 +1,370 @@
+# routers/uploads.py
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from fastapi import APIRouter, Depends, HTTPException, UploadFile
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from database import get_db
+import cache
+import database
+import models
+import storage
+from .assets import enqueue_asset_deletion
+from .auth import get_current_user, invalidate_principal
+from .map import refresh_map_feed_user, upsert_map_feed_post
+
+router = APIRouter(tags=["Uploads"])
+
+
+# ---- Configuration ----
+SPOOL_DIR = Path(os.getenv("UPLOAD_SPOOL_DIR", "/tmp/spotshare-uploads"))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "200"))    # au-delà : 503
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", "3"))
+UPLOAD_RETRY_DELAY = float(os.getenv("UPLOAD_RETRY_DELAY", "2"))  # secondes, doublé à chaque essai
+UPLOAD_ORPHAN_AFTER = int(os.getenv("UPLOAD_ORPHAN_AFTER", "900"))    # s sans activité, fichier absent -> FAILED
+UPLOAD_SWEEP_INTERVAL = int(os.getenv("UPLOAD_SWEEP_INTERVAL", "300"))  # doit rester < UPLOAD_ORPHAN_AFTER
+
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+_in_flight = 0       # jobs réservés (spoolés, pas encore soumis) + soumis au pool
+_reserved = set()    # job_ids réservés par spool_upload, en attente de submit_upload
+_owned = set()       # job_ids soumis au pool de ce process (en file ou en cours)
+_in_flight_lock = threading.Lock()
+
+
+# 🔧 Côté requête : spool sur disque + création du job (pas de commit : l'appelant commit)
+def spool_upload(
+    db: Session,
+    file: UploadFile,
+    user_id: int,
+    target_type: str,
+    folder: str,
+    target_id: int | None = None,
+    payload: dict | None = None,
+    resource_type: str = "auto",
+) -> models.UploadJob:
+    """
+    Copie le fichier reçu dans SPOOL_DIR et crée le job PENDING.
+    Après le commit, appeler submit_upload(job.job_id).
+    La place dans la file est réservée dès maintenant (deux requêtes ne
+    peuvent pas passer le contrôle sur la même place) ; elle est rendue si
+    la transaction est annulée avant submit_upload.
+    """
+    global _in_flight
+    with _in_flight_lock:
+        if _in_flight >= UPLOAD_QUEUE_SIZE:
+            raise HTTPException(503, "Trop d'uploads en cours, réessaie dans quelques secondes")
+        _in_flight += 1
+
+    SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    spool_path = SPOOL_DIR / (uuid.uuid4().hex + Path(file.filename or "").suffix)
+    try:
+        with open(spool_path, "wb") as out:
+            shutil.copyfileobj(file.file, out)
+
+        job = models.UploadJob(
+            user_id=user_id,
+            target_type=target_type,
+            target_id=target_id,
+            payload=payload,
+            folder=folder,
+            resource_type=resource_type,
+            spool_path=str(spool_path),
+            original_filename=file.filename,
+            status="PENDING",
+        )
+        db.add(job)
+        db.flush()
+    except BaseException:
+        with _in_flight_lock:
+            _in_flight -= 1
+        spool_path.unlink(missing_ok=True)
+        raise
+
+    job_id = job.job_id
+    with _in_flight_lock:
+        _reserved.add(job_id)
+    # Transaction terminée sans commit (commit raté, exception dans l'endpoint,
+    # session fermée...) : le job n'existe pas, on rend la place
+    transaction = db.get_transaction()
+    committed = []
+    event.listen(db, "after_commit", lambda _session: committed.append(True), once=True)
+
+    def on_end(_session, ended):
+        if ended is transaction and not committed:
+            _release_reservation(job_id, spool_path)
+
+    event.listen(db, "after_transaction_end", on_end)
+    return job
+
+
+def _release_reservation(job_id: int, spool_path: Path):
+    global _in_flight
+    with _in_flight_lock:
+        if job_id not in _reserved:
+            return  # déjà soumis : la place appartient au worker
+        _reserved.discard(job_id)
+        _in_flight -= 1
+    spool_path.unlink(missing_ok=True)
+
+
+def submit_upload(job_id: int):
+    """Envoie le job au pool de workers (à appeler après le commit)."""
+    global _in_flight
+    with _in_flight_lock:
+        if job_id in _reserved:
+            _reserved.discard(job_id)  # place réservée par spool_upload
+        else:
+            _in_flight += 1  # relance au démarrage : pas de réservation
+        _owned.add(job_id)
+    _executor.submit(_run_job, job_id)
+
+
+def resume_pending_uploads():
+    """
+    Au démarrage : relance les jobs interrompus dont le fichier spoolé
+    est encore sur ce disque (les autres : voir fail_orphaned_uploads).
+    """
+    db = database.SessionLocal()
+    try:
+        jobs = db.query(models.UploadJob).filter(
+            models.UploadJob.status.in_(["PENDING", "UPLOADING"])
+        ).all()
+        job_ids = [job.job_id for job in jobs if Path(job.spool_path).exists()]
+    finally:
+        db.close()
+
+    for job_id in job_ids:
+        submit_upload(job_id)
+
+
+def touch_owned_uploads():
+    """
+    Battement de cœur : rafraîchit last_modification_date des jobs tenus par
+    ce process (même en attente dans la file du pool), pour qu'un autre replica
+    ne les prenne pas pour des orphelins.
+    """
+    with _in_flight_lock:
+        job_ids = list(_owned)
+    if not job_ids:
+        return
+    db = database.SessionLocal()
+    try:
+        db.query(models.UploadJob).filter(
+            models.UploadJob.job_id.in_(job_ids),
+            models.UploadJob.status.in_(["PENDING", "UPLOADING"]),
+        ).update({"last_modification_date": datetime.now(timezone.utc)}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def fail_orphaned_uploads() -> int:
+    """
+    Jobs PENDING / UPLOADING sans activité depuis UPLOAD_ORPHAN_AFTER s et dont
+    le fichier spoolé n'est pas sur ce disque : spool perdu (conteneur recréé,
+    /tmp vidé...), ils n'aboutiront jamais -> FAILED, média compris. Un job
+    tenu par un process vivant est rafraîchi par touch_owned_uploads toutes
+    les UPLOAD_SWEEP_INTERVAL s : seuls ceux d'un process disparu vieillissent.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=UPLOAD_ORPHAN_AFTER)
+    db = database.SessionLocal()
+    try:
+        jobs = db.query(models.UploadJob).filter(
+            models.UploadJob.status.in_(["PENDING", "UPLOADING"]),
+            models.UploadJob.last_modification_date < cutoff,
+        ).all()
+        orphans = [job for job in jobs if not Path(job.spool_path).exists()]
+        for job in orphans:
+            _fail_job(db, job, "Fichier spoolé introuvable (redémarrage ?)")
+        db.commit()
+    finally:
+        db.close()
+
+    if orphans:
+        print(f"⚠️ {len(orphans)} upload(s) sans fichier spoolé passé(s) en FAILED")
+    return len(orphans)
+
+
+def start_upload_sweeper():
+    """Thread de fond : battement de cœur + fail_orphaned_uploads, au démarrage puis toutes les UPLOAD_SWEEP_INTERVAL s."""
+    def loop():
+        while True:
+            try:
+                touch_owned_uploads()
+                fail_orphaned_uploads()
+            except Exception as e:
+                print(f"⚠️ Erreur balayage upload_jobs : {e}")
+            time.sleep(UPLOAD_SWEEP_INTERVAL)
+
+    threading.Thread(target=loop, name="upload-sweeper", daemon=True).start()
+
+
+# ---- Côté worker ----
+def _run_job(job_id: int):
+    global _in_flight
+    try:
+        for attempt in range(1, UPLOAD_MAX_ATTEMPTS + 1):
+            if _attempt_job(job_id, attempt):
+                return
+            time.sleep(UPLOAD_RETRY_DELAY * 2 ** (attempt - 1))
+    finally:
+        with _in_flight_lock:
+            _in_flight -= 1
+            _owned.discard(job_id)
+
+
+def _attempt_job(job_id: int, attempt: int) -> bool:
+    """Un essai d'upload. Renvoie True si le job est terminé (READY ou FAILED)."""
+    db = database.SessionLocal()
+    try:
+        job = db.query(models.UploadJob).filter_by(job_id=job_id).first()
+        if not job or job.status in ("READY", "FAILED"):
+            if job:
+                Path(job.spool_path).unlink(missing_ok=True)
+            return True
+
+        job.status = "UPLOADING"
+        job.attempts = attempt
+        job.last_modification_date = datetime.now(timezone.utc)
+        db.commit()
+
+        result = None
+        try:
+            result = storage.backend.upload(job.spool_path, folder=job.folder, resource_type=job.resource_type)
+            tags = _apply_result(db, job, result)
+            job.status = "READY"
+            job.result_url = result["secure_url"]
+            job.error_message = None
+            job.last_modification_date = datetime.now(timezone.utc)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            job = db.query(models.UploadJob).filter_by(job_id=job_id).first()
+            if result is not None and result.get("public_id"):
+                # Fichier déjà en ligne mais non rattaché (_apply_result ou commit en échec) :
+                # le prochain essai en renverra un autre, celui-ci part à la poubelle
+                enqueue_asset_deletion(db, result["public_id"], result.get("resource_type", "image"))
+            if attempt < UPLOAD_MAX_ATTEMPTS:
+                job.error_message = str(e)[:1000]
+                job.last_modification_date = datetime.now(timezone.utc)
+                job.status = "PENDING"
+                db.commit()
+                return False
+
+            print(f"⚠️ Upload {job_id} abandonné après {attempt} essais : {e}")
+            _fail_job(db, job, str(e))
+            db.commit()
+            Path(job.spool_path).unlink(missing_ok=True)
+            return True
+
+        Path(job.spool_path).unlink(missing_ok=True)
+        if tags:
+            cache.invalidate(*tags)
+        if job.target_type == "AVATAR":
+            invalidate_principal(job.user_id)
+        return True
+    finally:
+        db.close()
+
+
+def _fail_job(db: Session, job: models.UploadJob, error: str):
+    """Job abandonné : FAILED, et son média aussi (jamais affiché). Pas de commit."""
+    job.status = "FAILED"
+    job.error_message = error[:1000]
+    job.last_modification_date = datetime.now(timezone.utc)
+    if job.target_type == "MEDIA":
+        db.query(models.Media).filter_by(media_id=job.target_id).update({"status": "FAILED"})
+
+
+def _apply_result(db: Session, job: models.UploadJob, result: dict) -> list[str]:
+    """
+    Reporte l'URL sur la ligne cible. Renvoie les tags de cache à invalider
+    après le commit.
+    """
+    url = result["secure_url"]
+    media_type = "VIDEO" if result.get("resource_type") == "video" else "IMAGE"
+
+    if job.target_type == "MEDIA":
+        media = db.query(models.Media).filter_by(media_id=job.target_id).first()
+        if not media:  # post supprimé entre-temps : le fichier part à la poubelle
+            enqueue_asset_deletion(db, result["public_id"], result.get("resource_type", "image"))
+            return []
+        media.media_url = url
+        media.thumbnail_url = result.get("thumbnail_url")
+        media.media_type = media_type
+        media.cloud_id = result.get("public_id")
+        media.size = result.get("bytes")
+        media.width = result.get("width")
+        media.height = result.get("height")
+        media.duration_seconds = result.get("duration")
+        media.status = "READY"
+        db.flush()
+        # L'image d'aperçu de la carte peut changer
+        upsert_map_feed_post(db, media.post_id)
+        return []
+
+    if job.target_type == "STORY":
+        # La story n'est publiée qu'une fois le média en ligne
+        payload = job.payload or {}
+        now = datetime.now(timezone.utc)
+        story = models.Story(
+            user_id=job.user_id,
+            media_url=url,
+            thumbnail_url=result.get("thumbnail_url"),
+            media_type=media_type,
+            caption=payload.get("caption"),
+            latitude=payload.get("latitude"),
+            longitude=payload.get("longitude"),
+            created_at=now,
+            expires_at=now + timedelta(hours=24),
+            view_count=0,
+        )
+        db.add(story)
+        db.flush()
+        job.target_id = story.story_id
+        return [f"stories:user:{job.user_id}"]
+
+    if job.target_type == "TRIP_BANNER":
+        db.query(models.Trip).filter_by(trip_id=job.target_id).update({"banner": url})
+        return ["trips:public"]
+
+    if job.target_type == "AVATAR":
+        db.query(models.User).filter_by(user_id=job.user_id).update({"profile_picture": url})
+        refresh_map_feed_user(db, job.user_id)
+        return [f"user:{job.user_id}"]
+
+    raise ValueError(f"Type d'upload inconnu : {job.target_type}")
+
+
+# ============================================================
+# SUIVI D'UN UPLOAD
+# ============================================================
+@router.get("/uploads/{job_id}")
+def get_upload_status(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    job = db.query(models.UploadJob).filter_by(job_id=job_id).first()
+    if not job:
+        raise HTTPException(404, "Upload introuvable")
+    if job.user_id != current_user.user_id:
+        raise HTTPException(403, "Cet upload ne t'appartient pas")
+
+    return {
+        "job_id": job.job_id,
+        "target_type": job.target_type,
+        "target_id": job.target_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": UPLOAD_MAX_ATTEMPTS,
+        "error": job.error_message,
+        "url": job.result_url,
+    }
@@ -1,16 +1,23 @@
 # routers/users.py
 
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from datetime import datetime, timezone, date
 import cloudinary
 import cloudinary.uploader
 import os
+import cache
 import database
-from database import get_db
+from database import get_db, get_read_db
 import models
-from .auth import get_current_user
+import pagination
+from .auth import Principal, get_current_principal, get_current_user, invalidate_principal
+from .followers import get_follow_relations
+from .uploads import spool_upload, submit_upload
+from .map import refresh_map_feed_user
+from .stats import BADGE_COLUMNS, USER_STAT_COLUMNS
 
 router = APIRouter(tags=["Users"])
 
@@ -21,16 +28,21 @@ cloudinary.config(
     api_secret=os.getenv("CLOUDINARY_API_SECRET", "EwbWKNCXrzvYNVNGEG72c0nfBF0"),
 )
 
+# Compteurs de profil (user_stats, maintenus par les routers) : 0 si pas encore de ligne
+_PROFILE_COUNTS = ",\n".join(f"COALESCE(us.{col}, 0) AS {col}" for col in USER_STAT_COLUMNS)
+
+
 @router.get("/me")
 def me(
     db: Session = Depends(get_db),  # <--- Important : on a besoin de la DB ici
     current_user: models.User = Depends(get_current_user)
 ):
-    # 👇 CES LIGNES SONT INDISPENSABLES POUR LE CALCUL
-    followers_count = db.query(models.Follower).filter_by(user_id=current_user.user_id, status="ACCEPTED").count()
-    following_count = db.query(models.Follower).filter_by(follower_user_id=current_user.user_id, status="ACCEPTED").count()
-    posts_count = db.query(models.Post).filter_by(user_id=current_user.user_id).count()
-    # 👆 FIN DU CALCUL
+    # Une seule lecture par clé primaire (plus de COUNT sur followers / posts)
+    counts = db.execute(text(f"""
+        SELECT {_PROFILE_COUNTS}
+        FROM (SELECT :uid AS user_id) me
+        LEFT JOIN user_stats us ON us.user_id = me.user_id
+    """), {"uid": current_user.user_id}).mappings().first()
 
     return {
         "id": current_user.user_id,
@@ -43,36 +55,45 @@ def me(
         "is_private": current_user.is_private_flag == "Y",
         "img": current_user.profile_picture,
         
-        # On injecte les variables calculées au-dessus
-        "followers_count": followers_count,
-        "following_count": following_count,
-        "posts_count": posts_count,
+        # Compteurs lus au-dessus
+        **counts,
     }
 
-@router.post("/me/avatar")
+
+@router.get("/me/badges")
+async def my_badges(
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: Principal = Depends(get_current_principal),
+):
+    """
+    Pastilles de l'app (messages / notifications non lus, demandes en attente).
+    Une lecture par clé primaire dans user_stats, tenue à jour par les routers
+    messages / notifications / followers / friends : rien n'est compté ici.
+    """
+    row = (await db.execute(
+        text(f"SELECT {', '.join(BADGE_COLUMNS)} FROM user_stats WHERE user_id = :uid"),
+        {"uid": current_user.user_id},
+    )).mappings().first()
+    return {col: row[col] if row else 0 for col in BADGE_COLUMNS}
+
+@router.post("/me/avatar", status_code=202)
 def upload_avatar(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
     """
-    Upload / met à jour la photo de profil sur Cloudinary.
+    Upload / met à jour la photo de profil (en arrière-plan, cf. routers/uploads.py).
+    La photo, la carte et les caches sont mis à jour par le worker.
     """
-    try:
-        upload_result = cloudinary.uploader.upload(
-            file.file,
-            folder=f"user_{current_user.user_id}/profile/",
-            unique_filename=True,
-            overwrite=True,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur upload Cloudinary : {e}")
-
-    current_user.profile_picture = upload_result["secure_url"]
+    job = spool_upload(
+        db, file, current_user.user_id, "AVATAR",
+        folder=f"user_{current_user.user_id}/profile/", target_id=current_user.user_id, resource_type="image",
+    )
     db.commit()
-    db.refresh(current_user)
+    submit_upload(job.job_id)
 
-    return {"message": "Image uploadée ✅", "url": current_user.profile_picture}
+    return {"message": "Image en cours d'upload", "job_id": job.job_id, "status": "PENDING"}
 
 
 @router.put("/me")
@@ -104,6 +125,8 @@ def update_profile(
     current_user.last_modification_date = datetime.now(timezone.utc)
     db.commit()
     db.refresh(current_user)
+    cache.invalidate(f"user:{current_user.user_id}")
+    invalidate_principal(current_user.user_id)
 
     return {"message": "Profil mis à jour"}
 
@@ -164,6 +187,9 @@ def update_preferences(
 
     prefs.last_modification_date = datetime.now(timezone.utc)
 
+    if show_on_map is not None:
+        db.flush()
+        refresh_map_feed_user(db, current_user.user_id)
 
     db.commit()
     db.refresh(prefs)
@@ -173,20 +199,28 @@ def update_preferences(
 
 @router.get("/me/saved-posts")
 def get_my_saved_posts(
+    response: Response,
+    limit: int = pagination.DEFAULT_LIMIT,
+    cursor: str | None = None,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    sql = text("""
+    limit = pagination.clamp_limit(limit)
+    after, after_params = pagination.keyset_filter(cursor, ["s.saved_at", "s.post_id"])
+
+    sql = text(f"""
         SELECT p.post_id, p.post_title, p.post_description, p.publication_date,
-               u.user_id, u.username, u.profile_picture
+               u.user_id, u.username, u.profile_picture, s.saved_at
         FROM saved_posts s
         JOIN posts p ON p.post_id = s.post_id
         JOIN users u ON u.user_id = p.user_id
         WHERE s.user_id = :uid
-        ORDER BY s.saved_at DESC;
+        {after}
+        ORDER BY s.saved_at DESC, s.post_id DESC
+        LIMIT :limit;
     """)
-    res = db.execute(sql, {"uid": current_user.user_id}).mappings().all()
-    return list(res)
+    res = db.execute(sql, {"uid": current_user.user_id, "limit": limit + 1, **after_params}).mappings().all()
+    return pagination.paginate(response, res, limit, ["saved_at", "post_id"])
 
 
 # ============================================================
@@ -195,49 +229,48 @@ def get_my_saved_posts(
 @router.get("/users/{user_id}")
 def get_user_by_id(
     user_id: int, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    user = db.query(models.User).filter(models.User.user_id == user_id).first()
+    # Partie publique du profil (identique pour tous les visiteurs) : en cache,
+    # invalidée par les follow / posts / modifications de profil.
+    profile = cache.get_or_set(
+        f"user:{user_id}:profile",
+        lambda: _load_public_profile(db, user_id),
+        tags=[f"user:{user_id}"],
+    )
 
-    if not user:
+    if not profile:
         raise HTTPException(status_code=404, detail="Utilisateur introuvable")
 
     # Relations
-    is_following = False
-    rel_me_to_him = db.query(models.Follower).filter_by(
-        user_id=user_id,
-        follower_user_id=current_user.user_id,
-        status="ACCEPTED"
-    ).first()
-    if rel_me_to_him:
-        is_following = True
-
-    follows_me = False
-    rel_him_to_me = db.query(models.Follower).filter_by(
-        user_id=current_user.user_id,
-        follower_user_id=user_id,
-        status="ACCEPTED"
-    ).first()
-    if rel_him_to_me:
-        follows_me = True
-
-    # Stats pour l'utilisateur visité
-    followers_count = db.query(models.Follower).filter_by(user_id=user_id, status="ACCEPTED").count()
-    following_count = db.query(models.Follower).filter_by(follower_user_id=user_id, status="ACCEPTED").count()
-    posts_count = db.query(models.Post).filter_by(user_id=user_id).count()
+    relation = get_follow_relations(db, current_user.user_id, [user_id])[user_id]
+
+    return {
+        **profile,
+        **relation,
+    }
+
+
+def _load_public_profile(db: Session, user_id: int):
+    # Profil + compteurs en une seule ligne
+    row = db.execute(text(f"""
+        SELECT u.user_id, u.username, u.bio, u.profile_picture, u.is_private_flag,
+               {_PROFILE_COUNTS}
+        FROM users u
+        LEFT JOIN user_stats us ON us.user_id = u.user_id
+        WHERE u.user_id = :uid
+    """), {"uid": user_id}).mappings().first()
+    if not row:
+        return None
 
     return {
-        "id": user.user_id,
-        "pseudo": user.username,
-        "bio": user.bio,
-        "img": user.profile_picture,
-        "is_private": user.is_private_flag == "Y",
-        "is_following": is_following,
-        "follows_me": follows_me,
-        "followers_count": followers_count,
-        "following_count": following_count,
-        "posts_count": posts_count,
+        "id": row["user_id"],
+        "pseudo": row["username"],
+        "bio": row["bio"],
+        "img": row["profile_picture"],
+        "is_private": row["is_private_flag"] == "Y",
+        **{col: row[col] for col in USER_STAT_COLUMNS},
     }
 
 # ============================================================
@@ -246,7 +279,7 @@ def get_user_by_id(
 @router.get("/search/users")
 def search_users(
     query: str = "",
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(get_current_user),
 ):
     # Récupération des utilisateurs (50 max)
@@ -260,23 +293,15 @@ def search_users(
             models.User.user_id != current_user.user_id
         ).limit(50).all()
 
+    # Relations avec toute la page en une requête
+    relations = get_follow_relations(db, current_user.user_id, [u.user_id for u in users])
+
     results = []
     for u in users:
         status_text = ""
 
-        # 1. Est-ce que JE le suis ?
-        i_follow_him = db.query(models.Follower).filter_by(
-            user_id=u.user_id,                  # Cible = Lui
-            follower_user_id=current_user.user_id, # Follower = Moi
-            status="ACCEPTED"
-        ).first()
-
-        # 2. Est-ce qu'IL me suit ?
-        he_follows_me = db.query(models.Follower).filter_by(
-            user_id=current_user.user_id,       # Cible = Moi
-            follower_user_id=u.user_id,         # Follower = Lui
-            status="ACCEPTED"
-        ).first()
+        i_follow_him = relations[u.user_id]["is_following"]   # Est-ce que JE le suis ?
+        he_follows_me = relations[u.user_id]["follows_me"]    # Est-ce qu'IL me suit ?
 
         # --- LOGIQUE DES STATUTS ---
         if i_follow_him and he_follows_me:
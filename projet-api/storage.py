@@ -0,0 +1,90 @@
+import mimetypes
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+import metrics
+
+# ---- Configuration ----
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cloudinary")  # cloudinary | local
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "./media")
+LOCAL_STORAGE_URL = os.getenv("LOCAL_STORAGE_URL", "/media")
+DELETE_BATCH_SIZE = 100  # limite de l'API admin Cloudinary
+
+
+# ---- Backends ----
+class CloudinaryStorage:
+    """
+    Stockage de prod. La config (cloud_name, api_key...) est faite par les routers.
+    Renvoie directement la réponse de Cloudinary (secure_url, public_id, bytes...).
+    """
+    name = "cloudinary"
+
+    def upload(self, path: str, folder: str, resource_type: str = "auto") -> dict:
+        import cloudinary.uploader
+        with metrics.storage_call(self.name, "upload"):
+            return cloudinary.uploader.upload(
+                path,
+                folder=folder,
+                resource_type=resource_type,
+                unique_filename=True,
+            )
+
+    def delete(self, public_id: str, resource_type: str = "image"):
+        import cloudinary.uploader
+        with metrics.storage_call(self.name, "delete"):
+            cloudinary.uploader.destroy(public_id, resource_type=resource_type)
+
+    def delete_many(self, public_ids: list[str], resource_type: str = "image"):
+        """Suppression groupée (API admin, DELETE_BATCH_SIZE ids max par appel)."""
+        import cloudinary.api
+        with metrics.storage_call(self.name, "delete_many"):
+            cloudinary.api.delete_resources(public_ids, resource_type=resource_type)
+
+
+class LocalStorage:
+    """
+    Copie les fichiers dans un dossier local (dev, tests) et renvoie
+    les mêmes clés que Cloudinary.
+    """
+    name = "local"
+
+    def __init__(self, root: str = LOCAL_STORAGE_DIR, base_url: str = LOCAL_STORAGE_URL):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+
+    def upload(self, path: str, folder: str, resource_type: str = "auto") -> dict:
+        folder = folder.strip("/")
+        name = uuid.uuid4().hex + Path(path).suffix
+        dest = self.root / folder / name
+        with metrics.storage_call(self.name, "upload"):
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(path, dest)
+
+        if resource_type == "auto":
+            mime = mimetypes.guess_type(path)[0] or ""
+            resource_type = "video" if mime.startswith("video/") else "image"
+
+        return {
+            "secure_url": f"{self.base_url}/{folder}/{name}",
+            "public_id": f"{folder}/{name}",
+            "resource_type": resource_type,
+            "bytes": dest.stat().st_size,
+        }
+
+    def delete(self, public_id: str, resource_type: str = "image"):
+        with metrics.storage_call(self.name, "delete"):
+            (self.root / public_id).unlink(missing_ok=True)
+
+    def delete_many(self, public_ids: list[str], resource_type: str = "image"):
+        for public_id in public_ids:
+            self.delete(public_id, resource_type)
+
+
+backend = LocalStorage() if STORAGE_BACKEND == "local" else CloudinaryStorage()
+
+
+def set_backend(new_backend):
+    global backend
+    backend = new_backend